@@ -0,0 +1,172 @@
+"""Runs the complete sensor service against simulated hardware and a local stub of Flux-server.
+
+The Pozyx, the I2C bus of the light sensor and the HTTP connection to Flux-server are simulated with the given
+latency, jitter and error rate. After a warm-up, all readings taken during the measuring time are matched with the
+readings Flux-server received until the end of the drain time. Run from the repository root:
+
+Usage:
+  simulation_benchmark [options]
+  simulation_benchmark -h | --help
+
+Options:
+  -h --help                 Show this screen.
+  --duration=<seconds>      Measuring time [default: 10].
+  --warm-up=<seconds>       Time before the measuring time, e.g. for the login [default: 2].
+  --drain=<seconds>         Time after the measuring time to deliver the last readings [default: 3].
+  --serial-latency=<s>      Latency of one positioning on the Pozyx [default: 0.03].
+  --serial-jitter=<s>       Jitter of the positioning latency [default: 0.005].
+  --serial-errors=<rate>    Fraction of failing positionings [default: 0].
+  --i2c-latency=<s>         Latency of one I2C transaction [default: 0.0005].
+  --i2c-jitter=<s>          Jitter of the I2C latency [default: 0.0001].
+  --i2c-errors=<rate>       Fraction of failing I2C transactions [default: 0].
+  --http-latency=<s>        Latency of one request to Flux-server [default: 0.02].
+  --http-jitter=<s>         Jitter of the HTTP latency [default: 0.01].
+  --http-errors=<rate>      Fraction of requests Flux-server answers with 503 [default: 0].
+  --compression=<encoding>  identity, gzip or deflate [default: identity].
+  --asyncio                 Run on the asyncio runtime (requires flux_sensors[asyncio]).
+  --seed=<n>                Seed of the simulated latencies and errors [default: 1].
+  --verbose                 Log the messages of the sensor service.
+
+Example: python -m benchmarks.simulation_benchmark --http-latency=0.2 --http-errors=0.05
+"""
+from typing import List, Set
+from docopt import docopt
+from flux_sensors.localizer.localizer import Localizer
+from flux_sensors.light_sensor.light_sensor import LightSensor, LightSample
+from flux_sensors.config_loader import ConfigLoader
+from flux_sensors.flux_server import FluxServer
+from flux_sensors.flux_sensor import FluxSensor
+from flux_sensors.models import models
+from tests.mock.latency_model import LatencyModel
+from tests.mock.mock_pozyx import MockPozyx
+from tests.mock.mock_i2c_bus import MockI2CBus
+from tests.mock.stub_flux_server import StubFluxServer
+import tempfile
+import threading
+import datetime
+import logging
+import time
+import os
+
+LIGHT_SENSOR_I2C_ADDRESS = 0x39
+LIGHT_SENSOR_REGISTER = {0x80: 0, 0x81: 0, 0x83: 0, 0x8D: 0, 0x90: 0, 0x92: 0, 0x93: 0x10, 0x94: 255, 0x95: 73,
+                         0x96: 123, 0x97: 0, 0x98: 128, 0x99: 64, 0x9A: 147, 0x9B: 0}
+TEST_POSITION = models.Position(1000, 2000, 3000)
+STOP_TIME = 2  # Seconds to wait for the measurement to stop before the stub server is stopped
+CONFIG_FILE_CONTENT = """[Flux Server URLs]
+STUB={server_url}
+
+[Flux Server Connection Settings]
+timeout=5
+compression={compression}
+
+[Flux Sensor Spool]
+directory={spool_directory}
+"""
+
+
+class RecordingLightSensor(LightSensor):
+    """Light sensor which records the time stamps of all fresh samples, i.e. of all readings taken"""
+
+    def __init__(self, device_address: int, device: MockI2CBus) -> None:
+        super().__init__(device_address, device)
+        self.time_stamps = []  # type: List[float]
+
+    def sample(self, wait: bool = True) -> LightSample:
+        light_sample = super().sample(wait)
+        if light_sample.is_fresh:
+            self.time_stamps.append(light_sample.get_time_stamp())
+        return light_sample
+
+
+def parse_iso_timestamp(timestamp: str) -> float:
+    """Parses the local ISO 8601 timestamp of a reading into seconds since the epoch."""
+    time_format = "%Y-%m-%dT%H:%M:%S.%f" if "." in timestamp else "%Y-%m-%dT%H:%M:%S"
+    return datetime.datetime.strptime(timestamp, time_format).timestamp()
+
+
+def get_percentile(sorted_values: List[float], percentile: float) -> float:
+    if len(sorted_values) == 0:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))]
+
+
+def create_flux_sensor(arguments: dict, config_loader: ConfigLoader, localizer: Localizer,
+                       light_sensor: LightSensor) -> FluxSensor:
+    if arguments["--asyncio"]:
+        from flux_sensors import async_runtime
+        flux_server = async_runtime.AsyncFluxServer(config_loader.get_credentials(),
+                                                    config_loader.get_max_in_flight_uploads(),
+                                                    config_loader.get_connection_pool_size(),
+                                                    config_loader.get_max_retries())
+        return async_runtime.AsyncFluxSensor(localizer, light_sensor, config_loader, flux_server)
+    flux_server = FluxServer(config_loader.get_credentials(), config_loader.get_max_in_flight_uploads(),
+                             config_loader.get_connection_pool_size(), config_loader.get_max_retries())
+    return FluxSensor(localizer, light_sensor, config_loader, flux_server)
+
+
+def run_simulation(arguments: dict, directory: str) -> None:
+    seed = int(arguments["--seed"])
+    serial_model = LatencyModel(float(arguments["--serial-latency"]), float(arguments["--serial-jitter"]),
+                                float(arguments["--serial-errors"]), seed)
+    i2c_model = LatencyModel(float(arguments["--i2c-latency"]), float(arguments["--i2c-jitter"]),
+                             float(arguments["--i2c-errors"]), seed + 1)
+    http_model = LatencyModel(float(arguments["--http-latency"]), float(arguments["--http-jitter"]),
+                              float(arguments["--http-errors"]), seed + 2)
+    stub_server = StubFluxServer(latency_model=http_model)
+    stub_server.start()
+
+    config_file_path = os.path.join(directory, "flux-config.ini")
+    with open(config_file_path, "w") as config_file:
+        config_file.write(CONFIG_FILE_CONTENT.format(server_url=stub_server.get_url(),
+                                                     compression=arguments["--compression"],
+                                                     spool_directory=os.path.join(directory, "spool")))
+    config_loader = ConfigLoader(config_file_path)
+    localizer = Localizer(MockPozyx(TEST_POSITION, latency_model=serial_model))
+    light_sensor = RecordingLightSensor(LIGHT_SENSOR_I2C_ADDRESS, MockI2CBus(
+        {LIGHT_SENSOR_I2C_ADDRESS: dict(LIGHT_SENSOR_REGISTER)}, latency_model=i2c_model))
+    flux_sensor = create_flux_sensor(arguments, config_loader, localizer, light_sensor)
+    threading.Thread(target=flux_sensor.start_when_ready, name="flux-sensor", daemon=True).start()
+
+    # The samples are time stamped with time.monotonic(), the readings with the wall clock time derived from it.
+    start_time = time.monotonic() + float(arguments["--warm-up"])
+    end_time = start_time + float(arguments["--duration"])
+    wall_clock_start_time = models.to_wall_clock_time(start_time)
+    wall_clock_end_time = models.to_wall_clock_time(end_time)
+    time.sleep(end_time + float(arguments["--drain"]) - time.monotonic())
+    stub_server.set_active_measurement(None)  # Stops the measurement with the next upload.
+    time.sleep(STOP_TIME)
+    stub_server.stop()
+
+    taken = [time_stamp for time_stamp in list(light_sensor.time_stamps) if start_time <= time_stamp < end_time]
+    received = set()  # type: Set[str]
+    latencies = []  # type: List[float]
+    for reading, receive_time in zip(list(stub_server.readings), list(stub_server.reading_receive_times)):
+        time_stamp = parse_iso_timestamp(reading["timestamp"])
+        if wall_clock_start_time <= time_stamp < wall_clock_end_time and reading["timestamp"] not in received:
+            received.add(reading["timestamp"])
+            latencies.append(receive_time - time_stamp)
+    latencies.sort()
+
+    print("runtime                    {}".format("asyncio" if arguments["--asyncio"] else "threads"))
+    print("readings taken             {}".format(len(taken)))
+    print("readings received          {}".format(len(received)))
+    print("throughput                 {:.1f} readings/s".format(len(received) / float(arguments["--duration"])))
+    print("loss                       {:.2f} %".format(100 * (1 - len(received) / max(len(taken), 1))))
+    print("latency p50 / p90 / p99    {:.0f} / {:.0f} / {:.0f} ms".format(
+        *(1000 * get_percentile(latencies, percentile) for percentile in (50, 90, 99))))
+    print("latency max                {:.0f} ms".format(1000 * get_percentile(latencies, 100)))
+    print("requests                   {} ({} failed)".format(http_model.call_count, http_model.error_count))
+    print("positionings               {} ({} failed)".format(serial_model.call_count, serial_model.error_count))
+    print("I2C transactions           {} ({} failed)".format(i2c_model.call_count, i2c_model.error_count))
+
+
+def main() -> None:
+    arguments = docopt(__doc__)
+    logging.basicConfig(level=logging.INFO if arguments["--verbose"] else logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directory:
+        run_simulation(arguments, directory)
+
+
+if __name__ == "__main__":
+    main()
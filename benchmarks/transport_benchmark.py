@@ -0,0 +1,62 @@
+"""Compares the HTTP transport of FluxServer with one connection per request against the pooled keep-alive session.
+
+Run from the repository root: python -m benchmarks.transport_benchmark [number of requests]
+"""
+from typing import Callable
+from flux_sensors.flux_server import FluxServer, CHECK_ACTIVE_MEASUREMENT_ROUTE, LOGIN_ROUTE
+from tests.mock.stub_flux_server import StubFluxServer, STUB_AUTH_TOKEN
+import sys
+import time
+import json
+import requests
+
+DEFAULT_NUMBER_OF_REQUESTS = 300
+CREDENTIALS = {"username": "user", "password": "secret"}
+READINGS = json.dumps([{"luxValue": 123.0, "xposition": 1000.0, "yposition": 2000.0, "zposition": 3000.0,
+                        "timestamp": "2018-05-11T10:00:00.000000"}] * 10).encode()
+
+
+def unpooled_requests(server_url: str, number_of_requests: int) -> None:
+    """The transport before: a new connection for every poll, login and upload"""
+    headers = {FluxServer.AUTHORIZATION_HEADER: STUB_AUTH_TOKEN, FluxServer.CONTENT_TYPE_HEADER: "application/json"}
+    for i in range(0, number_of_requests // 3):
+        requests.get(server_url + CHECK_ACTIVE_MEASUREMENT_ROUTE, headers=headers)
+        requests.post(server_url + LOGIN_ROUTE, data=json.dumps(CREDENTIALS), headers=headers)
+        requests.post(server_url + "/measurements/active/readings", data=READINGS, headers=headers)
+
+
+def pooled_requests(server_url: str, number_of_requests: int) -> None:
+    """The transport after: polling, login and uploads share the keep-alive session of FluxServer"""
+    flux_server = FluxServer(CREDENTIALS)
+    flux_server.poll_server_urls([server_url])
+    for i in range(0, number_of_requests // 3):
+        flux_server.get_active_measurement()
+        flux_server.login_at_server()
+        flux_server.send_data_to_server(READINGS)
+        while flux_server.get_number_of_pending_uploads() > 0:
+            flux_server.wait_for_uploads()
+
+
+def run_benchmark(name: str, client: Callable[[str, int], None], number_of_requests: int) -> None:
+    stub_server = StubFluxServer()
+    stub_server.start()
+    try:
+        start_time = time.perf_counter()
+        client(stub_server.get_url(), number_of_requests)
+        duration = time.perf_counter() - start_time
+        print("{: <10} {: >8} requests {: >8} connections {: >10.1f} requests/s".format(
+            name, stub_server.request_count, stub_server.connection_count, stub_server.request_count / duration))
+    finally:
+        stub_server.stop()
+
+
+def main() -> None:
+    number_of_requests = DEFAULT_NUMBER_OF_REQUESTS
+    if len(sys.argv) > 1:
+        number_of_requests = int(sys.argv[1])
+    run_benchmark("unpooled", unpooled_requests, number_of_requests)
+    run_benchmark("pooled", pooled_requests, number_of_requests)
+
+
+if __name__ == "__main__":
+    main()
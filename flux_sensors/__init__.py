@@ -1,2 +1 @@
-from . import light_sensor, localizer, models
-from . import __main__
+from . import models
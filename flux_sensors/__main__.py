@@ -1,10 +1,30 @@
+"""Flux-sensors
+
+Usage:
+  flux [--asyncio] [--verbose | --quiet]
+  flux -h | --help
+
+Options:
+  -h --help     Show this screen.
+  --asyncio     Run on the asyncio runtime (requires flux_sensors[asyncio]).
+  --verbose     Log debug messages.
+  --quiet       Log warnings and errors only.
+"""
 import sys
+import os
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from docopt import docopt
 from flux_sensors.localizer.localizer import Localizer
+from flux_sensors.localizer.tag_scheduler import Tag
 from flux_sensors.light_sensor.light_sensor import LightSensor
-from flux_sensors.flux_sensor import FluxSensor
+from flux_sensors.light_sensor.light_sensor_array import LightSensorArray, I2CMultiplexer, MultiplexedBus
+from flux_sensors.models import models
 from flux_sensors.config_loader import ConfigLoader
-from flux_sensors.flux_server import FluxServer
+from flux_sensors.metrics import Metrics
+from flux_sensors.profiler import SamplingProfiler
+from pypozyx import PozyxConstants
 
 AMS_LIGHT_SENSOR_I2C_ADDRESS = 0x39
 
@@ -26,21 +46,182 @@ def setup_logging(verbose=False, quiet=False):
     logger.addHandler(handler)
 
 
+def get_process_start_time() -> float:
+    """Returns the start of the process on the monotonic clock, or the current time if it is unknown."""
+    try:
+        with open("/proc/self/stat") as stat_file:
+            start_ticks = int(stat_file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return time.monotonic() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+def create_flux_server(config_loader: ConfigLoader, metrics: Metrics, use_asyncio: bool):
+    """Imports the HTTP client and creates the Flux-server client. For the threaded runtime, the server is probed.
+
+    The imports of the HTTP libraries and the probe take most of the startup time, so this runs on a thread of its
+    own while the devices are opened. The probe selects the server and opens a connection to it, so the first poll
+    of the FluxSensor is answered in one round-trip.
+    """
+    if use_asyncio:
+        from flux_sensors import async_runtime
+        return async_runtime.AsyncFluxServer(config_loader.get_credentials(),
+                                             config_loader.get_max_in_flight_uploads(),
+                                             config_loader.get_connection_pool_size(),
+                                             config_loader.get_max_retries(), metrics,
+                                             config_loader.get_token_lifetime())
+    from flux_sensors.flux_server import FluxServer
+    flux_server = FluxServer(config_loader.get_credentials(), config_loader.get_max_in_flight_uploads(),
+                             config_loader.get_connection_pool_size(), config_loader.get_max_retries(), metrics,
+                             config_loader.get_token_lifetime())
+    flux_server.poll_server_urls(config_loader.get_server_urls(), config_loader.get_timeout())
+    return flux_server
+
+
+def create_localizer(config_loader: ConfigLoader, localizer_class, pozyx, remote_id: int = None) -> Localizer:
+    if localizer_class is not Localizer:
+        return localizer_class(pozyx, remote_id=remote_id)
+    device_position_filter = PozyxConstants.FILTER_TYPE_MOVINGMEDIAN
+    if config_loader.get_position_filter() != "device":
+        device_position_filter = PozyxConstants.FILTER_TYPE_NONE
+    return Localizer(pozyx, position_filter=device_position_filter, remote_id=remote_id)
+
+
+class I2CDevices(object):
+    """Opens every I2C bus and multiplexer once, so all light sensors on it share them"""
+
+    def __init__(self, multiplexer_address: int) -> None:
+        self._multiplexer_address = multiplexer_address
+        self._buses = {}
+        self._multiplexers = {}
+
+    def get_bus(self, i2c_bus: int):
+        if i2c_bus not in self._buses:
+            self._buses[i2c_bus] = LightSensor.get_device(i2c_bus)
+        return self._buses[i2c_bus]
+
+    def get_multiplexed_bus(self, i2c_bus: int, channel: int) -> MultiplexedBus:
+        if i2c_bus not in self._multiplexers:
+            self._multiplexers[i2c_bus] = I2CMultiplexer(self.get_bus(i2c_bus), self._multiplexer_address)
+        return MultiplexedBus(self._multiplexers[i2c_bus], self.get_bus(i2c_bus), channel)
+
+
+def create_light_sensor(config_loader: ConfigLoader, i2c_devices: I2CDevices, i2c_bus: int, remote_id: int = None):
+    """Returns the light sensor array configured for the tag or the single light sensor on the I2C bus."""
+    array_light_sensors = [light_sensor for light_sensor in config_loader.get_light_sensor_array()
+                           if light_sensor[0] == remote_id]
+    if len(array_light_sensors) == 0:
+        return LightSensor(AMS_LIGHT_SENSOR_I2C_ADDRESS, i2c_devices.get_bus(i2c_bus))
+
+    light_sensor_array = LightSensorArray()
+    for tag_remote_id, array_i2c_bus, multiplexer_channel, offset in array_light_sensors:
+        device = i2c_devices.get_bus(array_i2c_bus)
+        if multiplexer_channel is not None:
+            device = i2c_devices.get_multiplexed_bus(array_i2c_bus, multiplexer_channel)
+        light_sensor_array.add_light_sensor(array_i2c_bus, LightSensor(AMS_LIGHT_SENSOR_I2C_ADDRESS, device),
+                                            models.Position(*offset))
+    logger.info("Light sensor array with {} light sensors".format(light_sensor_array.get_number_of_light_sensors()))
+    return light_sensor_array
+
+
 def main() -> None:
     """entry point"""
-    setup_logging(verbose=False)
+    start_time = get_process_start_time()
+    metrics = Metrics(start_time)
+    arguments = docopt(__doc__)
+    setup_logging(verbose=arguments["--verbose"], quiet=arguments["--quiet"])
 
-    pozyx = Localizer.get_device()
-    pozyx_localizer = Localizer(pozyx)
+    config_loader = ConfigLoader()
 
-    ams_device = LightSensor.get_device(1)
-    ams_light_sensor = LightSensor(AMS_LIGHT_SENSOR_I2C_ADDRESS, ams_device)
+    # The Flux-server client and the Pozyx are brought up on threads while the I2C buses are opened.
+    startup_executor = ThreadPoolExecutor(max_workers=2)
+    flux_server_future = startup_executor.submit(create_flux_server, config_loader, metrics, arguments["--asyncio"])
+    pozyx_future = startup_executor.submit(Localizer.get_device)
+    startup_executor.shutdown(wait=False)
 
-    config_loader = ConfigLoader()
+    if config_loader.get_metrics_port() > 0:
+        try:
+            from flux_sensors.metrics_server import MetricsServer
+            MetricsServer(metrics, config_loader.get_metrics_port(), config_loader.get_metrics_address()).start()
+        except OSError as err:
+            logger.error("Error while starting the metrics endpoint. Metrics are not served.")
+            logger.error(err)
+
+    if config_loader.get_profile_directory() != "":
+        try:
+            profiler = SamplingProfiler(config_loader.get_profile_directory(), config_loader.get_profile_duration(),
+                                        config_loader.get_profile_sampling_interval())
+        except ValueError as err:
+            logger.error("Error: config file has wrong profiler settings. Profiling is disabled.")
+            logger.error(err)
+        else:
+            if profiler.install_signal_handler():
+                logger.info("Send SIGUSR1 to profile the running service: kill -USR1 {}".format(os.getpid()))
+
+    position_filter_class = None
+    if config_loader.get_position_filter() == "host":
+        try:
+            from flux_sensors.localizer.position_filter import PositionFilter
+        except ImportError as err:
+            logger.error("Filtering positions on the host requires numpy: pip3 install flux_sensors[multilateration]")
+            logger.error(err)
+            sys.exit(1)
+        position_filter_class = PositionFilter
+
+    localizer_class = Localizer
+    if config_loader.get_positioning() == "host":
+        try:
+            from flux_sensors.localizer.host_localizer import HostLocalizer
+        except ImportError as err:
+            logger.error("Positioning on the host requires numpy: pip3 install flux_sensors[multilateration]")
+            logger.error(err)
+            sys.exit(1)
+        localizer_class = HostLocalizer
+
+    i2c_devices = I2CDevices(config_loader.get_multiplexer_address())
+    pozyx_localizer = None
+    ams_light_sensor = None
+    position_filter = None
+    tags = None
+    if len(config_loader.get_tags()) == 0:
+        ams_light_sensor = create_light_sensor(config_loader, i2c_devices, 1)
+        pozyx_localizer = create_localizer(config_loader, localizer_class, pozyx_future.result())
+        if position_filter_class is not None:
+            position_filter = position_filter_class()
+    else:
+        light_sensors = [create_light_sensor(config_loader, i2c_devices, i2c_bus, remote_id)
+                         for remote_id, i2c_bus, weight in config_loader.get_tags()]
+        pozyx = pozyx_future.result()
+        tags = []
+        for (remote_id, i2c_bus, weight), light_sensor in zip(config_loader.get_tags(), light_sensors):
+            tag_localizer = create_localizer(config_loader, localizer_class, pozyx, remote_id)
+            tag_position_filter = None
+            if position_filter_class is not None:
+                tag_position_filter = position_filter_class()
+            tags.append(Tag(tag_localizer.get_network_id(), tag_localizer, light_sensor, weight,
+                            tag_position_filter))
+        logger.info("Measure with {} tags: {}".format(len(tags), ", ".join(tag.get_name() for tag in tags)))
 
-    flux_server = FluxServer(config_loader.get_credentials())
+    if arguments["--asyncio"]:
+        try:
+            async_flux_server = flux_server_future.result()
+        except ImportError as err:
+            logger.error("The asyncio runtime requires aiohttp: pip3 install flux_sensors[asyncio]")
+            logger.error(err)
+            sys.exit(1)
+        from flux_sensors import async_runtime
+        async_flux_sensor = async_runtime.AsyncFluxSensor(pozyx_localizer, ams_light_sensor, config_loader,
+                                                          async_flux_server, position_filter, tags, metrics)
+        logger.info("Started in {:.1f}s".format(time.monotonic() - start_time))
+        async_flux_sensor.start_when_ready()
+        return
 
-    flux_sensor = FluxSensor(pozyx_localizer, ams_light_sensor, config_loader, flux_server)
+    from flux_sensors.flux_sensor import FluxSensor
+    flux_sensor = FluxSensor(pozyx_localizer, ams_light_sensor, config_loader, flux_server_future.result(),
+                             position_filter, tags, metrics)
+    logger.info("Started in {:.1f}s".format(time.monotonic() - start_time))
     flux_sensor.start_when_ready()
 
 
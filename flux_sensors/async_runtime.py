@@ -0,0 +1,656 @@
+"""asyncio runtime of the sensor service.
+
+The Flux-server is accessed with aiohttp and the blocking serial and I2C calls run on one executor thread per device.
+Timeouts and the shutdown of a measurement are done with asyncio primitives, so a stopped measurement cancels all
+of its tasks at once. Everything which does not wait, the tokens, readings and batches, is shared with the threaded
+runtime. The aiohttp dependency is optional: pip3 install flux_sensors[asyncio]
+"""
+from typing import Dict, List, Optional, Set, Tuple
+from flux_sensors.localizer.localizer import Localizer, PozyxDeviceError
+from flux_sensors.localizer.position_history import PositionHistory
+from flux_sensors.localizer.tag_scheduler import Tag, TagScheduler
+from flux_sensors.light_sensor.light_sensor import LightSensor
+from flux_sensors.light_sensor.light_sensor_array import get_light_values
+from flux_sensors.config_loader import (ConfigLoader, DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS,
+                                        DEFAULT_FLUX_SERVER_CONNECTION_POOL_SIZE, DEFAULT_FLUX_SERVER_MAX_RETRIES,
+                                        DEFAULT_FLUX_SERVER_TOKEN_LIFETIME, DEFAULT_SPOOL_REPLAY_RATE)
+from flux_sensors.flux_server import (FluxServer, AuthorizationError, CHECK_SERVER_READY_ROUTE,
+                                      CHECK_ACTIVE_MEASUREMENT_ROUTE, ADD_READINGS_ROUTE, LOGIN_ROUTE, POLLING_STEP,
+                                      MEASUREMENT_EVENTS_ROUTE, EVENT_STREAM_CONTENT_TYPE, EVENT_STREAM_READ_TIMEOUT,
+                                      LAST_GOOD_SERVER_URL_HEAD_START, TokenRefreshSchedule, get_polling_delay,
+                                      get_retry_backoff, check_authorized)
+from flux_sensors.flux_sensor import FluxSensor, InitializationError
+from flux_sensors.measurement_pipeline import BatchAssembler, Payload, create_readings
+from flux_sensors.batch_policy import BatchPolicy
+from flux_sensors.metrics import Metrics
+from flux_sensors.reading_spool import ReadingSpool
+from flux_sensors.models import models
+from flux_sensors import reading_encoder
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import aiohttp
+import time
+import json
+import logging
+
+RETRY_DELAY = 3
+POSITION_WAIT_TIMEOUT = 1
+READING_QUEUE_POLL_INTERVAL = 0.1
+UPLOAD_SLOT_POLL_INTERVAL = 0.02
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncFluxServer(object):
+    """Client of the Flux-server based on aiohttp"""
+
+    def __init__(self, credentials: Dict[str, str],
+                 max_in_flight_uploads: int = DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS,
+                 connection_pool_size: int = DEFAULT_FLUX_SERVER_CONNECTION_POOL_SIZE,
+                 max_retries: int = DEFAULT_FLUX_SERVER_MAX_RETRIES, metrics: Metrics = None,
+                 token_lifetime: float = DEFAULT_FLUX_SERVER_TOKEN_LIFETIME) -> None:
+        if max_in_flight_uploads < 1:
+            raise ValueError("Argument max_in_flight_uploads must be at least 1.")
+        self._token_refresh_schedule = TokenRefreshSchedule(token_lifetime)
+        self._max_retries = max_retries
+        self._metrics = metrics
+        if metrics is None:
+            self._metrics = Metrics()
+        self._credentials = credentials
+        self._max_in_flight_uploads = max_in_flight_uploads
+        self._connection_pool_size = max(connection_pool_size, max_in_flight_uploads)
+        self._session = None  # type: Optional[aiohttp.ClientSession]
+        self._server_url = ""
+        self._last_good_server_url = ""
+        self._auth_token = ""
+        self._token_refresh_handle = None  # type: Optional[asyncio.TimerHandle]
+        self._token_refresh_task = None  # type: Optional[asyncio.Future]
+        self._login_lock = None  # type: Optional[asyncio.Lock]
+        self._server_urls_without_events = set()  # type: Set[str]
+
+    async def open(self) -> None:
+        """Creates the HTTP session. Must be called from within the event loop."""
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self._connection_pool_size))
+            self._login_lock = asyncio.Lock()
+
+    async def close(self) -> None:
+        self.cancel_token_refresh()
+        if self._token_refresh_task is not None:
+            self._token_refresh_task.cancel()
+            self._token_refresh_task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def get_max_in_flight_uploads(self) -> int:
+        return self._max_in_flight_uploads
+
+    def get_server_url(self) -> str:
+        return self._server_url
+
+    def get_auth_token(self) -> str:
+        return self._auth_token
+
+    def _get_headers(self) -> Dict[str, str]:
+        return FluxServer.create_headers(self._auth_token)
+
+    async def _request(self, method: str, url: str, **kwargs) -> aiohttp.ClientResponse:
+        """Sends a request with the retry policy of FluxServer.create_http_session.
+
+        Failed connections are retried for all requests, as nothing was sent yet, other connection errors only for
+        the idempotent GET requests.
+        """
+        retry = 0
+        while True:
+            try:
+                return await self._session.request(method, url, **kwargs)
+            except aiohttp.ClientConnectionError as err:
+                is_retried = method == "GET" or isinstance(err, aiohttp.ClientConnectorError)
+                if retry >= self._max_retries or not is_retried:
+                    raise
+                logger.debug("Request to {} failed, retry {}: {}".format(url, retry + 1, str(err)))
+            await asyncio.sleep(get_retry_backoff(retry))
+            retry += 1
+
+    async def poll_server_urls(self, server_urls: List[str], timeout: Optional[int] = 3) -> bool:
+        """Probes all server URLs concurrently and selects the first one that responds.
+
+        As in FluxServer.poll_server_urls, the URL which responded last time is probed alone first.
+        """
+        if len(server_urls) == 0:
+            return False
+        loop = asyncio.get_event_loop()
+        deadline = float("inf")
+        if timeout is not None:
+            deadline = loop.time() + timeout
+
+        if self._last_good_server_url in server_urls:
+            head_start_deadline = min(deadline, loop.time() + LAST_GOOD_SERVER_URL_HEAD_START)
+            if await self._probe_server_url(self._last_good_server_url, head_start_deadline):
+                self._server_url = self._last_good_server_url
+                return True
+
+        probes = {}  # type: Dict[asyncio.Future, str]
+        for server_url in server_urls:
+            probes[asyncio.ensure_future(self._probe_server_url(server_url, deadline))] = server_url
+        pending = set(probes.keys())
+        try:
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for probe in done:
+                    if probe.result():
+                        self._server_url = probes[probe]
+                        self._last_good_server_url = self._server_url
+                        logger.info("Selected Flux-server at {}".format(self._server_url))
+                        return True
+        finally:
+            await _cancel_tasks(pending)
+        logger.error("Polling timeout ({}s) exceeded.".format(timeout))
+        return False
+
+    async def _probe_server_url(self, server_url: str, deadline: float) -> bool:
+        logger.info("Polling Flux-server at {}".format(server_url + CHECK_SERVER_READY_ROUTE))
+        loop = asyncio.get_event_loop()
+        while loop.time() < deadline:
+            request_timeout = None  # type: Optional[float]
+            if deadline != float("inf"):
+                request_timeout = deadline - loop.time()
+            try:
+                status_code = await asyncio.wait_for(
+                    self._get_status(server_url + CHECK_SERVER_READY_ROUTE), request_timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                logger.debug("Polling Flux-server at {} failed: {}".format(server_url, str(err)))
+            else:
+                if status_code == 200:
+                    return True
+                FluxServer.log_server_status(status_code)
+            await asyncio.sleep(max(0.0, min(POLLING_STEP, deadline - loop.time())))
+        return False
+
+    async def _get_status(self, url: str) -> int:
+        async with await self._request("GET", url, headers=self._get_headers()) as response:
+            await response.read()
+            return response.status
+
+    async def poll_active_measurement(self) -> bool:
+        """Waits until a measurement is active. Returns False when the server cannot be reached or the login failed.
+
+        As in FluxServer.poll_active_measurement, the measurement events are subscribed to before the active
+        measurement is checked. Without events, the active measurement is polled with exponential backoff and jitter.
+        """
+        logger.info("Waiting for an active measurement at {}".format(self._server_url + CHECK_ACTIVE_MEASUREMENT_ROUTE))
+        attempt = 0
+        event_received = False
+        try:
+            while True:
+                event_stream = None
+                if not event_received:
+                    event_stream = await self._open_measurement_events()
+                event_received = False
+                try:
+                    status_code = await self._get_status(self._server_url + CHECK_ACTIVE_MEASUREMENT_ROUTE)
+                    FluxServer.log_server_status(status_code)
+                    if status_code == 200:
+                        return True
+                    elif status_code == 401:
+                        await self.login_at_server()
+                        continue
+                    if event_stream is not None:
+                        event_received = await self._wait_for_measurement_event(event_stream)
+                        if event_received:
+                            attempt = 0  # Only a real event resets the backoff, a failing stream keeps it.
+                            continue
+                finally:
+                    if event_stream is not None:
+                        event_stream.close()
+                delay = get_polling_delay(attempt)
+                attempt += 1
+                logger.info("Polling Flux-server again in {:.1f}s".format(delay))
+                await asyncio.sleep(delay)
+        except aiohttp.ClientError as err:
+            logger.error("Error: ClientError {}".format(str(err)))
+            return False
+        except AuthorizationError as error:
+            logger.error(error)
+            return False
+
+    async def _open_measurement_events(self) -> Optional[aiohttp.ClientResponse]:
+        """Subscribes to the measurement events. Returns None if the server does not provide them."""
+        if self._server_url in self._server_urls_without_events:
+            return None
+        response = await self._request_measurement_events()
+        if response.status == 401:
+            response.close()
+            await self.login_at_server()
+            response = await self._request_measurement_events()
+        if response.status == 200 and response.content_type == EVENT_STREAM_CONTENT_TYPE:
+            return response
+        response.close()
+        logger.info("Flux-server does not send measurement events ({}). Poll instead.".format(response.status))
+        self._server_urls_without_events.add(self._server_url)
+        return None
+
+    async def _request_measurement_events(self) -> aiohttp.ClientResponse:
+        headers = self._get_headers()
+        headers[FluxServer.ACCEPT_HEADER] = EVENT_STREAM_CONTENT_TYPE
+        return await self._request("GET", self._server_url + MEASUREMENT_EVENTS_ROUTE, headers=headers,
+                                   timeout=aiohttp.ClientTimeout(total=None, sock_read=EVENT_STREAM_READ_TIMEOUT))
+
+    @staticmethod
+    async def _wait_for_measurement_event(event_stream: aiohttp.ClientResponse) -> bool:
+        """Waits until the server sends an event, closes the stream or stays silent for too long.
+
+        Returns True if an event was received.
+        """
+        try:
+            while True:
+                line = await event_stream.content.readline()
+                if line == b"":
+                    return False
+                elif line.startswith(b"data:"):
+                    logger.info("Measurement event received")
+                    return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            logger.debug("Measurement events interrupted: {}".format(str(err)))
+        return False
+
+    async def get_active_measurement(self) -> str:
+        status_code, measurement = await self._get_active_measurement()
+        if status_code == 401:
+            await self.login_at_server()
+            status_code, measurement = await self._get_active_measurement()
+        check_authorized(status_code, self._server_url)
+        FluxServer.log_server_status(status_code)
+        return measurement
+
+    async def _get_active_measurement(self) -> Tuple[int, str]:
+        url = self._server_url + CHECK_ACTIVE_MEASUREMENT_ROUTE
+        async with await self._request("GET", url, headers=self._get_headers()) as response:
+            return response.status, await response.text()
+
+    async def login_at_server(self) -> None:
+        if self._server_url == "":
+            return
+        login_route = self._server_url + LOGIN_ROUTE
+        headers = {FluxServer.CONTENT_TYPE_HEADER: 'application/json'}
+        start_time = time.monotonic()
+        async with await self._request("POST", login_route, data=json.dumps(self._credentials),
+                                       headers=headers) as response:
+            token = await response.text()
+            self._metrics.login_seconds.observe(time.monotonic() - start_time)
+            if response.status == 401:
+                raise AuthorizationError(
+                    "Login Flux-server at {} failed. Wrong password or username configured.".format(login_route))
+        self._auth_token = token
+        refresh_delay = self._token_refresh_schedule.get_refresh_delay(token, start_time)
+        if refresh_delay is None:
+            self.cancel_token_refresh()
+        else:
+            self._schedule_token_refresh(refresh_delay)
+        logger.info("Login Flux-server at {} successful".format(login_route))
+
+    def cancel_token_refresh(self) -> None:
+        if self._token_refresh_handle is not None:
+            self._token_refresh_handle.cancel()
+            self._token_refresh_handle = None
+
+    def _schedule_token_refresh(self, delay: float) -> None:
+        """Refreshes the token in a task of its own after the delay, as FluxServer does on a timer thread."""
+        self.cancel_token_refresh()
+        self._token_refresh_handle = asyncio.get_event_loop().call_later(delay, self._start_token_refresh,
+                                                                         self._auth_token)
+
+    def _start_token_refresh(self, auth_token: str) -> None:
+        self._token_refresh_handle = None
+        self._token_refresh_task = asyncio.ensure_future(self._refresh_token(auth_token))
+
+    async def _refresh_token(self, auth_token: str) -> None:
+        try:
+            async with self._login_lock:
+                if auth_token != self._auth_token:
+                    return  # Already renewed after a 401
+                logger.debug("Refreshing the login token")
+                await self.login_at_server()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            logger.warning("Refreshing the login token failed: {}".format(str(err)))
+            retry_delay = self._token_refresh_schedule.get_retry_delay()
+            if retry_delay is not None:
+                self._schedule_token_refresh(retry_delay)
+        except AuthorizationError as error:
+            logger.error(error)
+
+    async def login_for_upload(self, auth_token: str) -> None:
+        """Logs in again after an upload sent with the auth token was rejected, unless a newer token is in use."""
+        async with self._login_lock:
+            if auth_token == self._auth_token:
+                await self.login_at_server()
+
+    async def send_data_to_server(self, data: bytes,
+                                  content_encoding: str = reading_encoder.CONTENT_ENCODING_IDENTITY) -> int:
+        """Posts a batch of readings encoded by the ReadingEncoder and returns the HTTP status."""
+        headers = FluxServer.create_upload_headers(self._auth_token, content_encoding)
+        logger.debug("Sending batch ({} bytes, {})".format(len(data), content_encoding))
+        start_time = time.monotonic()
+        async with await self._request("POST", self._server_url + ADD_READINGS_ROUTE, data=data,
+                                       headers=headers) as response:
+            await response.read()
+            self._metrics.upload_seconds.observe(time.monotonic() - start_time)
+            FluxServer.log_server_status(response.status)
+            return response.status
+
+
+async def _cancel_tasks(tasks) -> None:
+    for task in tasks:
+        task.cancel()
+    if len(tasks) > 0:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class AsyncMeasurement(object):
+    """One measurement run on the event loop, the asyncio counterpart of the MeasurementPipeline
+
+    The light sensor executor needs one worker per tag to sample all light sensors in parallel.
+    """
+
+    def __init__(self, localizer: Localizer, light_sensor: LightSensor, flux_server: AsyncFluxServer,
+                 positioning_executor: ThreadPoolExecutor, light_sensor_executor: ThreadPoolExecutor, timeout: int,
+                 batch_policy: BatchPolicy, encoder: reading_encoder.ReadingEncoder,
+                 spool: Optional[ReadingSpool] = None, replay_rate: float = DEFAULT_SPOOL_REPLAY_RATE,
+                 position_filter=None, max_position_uncertainty: float = 0,
+                 tag_scheduler: TagScheduler = None, metrics: Metrics = None) -> None:
+        self._tag_scheduler = tag_scheduler
+        if tag_scheduler is None:
+            self._tag_scheduler = TagScheduler([Tag(models.NO_TAG_ID, localizer, light_sensor,
+                                                    position_filter=position_filter)])
+        self._flux_server = flux_server
+        self._positioning_executor = positioning_executor
+        self._light_sensor_executor = light_sensor_executor
+        self._timeout = timeout
+        self._spool = spool
+        self._max_position_uncertainty = max_position_uncertainty
+        self._metrics = metrics
+        if metrics is None:
+            self._metrics = Metrics()
+        self._batch_assembler = BatchAssembler(batch_policy, encoder, spool, replay_rate, self._metrics)
+        self._position_event = None  # type: Optional[asyncio.Event]
+        self._stop_event = None  # type: Optional[asyncio.Event]
+        self._reading_queue = None  # type: Optional[asyncio.Queue]
+        self._upload_slots = None  # type: Optional[asyncio.Semaphore]
+        self._uploads = set()  # type: set
+        self._deadline = 0.0
+
+    async def run(self) -> None:
+        """Runs the measurement until it is stopped and cancels all of its tasks."""
+        loop = asyncio.get_event_loop()
+        self._position_event = asyncio.Event()
+        self._stop_event = asyncio.Event()
+        self._reading_queue = asyncio.Queue()
+        self._upload_slots = asyncio.Semaphore(self._flux_server.get_max_in_flight_uploads())
+        self._tag_scheduler.reset()
+        self._batch_assembler.reset()
+        self._reset_timeout()
+        tasks = [asyncio.ensure_future(self._run_task(self._sample_positions()))]
+        for tag in self._tag_scheduler.get_tags():
+            tasks.append(asyncio.ensure_future(self._run_task(self._sample_illuminance(tag))))
+        tasks.append(asyncio.ensure_future(self._run_task(self._serialize())))
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), max(0.0, self._deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    if loop.time() < self._deadline:
+                        continue  # The deadline was extended by an accepted batch while waiting.
+                    logger.error("Timeout of {}s is exceeded while waiting for Flux-server response".format(
+                        self._timeout))
+                    self._stop_event.set()
+        finally:
+            await _cancel_tasks(tasks + list(self._uploads))
+            # Wait for the hardware calls still running on the executors before the devices are used again.
+            await loop.run_in_executor(self._positioning_executor, _noop)
+            await loop.run_in_executor(self._light_sensor_executor, _noop)
+            if self._spool is not None:
+                self._spool.sync()
+
+    async def _run_task(self, coroutine) -> None:
+        try:
+            await coroutine
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Unexpected error in measurement task")
+        finally:
+            self._stop_event.set()
+
+    def _reset_timeout(self) -> None:
+        self._deadline = asyncio.get_event_loop().time() + self._timeout
+
+    async def _sample_positions(self) -> None:
+        loop = asyncio.get_event_loop()
+        while not self._stop_event.is_set():
+            tag = self._tag_scheduler.next_tag()
+            start_time = time.monotonic()
+            try:
+                time_stamp, position = await loop.run_in_executor(self._positioning_executor,
+                                                                  self._tag_scheduler.do_positioning, tag)
+            except PozyxDeviceError as err:
+                self._metrics.positioning_errors.inc()
+                logger.error("Pozyx error while creating new readings ({})".format(tag.get_name()))
+                logger.error(err)
+                continue
+            self._metrics.positioning_seconds.observe(time.monotonic() - start_time)
+            if tag.position_filter is not None:
+                start_time = time.monotonic()
+                position = tag.position_filter.update(time_stamp, position)
+                self._metrics.position_filter_seconds.observe(time.monotonic() - start_time)
+                if position is None:
+                    continue
+            tag.position_history.add_position(time_stamp, position)
+            self._position_event.set()
+
+    async def _sample_illuminance(self, tag: Tag) -> None:
+        loop = asyncio.get_event_loop()
+        while not self._stop_event.is_set():
+            start_time = time.monotonic()
+            try:
+                light_sample = await loop.run_in_executor(self._light_sensor_executor, tag.light_sensor.sample)
+            except OSError as err:
+                self._metrics.light_sensor_errors.inc()
+                logger.error("I2C error while sampling the light sensor ({})".format(tag.get_name()))
+                logger.error(err)
+                continue
+            self._metrics.light_sample_seconds.observe(time.monotonic() - start_time)
+            if not light_sample.is_fresh:
+                continue
+            light_values = get_light_values(light_sample)
+            self._metrics.readings_taken.inc(len(light_values))
+            time_stamp = light_sample.get_time_stamp()
+            position = None
+            if await self._wait_for_position_after(tag.position_history, time_stamp):
+                position = tag.position_history.get_position_at(time_stamp)
+            for reading in create_readings(light_values, position, time_stamp, tag.tag_id,
+                                           self._max_position_uncertainty, self._metrics):
+                self._reading_queue.put_nowait(reading)
+
+    async def _wait_for_position_after(self, position_history: PositionHistory, time_stamp: float) -> bool:
+        deadline = asyncio.get_event_loop().time() + POSITION_WAIT_TIMEOUT
+        while not self._stop_event.is_set():
+            latest_time_stamp = position_history.get_latest_timestamp()
+            if latest_time_stamp is not None and latest_time_stamp >= time_stamp:
+                return True
+            self._position_event.clear()
+            try:
+                await asyncio.wait_for(self._position_event.wait(),
+                                       max(0.0, deadline - asyncio.get_event_loop().time()))
+            except asyncio.TimeoutError:
+                # Positioning stalls, e.g. due to Pozyx errors. Fall back to the latest known position.
+                return not position_history.is_empty()
+        return False
+
+    async def _serialize(self) -> None:
+        while not self._stop_event.is_set():
+            timeout = UPLOAD_SLOT_POLL_INTERVAL
+            if not self._upload_slots.locked():
+                timeout = self._batch_assembler.get_wait_timeout(READING_QUEUE_POLL_INTERVAL)
+            try:
+                self._batch_assembler.add(await asyncio.wait_for(self._reading_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                pass
+            while not self._reading_queue.empty():
+                self._batch_assembler.add(self._reading_queue.get_nowait())
+
+            if self._upload_slots.locked():
+                continue  # All upload slots are in use. Until one is free, readings keep accumulating.
+            if self._batch_assembler.should_flush():
+                await self._start_upload(self._batch_assembler.take_batch())
+            else:
+                payload = self._batch_assembler.take_replay_batch()
+                if payload is not None:
+                    await self._start_upload(payload)
+
+    async def _start_upload(self, payload: Payload) -> None:
+        """Starts the upload of the encoded batch in a free slot."""
+        await self._upload_slots.acquire()
+        upload = asyncio.ensure_future(self._upload(*payload))
+        self._uploads.add(upload)
+        upload.add_done_callback(self._uploads.discard)
+
+    async def _upload(self, data: bytes, content_encoding: str, batch_size: int,
+                      spool_range: Optional[Tuple[int, int]]) -> None:
+        try:
+            if not await self._upload_batch(data, content_encoding, batch_size, spool_range):
+                self._stop_event.set()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            self._metrics.upload_errors.inc()
+            logger.error("Request error while sending new readings to Flux-server")
+            logger.error(err)
+            self._stop_event.set()
+        except AuthorizationError as err:
+            logger.error("Server error while sending new readings to Flux-server")
+            logger.error(err)
+            self._stop_event.set()
+        finally:
+            self._upload_slots.release()
+
+    async def _upload_batch(self, data: bytes, content_encoding: str, batch_size: int,
+                            spool_range: Optional[Tuple[int, int]]) -> bool:
+        """Sends one batch until it is accepted and returns whether the measurement continues."""
+        while not self._stop_event.is_set():
+            auth_token = self._flux_server.get_auth_token()
+            start_time = time.monotonic()
+            status_code = await self._flux_server.send_data_to_server(data, content_encoding)
+            if status_code == 200:
+                self._reset_timeout()
+                self._batch_assembler.record_upload(len(data), time.monotonic() - start_time, batch_size,
+                                                    spool_range)
+                return True
+            elif status_code in (400, 415) and content_encoding != reading_encoder.CONTENT_ENCODING_IDENTITY:
+                self._batch_assembler.disable_compression(content_encoding)
+                data = reading_encoder.decompress(data, content_encoding)
+                content_encoding = reading_encoder.CONTENT_ENCODING_IDENTITY
+                self._metrics.readings_retried.inc(batch_size)
+            elif status_code == 401:
+                logger.info("Auth token expired. Try new login...")
+                await self._flux_server.login_for_upload(auth_token)
+                self._metrics.readings_retried.inc(batch_size)
+            elif status_code == 404:
+                logger.info("The measurement has been stopped by the server.")
+                return False
+            else:
+                logger.info("The measurement has been stopped.")
+                return False
+        return False
+
+
+def _noop() -> None:
+    pass
+
+
+class AsyncFluxSensor(FluxSensor):
+    """Controlling class for the flux-sensors components on the asyncio runtime"""
+
+    def __init__(self, localizer_instance: Localizer, light_sensor_instance: LightSensor, config_loader: ConfigLoader,
+                 flux_server: AsyncFluxServer, position_filter=None, tags: List[Tag] = None,
+                 metrics: Metrics = None) -> None:
+        super().__init__(localizer_instance, light_sensor_instance, config_loader, flux_server, position_filter, tags,
+                         metrics)
+        self._async_flux_server = flux_server
+        self._positioning_executor = ThreadPoolExecutor(max_workers=1)
+        self._light_sensor_executor = ThreadPoolExecutor(max_workers=len(self._tags))
+
+    def start_when_ready(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.run())
+        finally:
+            loop.close()
+
+    async def run(self) -> None:
+        await self._async_flux_server.open()
+        try:
+            await self._start_when_ready()
+        finally:
+            await self._async_flux_server.close()
+
+    async def _start_when_ready(self) -> None:
+        loop = asyncio.get_event_loop()
+        logger.info("Flux-sensors in standby. Start polling Flux-server")
+        while True:
+            if not await self._async_flux_server.poll_server_urls(self._config_loader.get_server_urls(),
+                                                                  self._config_loader.get_timeout()):
+                logger.warning("All server URLs failed to respond. Retry started...")
+                continue
+            logger.info("Server responding. Start measurement when ready...")
+
+            if not await self._async_flux_server.poll_active_measurement():
+                await self._handle_retry(RETRY_DELAY)
+                continue
+            logger.info("Success! A flux-server is available and a measurement is active.")
+
+            try:
+                await self._async_flux_server.login_at_server()
+                measurement = await self._async_flux_server.get_active_measurement()
+            except aiohttp.ClientError as err:
+                logger.error("Request error while loading active measurement from Flux-server")
+                logger.error(err)
+                await self._handle_retry(RETRY_DELAY)
+                continue
+            except AuthorizationError as err:
+                logger.error("Server error while loading active measurement from Flux-server")
+                logger.error(err)
+                await self._handle_retry(RETRY_DELAY)
+                continue
+
+            try:
+                await loop.run_in_executor(self._positioning_executor, self._initialize, measurement)
+            except InitializationError as err:
+                logger.error(err)
+                logger.error("Error while initializing the sensors")
+                await self._handle_retry(RETRY_DELAY)
+                continue
+
+            logger.info("Flux-sensors initialized. Start measurement...")
+            await self.run_measurement()
+
+    def _initialize(self, measurement: str) -> None:
+        self.clear_sensors()
+        self.initialize_sensors(measurement)
+        self.open_spool(measurement)
+
+    @staticmethod
+    async def _handle_retry(seconds: int) -> None:
+        logger.info("Retry starts in {} seconds...".format(seconds))
+        await asyncio.sleep(seconds)
+
+    async def run_measurement(self) -> None:
+        batch_policy = BatchPolicy(self._config_loader.get_min_batch_size(), self._config_loader.get_max_batch_size(),
+                                   self._config_loader.get_max_batch_age(),
+                                   self._async_flux_server.get_max_in_flight_uploads())
+        encoder = reading_encoder.ReadingEncoder(self._config_loader.get_compression())
+        measurement = AsyncMeasurement(None, None, self._async_flux_server, self._positioning_executor,
+                                       self._light_sensor_executor, self._config_loader.get_timeout(), batch_policy,
+                                       encoder, self._spool, self._config_loader.get_spool_replay_rate(),
+                                       max_position_uncertainty=self._config_loader.get_max_position_uncertainty(),
+                                       tag_scheduler=TagScheduler(self._tags), metrics=self._metrics)
+        await measurement.run()
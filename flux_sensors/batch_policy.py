@@ -0,0 +1,100 @@
+from typing import Optional
+from collections import deque
+from flux_sensors.config_loader import (DEFAULT_MIN_BATCH_SIZE, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_BATCH_AGE,
+                                        DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS)
+import threading
+
+SMOOTHING_FACTOR = 0.2  # Weight of the newest sample in the moving averages.
+LATENCY_WINDOW_SIZE = 16  # Number of round-trips to look back for the base latency.
+HEADROOM = 1.5  # Safety factor so the uploads keep up when the latency varies.
+
+
+class BatchPolicy(object):
+    """Decides when the collected readings are flushed as one batch to the Flux-server.
+
+    A batch is flushed when it reaches the size target or when its oldest reading reaches the maximum age, whichever
+    comes first. The size target follows the measured uploads: the round-trip time is split into a base latency (the
+    fastest recent round-trip) and a transfer time per byte. The target is the smallest batch that lets the available
+    upload slots keep up with the reading rate, so batches grow on slow links and shrink on fast ones.
+    """
+
+    def __init__(self, min_batch_size: int = DEFAULT_MIN_BATCH_SIZE, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_batch_age: float = DEFAULT_MAX_BATCH_AGE,
+                 max_in_flight_uploads: int = DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS) -> None:
+        if min_batch_size < 1:
+            raise ValueError("Argument min_batch_size must be at least 1.")
+        elif max_batch_size < min_batch_size:
+            raise ValueError("Argument max_batch_size must not be smaller than min_batch_size.")
+        elif max_batch_age <= 0:
+            raise ValueError("Argument max_batch_age must be positive.")
+        elif max_in_flight_uploads < 1:
+            raise ValueError("Argument max_in_flight_uploads must be at least 1.")
+        self._min_batch_size = min_batch_size
+        self._max_batch_size = max_batch_size
+        self._max_batch_age = max_batch_age
+        self._max_in_flight_uploads = max_in_flight_uploads
+        self._lock = threading.Lock()
+        self._round_trip_times = deque(maxlen=LATENCY_WINDOW_SIZE)  # type: deque
+        self._seconds_per_byte = None  # type: Optional[float]
+        self._bytes_per_reading = None  # type: Optional[float]
+        self._reading_rate = None  # type: Optional[float]
+        self._last_flush_time = None  # type: Optional[float]
+        self._target_size = min_batch_size
+
+    def get_max_batch_size(self) -> int:
+        return self._max_batch_size
+
+    def get_max_batch_age(self) -> float:
+        return self._max_batch_age
+
+    def get_target_size(self) -> int:
+        with self._lock:
+            return self._target_size
+
+    def should_flush(self, batch_size: int, batch_age: float) -> bool:
+        """Returns whether a batch with the given number of readings and age of its oldest reading is due."""
+        if batch_size == 0:
+            return False
+        return batch_size >= self.get_target_size() or batch_age >= self._max_batch_age
+
+    def record_flush(self, batch_size: int, payload_size: int, time_stamp: float) -> None:
+        """Records a flushed batch to estimate the reading rate and the payload size per reading."""
+        with self._lock:
+            if self._last_flush_time is not None and time_stamp > self._last_flush_time:
+                self._reading_rate = self._smooth(self._reading_rate,
+                                                  batch_size / (time_stamp - self._last_flush_time))
+            self._last_flush_time = time_stamp
+            if batch_size > 0:
+                self._bytes_per_reading = self._smooth(self._bytes_per_reading, payload_size / batch_size)
+            self._update_target_size()
+
+    def record_upload(self, payload_size: int, round_trip_time: float) -> None:
+        """Records the round-trip time of a successful upload with the given payload size in bytes."""
+        with self._lock:
+            self._round_trip_times.append(round_trip_time)
+            base_latency = min(self._round_trip_times)
+            if payload_size > 0:
+                self._seconds_per_byte = self._smooth(self._seconds_per_byte,
+                                                      max(0.0, round_trip_time - base_latency) / payload_size)
+            self._update_target_size()
+
+    @staticmethod
+    def _smooth(average: Optional[float], sample: float) -> float:
+        if average is None:
+            return sample
+        return average + SMOOTHING_FACTOR * (sample - average)
+
+    def _update_target_size(self) -> None:
+        if self._reading_rate is None or len(self._round_trip_times) == 0:
+            return
+        # Readings each upload slot has to carry per second to keep up with the sampling.
+        slot_rate = self._reading_rate / self._max_in_flight_uploads
+        transfer_time_per_reading = 0.0
+        if self._seconds_per_byte is not None and self._bytes_per_reading is not None:
+            transfer_time_per_reading = self._seconds_per_byte * self._bytes_per_reading
+        utilization = slot_rate * transfer_time_per_reading
+        if utilization >= 1:
+            self._target_size = self._max_batch_size
+            return
+        target_size = HEADROOM * slot_rate * min(self._round_trip_times) / (1 - utilization)
+        self._target_size = max(self._min_batch_size, min(self._max_batch_size, int(target_size)))
@@ -1,4 +1,5 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from flux_sensors import reading_encoder
 import configparser
 import logging
 
@@ -6,28 +7,99 @@ CONFIG_FILE_PATH = "/home/pi/.config/flux-config.ini"
 SECTION_FLUX_SERVER_CREDENTIALS = "Flux Server Credentials"
 SECTION_FLUX_SERVER_URLS = "Flux Server URLs"
 SECTION_FLUX_SERVER_CONNECTION_SETTINGS = "Flux Server Connection Settings"
+SECTION_FLUX_SERVER_BATCH_SETTINGS = "Flux Server Batch Settings"
+SECTION_FLUX_SENSOR_SPOOL = "Flux Sensor Spool"
+SECTION_FLUX_SENSOR_LIGHT_SENSOR = "Flux Sensor Light Sensor"
+SECTION_FLUX_SENSOR_LOCALIZER = "Flux Sensor Localizer"
+SECTION_FLUX_SENSOR_TAGS = "Flux Sensor Tags"
+SECTION_FLUX_SENSOR_LIGHT_SENSOR_ARRAY = "Flux Sensor Light Sensor Array"
+SECTION_FLUX_SENSOR_METRICS = "Flux Sensor Metrics"
+SECTION_FLUX_SENSOR_PROFILER = "Flux Sensor Profiler"
 DEFAULT_FLUX_SERVER_URL = "http://localhost:9000"
 DEFAULT_FLUX_SERVER_USERNAME = "user"
 DEFAULT_FLUX_SERVER_PASSWORD = "secret"
 DEFAULT_FLUX_SERVER_CONNECTION_TIMEOUT = 10
+DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS = 4
+DEFAULT_FLUX_SERVER_CONNECTION_POOL_SIZE = 4
+DEFAULT_FLUX_SERVER_MAX_RETRIES = 3
+DEFAULT_FLUX_SERVER_TOKEN_LIFETIME = 0.0  # in seconds, 0: the lifetime is taken from the exp claim of the token
+DEFAULT_FLUX_SERVER_COMPRESSION = reading_encoder.CONTENT_ENCODING_IDENTITY
+FLUX_SERVER_COMPRESSIONS = reading_encoder.CONTENT_ENCODINGS
+DEFAULT_MIN_BATCH_SIZE = 3
+DEFAULT_MAX_BATCH_SIZE = 1000
+DEFAULT_MAX_BATCH_AGE = 1.0
+DEFAULT_SPOOL_DIRECTORY = "/home/pi/.local/share/flux-sensors/spool"
+DEFAULT_SPOOL_MAX_SIZE = 256  # in megabytes
+MIN_SPOOL_MAX_SIZE = 1  # in megabytes, the size of one spool segment
+DEFAULT_SPOOL_REPLAY_RATE = 1000  # in readings per second
+DEFAULT_LIGHT_SENSOR_AUTO_RANGE = False
+DEFAULT_MULTIPLEXER_ADDRESS = 0x70  # TCA9548A with A0 to A2 pulled low
+NO_MULTIPLEXER_CHANNEL = "-"
+DEFAULT_POSITIONING = "device"
+POSITIONINGS = ("device", "host")
+DEFAULT_POSITION_FILTER = "device"
+POSITION_FILTERS = ("device", "host", "none")
+DEFAULT_MAX_POSITION_UNCERTAINTY = 0  # in mm, 0 keeps all readings
+LOCAL_TAG_NAME = "local"
+DEFAULT_TAG_WEIGHT = 1
+DEFAULT_METRICS_PORT = 0  # 0 disables the metrics endpoint
+DEFAULT_METRICS_ADDRESS = "127.0.0.1"
+DEFAULT_PROFILE_DIRECTORY = "/home/pi/.local/share/flux-sensors/profiles"
+DEFAULT_PROFILE_DURATION = 30.0  # in seconds
+DEFAULT_PROFILE_SAMPLING_INTERVAL = 0.005  # in seconds
+
+# Tag (None for the local Pozyx), I2C bus, multiplexer channel (None without multiplexer) and offset in mm
+ArrayLightSensorSettings = Tuple[Optional[int], int, Optional[int], Tuple[float, float, float]]
 
 logger = logging.getLogger(__name__)
 
 
 class ConfigLoader:
 
-    def __init__(self) -> None:
+    def __init__(self, config_file_path: str = CONFIG_FILE_PATH) -> None:
+        self._config_file_path = config_file_path
         self._credentials = {"username": DEFAULT_FLUX_SERVER_USERNAME, "password": DEFAULT_FLUX_SERVER_PASSWORD}
         self._timeout = DEFAULT_FLUX_SERVER_CONNECTION_TIMEOUT
+        self._max_in_flight_uploads = DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS
+        self._connection_pool_size = DEFAULT_FLUX_SERVER_CONNECTION_POOL_SIZE
+        self._max_retries = DEFAULT_FLUX_SERVER_MAX_RETRIES
+        self._token_lifetime = DEFAULT_FLUX_SERVER_TOKEN_LIFETIME
+        self._compression = DEFAULT_FLUX_SERVER_COMPRESSION
+        self._min_batch_size = DEFAULT_MIN_BATCH_SIZE
+        self._max_batch_size = DEFAULT_MAX_BATCH_SIZE
+        self._max_batch_age = DEFAULT_MAX_BATCH_AGE
+        self._spool_directory = DEFAULT_SPOOL_DIRECTORY
+        self._spool_max_size = DEFAULT_SPOOL_MAX_SIZE
+        self._spool_replay_rate = DEFAULT_SPOOL_REPLAY_RATE
+        self._light_sensor_auto_range = DEFAULT_LIGHT_SENSOR_AUTO_RANGE
+        self._multiplexer_address = DEFAULT_MULTIPLEXER_ADDRESS
+        self._light_sensor_array = []  # type: List[ArrayLightSensorSettings]
+        self._positioning = DEFAULT_POSITIONING
+        self._position_filter = DEFAULT_POSITION_FILTER
+        self._max_position_uncertainty = DEFAULT_MAX_POSITION_UNCERTAINTY
+        self._tags = []  # type: List[Tuple[Optional[int], int, int]]
+        self._metrics_port = DEFAULT_METRICS_PORT
+        self._metrics_address = DEFAULT_METRICS_ADDRESS
+        self._profile_directory = DEFAULT_PROFILE_DIRECTORY
+        self._profile_duration = DEFAULT_PROFILE_DURATION
+        self._profile_sampling_interval = DEFAULT_PROFILE_SAMPLING_INTERVAL
         self._server_urls = []
         self._load_config()
 
     def _load_config(self) -> None:
-        logger.info("Load config file '{}'...".format(CONFIG_FILE_PATH))
+        logger.info("Load config file '{}'...".format(self._config_file_path))
         config = configparser.ConfigParser()
-        config.read(CONFIG_FILE_PATH)
+        config.read(self._config_file_path)
         self._load_credentials(config)
         self._load_connection_settings(config)
+        self._load_batch_settings(config)
+        self._load_spool_settings(config)
+        self._load_light_sensor_settings(config)
+        self._load_localizer_settings(config)
+        self._load_tags(config)
+        self._load_light_sensor_array(config)
+        self._load_metrics_settings(config)
+        self._load_profiler_settings(config)
         self._load_server_urls(config)
 
     def _load_credentials(self, config: configparser.ConfigParser) -> None:
@@ -40,6 +112,120 @@ class ConfigLoader:
         flux_server_connection_settings = self._load_section(config, SECTION_FLUX_SERVER_CONNECTION_SETTINGS)
         self._timeout = self._load_int_value(flux_server_connection_settings, "timeout",
                                              DEFAULT_FLUX_SERVER_CONNECTION_TIMEOUT)
+        self._max_in_flight_uploads = self._load_int_value(flux_server_connection_settings, "max_in_flight_uploads",
+                                                           DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS, 1)
+        self._connection_pool_size = self._load_int_value(flux_server_connection_settings, "connection_pool_size",
+                                                          DEFAULT_FLUX_SERVER_CONNECTION_POOL_SIZE)
+        self._max_retries = self._load_int_value(flux_server_connection_settings, "max_retries",
+                                                 DEFAULT_FLUX_SERVER_MAX_RETRIES)
+        self._token_lifetime = max(0.0, self._load_float_value(flux_server_connection_settings, "token_lifetime",
+                                                               DEFAULT_FLUX_SERVER_TOKEN_LIFETIME))
+        self._compression = self._load_choice_value(flux_server_connection_settings, "compression",
+                                                    FLUX_SERVER_COMPRESSIONS, DEFAULT_FLUX_SERVER_COMPRESSION)
+
+    def _load_batch_settings(self, config: configparser.ConfigParser) -> None:
+        flux_server_batch_settings = self._load_optional_section(config, SECTION_FLUX_SERVER_BATCH_SETTINGS)
+        self._min_batch_size = self._load_int_value(flux_server_batch_settings, "min_batch_size",
+                                                    DEFAULT_MIN_BATCH_SIZE, 1)
+        self._max_batch_size = self._load_int_value(flux_server_batch_settings, "max_batch_size",
+                                                    DEFAULT_MAX_BATCH_SIZE, 1)
+        if self._max_batch_size < self._min_batch_size:
+            logger.error("Error: config file has a max_batch_size below the min_batch_size. Using default values {} "
+                         "and {} instead".format(DEFAULT_MIN_BATCH_SIZE, DEFAULT_MAX_BATCH_SIZE))
+            self._min_batch_size = DEFAULT_MIN_BATCH_SIZE
+            self._max_batch_size = DEFAULT_MAX_BATCH_SIZE
+        self._max_batch_age = self._load_float_value(flux_server_batch_settings, "max_batch_age",
+                                                     DEFAULT_MAX_BATCH_AGE)
+        if self._max_batch_age <= 0:
+            self._max_batch_age = self._reject_value("max_batch_age", self._max_batch_age, "positive",
+                                                     DEFAULT_MAX_BATCH_AGE)
+
+    def _load_spool_settings(self, config: configparser.ConfigParser) -> None:
+        flux_sensor_spool = self._load_optional_section(config, SECTION_FLUX_SENSOR_SPOOL)
+        if flux_sensor_spool is not None:
+            self._spool_directory = flux_sensor_spool.get("directory", DEFAULT_SPOOL_DIRECTORY).strip()
+        self._spool_max_size = self._load_int_value(flux_sensor_spool, "max_size", DEFAULT_SPOOL_MAX_SIZE,
+                                                    MIN_SPOOL_MAX_SIZE)
+        self._spool_replay_rate = self._load_int_value(flux_sensor_spool, "replay_rate", DEFAULT_SPOOL_REPLAY_RATE)
+
+    def _load_light_sensor_settings(self, config: configparser.ConfigParser) -> None:
+        flux_sensor_light_sensor = self._load_optional_section(config, SECTION_FLUX_SENSOR_LIGHT_SENSOR)
+        self._light_sensor_auto_range = self._load_bool_value(flux_sensor_light_sensor, "auto_range",
+                                                              DEFAULT_LIGHT_SENSOR_AUTO_RANGE)
+        if flux_sensor_light_sensor is not None:
+            try:
+                self._multiplexer_address = int(flux_sensor_light_sensor.get(
+                    "multiplexer_address", str(DEFAULT_MULTIPLEXER_ADDRESS)), 0)
+            except ValueError:
+                logger.error("Error: config file has wrong format for value 'multiplexer_address'. Using default "
+                             "value 0x{:02x} instead".format(DEFAULT_MULTIPLEXER_ADDRESS))
+
+    def _load_localizer_settings(self, config: configparser.ConfigParser) -> None:
+        flux_sensor_localizer = self._load_optional_section(config, SECTION_FLUX_SENSOR_LOCALIZER)
+        self._positioning = self._load_choice_value(flux_sensor_localizer, "positioning", POSITIONINGS,
+                                                    DEFAULT_POSITIONING)
+        self._position_filter = self._load_choice_value(flux_sensor_localizer, "position_filter", POSITION_FILTERS,
+                                                        DEFAULT_POSITION_FILTER)
+        self._max_position_uncertainty = self._load_float_value(flux_sensor_localizer, "max_position_uncertainty",
+                                                                DEFAULT_MAX_POSITION_UNCERTAINTY)
+
+    def _load_tags(self, config: configparser.ConfigParser) -> None:
+        if not config.has_section(SECTION_FLUX_SENSOR_TAGS):
+            return  # A single tag without a section of its own.
+        flux_sensor_tags = config[SECTION_FLUX_SENSOR_TAGS]
+        for key in flux_sensor_tags:
+            try:
+                remote_id = None
+                if key.strip().lower() != LOCAL_TAG_NAME:
+                    remote_id = int(key, 16)
+                values = [int(value) for value in flux_sensor_tags[key].split(",")]
+                i2c_bus = values[0]
+                weight = DEFAULT_TAG_WEIGHT
+                if len(values) > 1:
+                    weight = values[1]
+                if len(values) > 2 or weight < 1:
+                    raise ValueError()
+            except (ValueError, IndexError):
+                logger.error("Error: config file has wrong format for tag '{}'. The tag is not used".format(key))
+                continue
+            self._tags.append((remote_id, i2c_bus, weight))
+
+    def _load_light_sensor_array(self, config: configparser.ConfigParser) -> None:
+        if not config.has_section(SECTION_FLUX_SENSOR_LIGHT_SENSOR_ARRAY):
+            return  # A single light sensor per tag.
+        flux_sensor_light_sensor_array = config[SECTION_FLUX_SENSOR_LIGHT_SENSOR_ARRAY]
+        for key in flux_sensor_light_sensor_array:
+            try:
+                values = [value.strip() for value in flux_sensor_light_sensor_array[key].split(",")]
+                if len(values) not in (5, 6):
+                    raise ValueError()
+                i2c_bus = int(values[0])
+                multiplexer_channel = None
+                if values[1] != NO_MULTIPLEXER_CHANNEL:
+                    multiplexer_channel = int(values[1])
+                offset = (float(values[2]), float(values[3]), float(values[4]))
+                remote_id = None
+                if len(values) == 6 and values[5].lower() != LOCAL_TAG_NAME:
+                    remote_id = int(values[5], 16)
+            except ValueError:
+                logger.error("Error: config file has wrong format for light sensor '{}'. The light sensor is not "
+                             "used".format(key))
+                continue
+            self._light_sensor_array.append((remote_id, i2c_bus, multiplexer_channel, offset))
+
+    def _load_metrics_settings(self, config: configparser.ConfigParser) -> None:
+        flux_sensor_metrics = self._load_optional_section(config, SECTION_FLUX_SENSOR_METRICS)
+        self._metrics_port = self._load_int_value(flux_sensor_metrics, "port", DEFAULT_METRICS_PORT)
+        if flux_sensor_metrics is not None:
+            self._metrics_address = flux_sensor_metrics.get("address", DEFAULT_METRICS_ADDRESS).strip()
+
+    def _load_profiler_settings(self, config: configparser.ConfigParser) -> None:
+        flux_sensor_profiler = self._load_optional_section(config, SECTION_FLUX_SENSOR_PROFILER)
+        if flux_sensor_profiler is not None:
+            self._profile_directory = flux_sensor_profiler.get("directory", DEFAULT_PROFILE_DIRECTORY).strip()
+        self._profile_duration = self._load_float_value(flux_sensor_profiler, "duration", DEFAULT_PROFILE_DURATION)
+        self._profile_sampling_interval = self._load_float_value(flux_sensor_profiler, "sampling_interval",
+                                                                 DEFAULT_PROFILE_SAMPLING_INTERVAL)
 
     def _load_server_urls(self, config: configparser.ConfigParser) -> None:
         flux_server_urls = self._load_section(config, SECTION_FLUX_SERVER_URLS)
@@ -60,15 +246,64 @@ class ConfigLoader:
             logger.error("Error: config file has missing section '{}'. Using default values instead".format(key))
             return None
 
-    def _load_int_value(self, section: Optional[configparser.ConfigParser], key: str, default_value: int) -> int:
+    def _load_optional_section(self, config: configparser.ConfigParser,
+                               key: str) -> Optional[configparser.ConfigParser]:
+        if not config.has_section(key):
+            return None  # The defaults are used without notice.
+        return config[key]
+
+    def _load_int_value(self, section: Optional[configparser.ConfigParser], key: str, default_value: int,
+                        min_value: Optional[int] = None) -> int:
+        if section is None:
+            return default_value
+        try:
+            value = section.getint(key, default_value)
+        except ValueError:
+            logger.error("Error: config file has wrong format for value '{}'. Using default value {} "
+                         "instead".format(key, default_value))
+            return default_value
+        if min_value is not None and value < min_value:
+            return self._reject_value(key, value, "at least {}".format(min_value), default_value)
+        return value
+
+    @staticmethod
+    def _reject_value(key: str, value: object, requirement: str, default_value: object) -> object:
+        logger.error("Error: config file has value {} for '{}', which must be {}. Using default value {} "
+                     "instead".format(value, key, requirement, default_value))
+        return default_value
+
+    def _load_float_value(self, section: Optional[configparser.ConfigParser], key: str,
+                          default_value: float) -> float:
         if section is None:
             return default_value
         try:
-            return section.getint(key, default_value)
+            return section.getfloat(key, default_value)
         except ValueError:
+            logger.error("Error: config file has wrong format for value '{}'. Using default value {} "
+                         "instead".format(key, default_value))
+            return default_value
+
+    def _load_bool_value(self, section: Optional[configparser.ConfigParser], key: str, default_value: bool) -> bool:
+        if section is None:
+            return default_value
+        try:
+            return section.getboolean(key, default_value)
+        except ValueError:
+            logger.error("Error: config file has wrong format for value '{}'. Using default value {} "
+                         "instead".format(key, default_value))
+            return default_value
+
+    def _load_choice_value(self, section: Optional[configparser.ConfigParser], key: str, choices: Tuple[str, ...],
+                           default_value: str) -> str:
+        if section is None:
+            return default_value
+        value = section.get(key, default_value).strip().lower()
+        if value not in choices:
             logger.error(
-                "Error: config file has wrong format for value '{}'. Using default value {} instead".format(key,
-                                                                                                            default_value))
+                "Error: config file has unknown value '{}' for '{}'. Using default value {} instead".format(
+                    value, key, default_value))
+            return default_value
+        return value
 
     def get_credentials(self) -> Dict[str, str]:
         return self._credentials
@@ -76,5 +311,80 @@ class ConfigLoader:
     def get_timeout(self) -> int:
         return self._timeout
 
+    def get_max_in_flight_uploads(self) -> int:
+        return self._max_in_flight_uploads
+
+    def get_connection_pool_size(self) -> int:
+        return self._connection_pool_size
+
+    def get_max_retries(self) -> int:
+        return self._max_retries
+
+    def get_token_lifetime(self) -> float:
+        return self._token_lifetime
+
+    def get_compression(self) -> str:
+        return self._compression
+
+    def get_min_batch_size(self) -> int:
+        return self._min_batch_size
+
+    def get_max_batch_size(self) -> int:
+        return self._max_batch_size
+
+    def get_max_batch_age(self) -> float:
+        return self._max_batch_age
+
+    def get_spool_directory(self) -> str:
+        """Returns the directory of the reading spool or an empty string if spooling is disabled."""
+        return self._spool_directory
+
+    def get_spool_max_size(self) -> int:
+        return self._spool_max_size
+
+    def get_spool_replay_rate(self) -> int:
+        return self._spool_replay_rate
+
+    def get_light_sensor_auto_range(self) -> bool:
+        return self._light_sensor_auto_range
+
+    def get_multiplexer_address(self) -> int:
+        return self._multiplexer_address
+
+    def get_light_sensor_array(self) -> List[ArrayLightSensorSettings]:
+        return self._light_sensor_array
+
+    def get_positioning(self) -> str:
+        """Returns where positions are calculated: 'device' (Pozyx firmware) or 'host' (multilateration)."""
+        return self._positioning
+
+    def get_position_filter(self) -> str:
+        """Returns where positions are filtered: 'device' (Pozyx moving median), 'host' (Kalman filter) or 'none'."""
+        return self._position_filter
+
+    def get_max_position_uncertainty(self) -> float:
+        return self._max_position_uncertainty
+
+    def get_tags(self) -> List[Tuple[Optional[int], int, int]]:
+        """Returns remote ID (None for the local Pozyx), I2C bus of the light sensor and weight of every tag."""
+        return self._tags
+
+    def get_metrics_port(self) -> int:
+        """Returns the port of the metrics endpoint or 0 if it is disabled."""
+        return self._metrics_port
+
+    def get_metrics_address(self) -> str:
+        return self._metrics_address
+
+    def get_profile_directory(self) -> str:
+        """Returns the directory of the profiles or an empty string if profiling is disabled."""
+        return self._profile_directory
+
+    def get_profile_duration(self) -> float:
+        return self._profile_duration
+
+    def get_profile_sampling_interval(self) -> float:
+        return self._profile_sampling_interval
+
     def get_server_urls(self) -> List[str]:
         return self._server_urls
@@ -1,13 +1,26 @@
-from flux_sensors.localizer.localizer import Localizer, Coordinates, LocalizerError, PozyxDeviceError
+from flux_sensors.localizer.localizer import Localizer, Coordinates, LocalizerError
+from flux_sensors.localizer.tag_scheduler import Tag, TagScheduler
 from flux_sensors.light_sensor.light_sensor import LightSensor
 from flux_sensors.config_loader import ConfigLoader
 from flux_sensors.flux_server import FluxServer, FluxServerError
+from flux_sensors.measurement_pipeline import MeasurementPipeline
+from flux_sensors.batch_policy import BatchPolicy
+from flux_sensors.metrics import Metrics
+from flux_sensors.reading_encoder import ReadingEncoder
+from flux_sensors.reading_spool import ReadingSpool, ReadingSpoolError
 from flux_sensors.models import models
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
+import os
 import time
+import hashlib
 import requests
 import json
 import logging
 
+MEASUREMENT_KEY_LENGTH = 16
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,15 +33,26 @@ class InitializationError(FluxSensorError):
 
 
 class FluxSensor:
-    """Controlling class for the flux-sensors components"""
+    """Controlling class for the flux-sensors components
+
+    With several tags, the given localizer, light sensor and position filter are not used: every tag brings its own.
+    """
 
     def __init__(self, localizer_instance: Localizer, light_sensor_instance: LightSensor, config_loader: ConfigLoader,
-                 flux_server: FluxServer) -> None:
-        self._localizer = localizer_instance
-        self._light_sensor = light_sensor_instance
+                 flux_server: FluxServer, position_filter=None, tags: List[Tag] = None,
+                 metrics: Metrics = None) -> None:
+        self._tags = tags
+        if tags is None:
+            self._tags = [Tag(models.NO_TAG_ID, localizer_instance, light_sensor_instance,
+                              position_filter=position_filter)]
         self._config_loader = config_loader
         self._flux_server = flux_server
-        self._timeout = time.time()
+        self._metrics = metrics
+        if metrics is None:
+            self._metrics = Metrics()
+        self._spool = None  # type: Optional[ReadingSpool]
+        self._spool_directory = ""
+        self._initialization_executor = ThreadPoolExecutor(max_workers=1)
 
     def start_when_ready(self) -> None:
         logger.info("Flux-sensors in standby. Start polling Flux-server")
@@ -68,6 +92,7 @@ class FluxSensor:
                 FluxSensor.handle_retry(3)
                 continue
 
+            self.open_spool(response.text)
             logger.info("Flux-sensors initialized. Start measurement...")
             self.start_measurement()
 
@@ -77,77 +102,112 @@ class FluxSensor:
         time.sleep(seconds)
 
     def initialize_sensors(self, measurement: str) -> None:
-        self.initialize_localizer(measurement)
-        self.initialize_light_sensor()
+        """Initializes the light sensors on a thread of their own while the Pozyx is configured and calibrated.
+
+        The first integration cycles of the light sensors complete in the meantime, so the first reading is taken as
+        soon as the first position is known.
+        """
+        light_sensor_initialization = self._initialization_executor.submit(self.initialize_light_sensor)
+        try:
+            self.initialize_localizer(measurement)
+        finally:
+            concurrent.futures.wait([light_sensor_initialization])
+        light_sensor_initialization.result()
 
     def initialize_localizer(self, measurement: str) -> None:
         try:
             measurement_json = json.loads(measurement)
             for anchorPosition in measurement_json["anchorPositions"]:
-                self._localizer.add_anchor_to_cache(int(anchorPosition["anchor"]["networkId"], 16),
-                                                    Coordinates(int(anchorPosition["xposition"]),
-                                                                int(anchorPosition["yposition"]),
-                                                                int(anchorPosition["zposition"])))
+                for tag in self._tags:
+                    tag.localizer.add_anchor_to_cache(int(anchorPosition["anchor"]["networkId"], 16),
+                                                      Coordinates(int(anchorPosition["xposition"]),
+                                                                  int(anchorPosition["yposition"]),
+                                                                  int(anchorPosition["zposition"])))
         except(ValueError, KeyError, TypeError):
             raise InitializationError("Error while parsing the Pozyx Anchors.")
 
-        try:
-            self._localizer.initialize()
-        except LocalizerError as err:
-            logger.error(err)
-            raise InitializationError("Error while initializing Pozyx.")
+        for tag in self._tags:
+            try:
+                tag.localizer.initialize()
+            except LocalizerError as err:
+                logger.error(err)
+                raise InitializationError("Error while initializing Pozyx ({}).".format(tag.get_name()))
 
     def initialize_light_sensor(self) -> None:
-        self._light_sensor.initialize()
+        for tag in self._tags:
+            try:
+                tag.light_sensor.initialize(auto_range=self._config_loader.get_light_sensor_auto_range())
+            except OSError as err:
+                logger.error(err)
+                raise InitializationError("Error while initializing the light sensor ({}).".format(tag.get_name()))
 
-    def clear_sensors(self) -> None:
-        self._localizer.clear()
+    @staticmethod
+    def get_measurement_key(measurement: str) -> Optional[str]:
+        """Returns a key which identifies the measurement by its name and anchor positions, or None without a name.
 
-    def _reset_timeout(self) -> None:
-        self._timeout = time.time() + self._config_loader.get_timeout()
+        Flux-server does not send an ID of the active measurement, so the spool is keyed on what it does send.
+        """
+        try:
+            measurement_json = json.loads(measurement)
+            name = measurement_json.get("name")
+            anchor_positions = sorted([str(anchor_position["anchor"]["networkId"]), anchor_position["xposition"],
+                                       anchor_position["yposition"], anchor_position["zposition"]]
+                                      for anchor_position in measurement_json["anchorPositions"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+        if not isinstance(name, str) or name == "":
+            return None
+        key = json.dumps([name, anchor_positions]).encode()
+        return hashlib.sha1(key).hexdigest()[:MEASUREMENT_KEY_LENGTH]
+
+    def open_spool(self, measurement: str) -> None:
+        """Opens the reading spool of the measurement. Readings are only replayed into the measurement they belong to.
+
+        Without a key of the measurement, the readings could be replayed into another measurement, so no spool is used.
+        """
+        spool_root = self._config_loader.get_spool_directory()
+        if spool_root == "":
+            return
+        measurement_key = FluxSensor.get_measurement_key(measurement)
+        if measurement_key is None:
+            logger.warning("The active measurement has no name. Readings are not stored on disk.")
+            self.close_spool()
+            return
+        spool_directory = os.path.join(spool_root, measurement_key)
+        if self._spool is not None and self._spool_directory == spool_directory:
+            return
+        self.close_spool()
+
+        try:
+            spool = ReadingSpool(spool_directory, max_size=self._config_loader.get_spool_max_size() * 1024 * 1024)
+            spool.open()
+        except (OSError, ReadingSpoolError, ValueError) as err:
+            logger.error("Error while opening the reading spool. Readings are not stored on disk.")
+            logger.error(err)
+            return
+        self._spool = spool
+        self._spool_directory = spool_directory
+
+    def get_spool(self) -> Optional[ReadingSpool]:
+        return self._spool
 
-    def _is_timeout_exceeded(self) -> bool:
-        return time.time() > self._timeout
+    def close_spool(self) -> None:
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+            self._spool_directory = ""
+
+    def clear_sensors(self) -> None:
+        for tag in self._tags:
+            tag.localizer.clear()
 
     def start_measurement(self) -> None:
-        readings = []
-        self._flux_server.initialize_last_response()
-        self._reset_timeout()
-        while not self._is_timeout_exceeded():
-            try:
-                position = self._localizer.do_positioning()
-                illuminance = self._light_sensor.do_measurement()
-
-                readings.append(models.Reading(illuminance, position))
-                try:
-                    if self._flux_server.get_last_response() == 200:
-                        if len(readings) >= self._flux_server.MIN_BATCH_SIZE:
-                            self._flux_server.reset_last_response()
-                            json_data = json.dumps(readings, default=lambda o: o.__dict__)
-                            self._flux_server.send_data_to_server(json_data)
-                            del readings[:]
-                            self._reset_timeout()
-                    elif self._flux_server.get_last_response() == 401:
-                        logger.info("Auth token expired. Try new login...")
-                        self._flux_server.login_at_server()
-                        self._flux_server.initialize_last_response()
-                    elif self._flux_server.get_last_response() == 404:
-                        logger.info("The measurement has been stopped by the server.")
-                        return
-                    elif self._flux_server.get_last_response() != self._flux_server.RESPONSE_PENDING:
-                        logger.info("The measurement has been stopped.")
-                        return
-                except requests.exceptions.RequestException as err:
-                    logger.error("Request error while sending new readings to Flux-server")
-                    logger.error(err)
-                    return
-                except FluxServerError as err:
-                    logger.error("Server error while sending new readings to Flux-server")
-                    logger.error(err)
-                    return
-            except PozyxDeviceError as err:
-                logger.error("Pozyx error while creating new readings")
-                logger.error(err)
-                continue
-        logger.error("Timeout of {}s is exceeded while waiting for Flux-server response".format(
-            self._config_loader.get_timeout()))
+        batch_policy = BatchPolicy(self._config_loader.get_min_batch_size(), self._config_loader.get_max_batch_size(),
+                                   self._config_loader.get_max_batch_age(),
+                                   self._flux_server.get_max_in_flight_uploads())
+        encoder = ReadingEncoder(self._config_loader.get_compression())
+        pipeline = MeasurementPipeline(None, None, self._flux_server, self._config_loader.get_timeout(), batch_policy,
+                                       encoder, self._spool, self._config_loader.get_spool_replay_rate(),
+                                       max_position_uncertainty=self._config_loader.get_max_position_uncertainty(),
+                                       tag_scheduler=TagScheduler(self._tags), metrics=self._metrics)
+        pipeline.run()
@@ -1,16 +1,42 @@
-from typing import List, Dict, Optional, Callable
-import polling
+from typing import List, Dict, Optional, Callable, Set
+from flux_sensors import reading_encoder
+from flux_sensors.config_loader import (DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS,
+                                        DEFAULT_FLUX_SERVER_CONNECTION_POOL_SIZE, DEFAULT_FLUX_SERVER_MAX_RETRIES,
+                                        DEFAULT_FLUX_SERVER_TOKEN_LIFETIME)
+from flux_sensors.metrics import Metrics
 from http.client import responses
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 from requests_futures.sessions import FuturesSession
 from concurrent.futures import Future
+import concurrent.futures
+import collections
+import threading
+import time
+import random
 import logging
 import json
+import base64
 
 CHECK_SERVER_READY_ROUTE = ""
 CHECK_ACTIVE_MEASUREMENT_ROUTE = "/measurements/active"
 ADD_READINGS_ROUTE = "/measurements/active/readings"
 LOGIN_ROUTE = "/login"
+MEASUREMENT_EVENTS_ROUTE = "/measurements/events"
+EVENT_STREAM_CONTENT_TYPE = "text/event-stream"
+EVENT_STREAM_READ_TIMEOUT = 90  # Seconds without event or heartbeat after which the stream is opened again.
+EVENT_STREAM_CHUNK_SIZE = 1  # Events are short, larger chunks would block until they are filled.
+RETRY_BACKOFF_FACTOR = 0.2
+POLLING_STEP = 2
+MIN_POLLING_DELAY = 1.0  # Backoff of the active measurement polling in seconds
+MAX_POLLING_DELAY = 8.0  # Bounds the delay until a started measurement is noticed without events.
+LAST_GOOD_SERVER_URL_HEAD_START = 1.0  # Seconds the last responding URL is probed alone before all are raced.
+LATENCY_SMOOTHING_FACTOR = 0.3
+CACHED_CONNECTION_POOLS = 4  # One pool per server URL, so switching URLs keeps the connections.
+TOKEN_REFRESH_FRACTION = 0.8  # Part of the token lifetime after which the token is refreshed in the background.
+TOKEN_REFRESH_RETRY_DELAY = 5.0  # in seconds
+MIN_TOKEN_REFRESH_DELAY = 10.0  # in seconds, so short-lived tokens cannot make the sensor log in continuously
 
 logger = logging.getLogger(__name__)
 
@@ -23,131 +49,502 @@ class AuthorizationError(FluxServerError):
     """Exception raised when the authorization failed."""
 
 
+def get_polling_delay(attempt: int) -> float:
+    """Returns the delay before the next poll: exponential backoff with equal jitter between half and full delay."""
+    delay = min(MAX_POLLING_DELAY, MIN_POLLING_DELAY * 2 ** min(attempt, 16))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def get_retry_backoff(retry: int) -> float:
+    """Returns the delay before a failed request is sent again, doubling with every retry."""
+    return RETRY_BACKOFF_FACTOR * 2 ** retry
+
+
+def check_authorized(status_code: int, server_url: str) -> None:
+    """Raises an AuthorizationError if the server still rejects a request which was sent again after a new login."""
+    if status_code == 401:
+        raise AuthorizationError("Flux-server at {} rejected the token of a new login.".format(server_url))
+
+
+def get_token_expiry(token: str) -> Optional[float]:
+    """Returns the exp claim of a JSON web token in seconds since the epoch, or None if the token has none."""
+    parts = token.split(" ")[-1].split(".")
+    if len(parts) != 3:
+        return None
+    payload = parts[1] + "=" * (-len(parts[1]) % 4)
+    try:
+        expiry = json.loads(base64.urlsafe_b64decode(payload.encode()).decode()).get("exp")
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(expiry, (int, float)) or isinstance(expiry, bool):
+        return None
+    return float(expiry)
+
+
+def get_token_lifetime(token: str,
+                       configured_lifetime: float = DEFAULT_FLUX_SERVER_TOKEN_LIFETIME) -> Optional[float]:
+    """Returns the seconds the new token is valid, or None if it is unknown.
+
+    A configured lifetime takes precedence over the exp claim, which depends on the clock of the Raspberry Pi. A
+    token which already expired by that clock, e.g. before it is synchronized after a boot, has an unknown lifetime.
+    """
+    if configured_lifetime > 0:
+        return configured_lifetime
+    token_expiry = get_token_expiry(token)
+    if token_expiry is None or token_expiry <= time.time():
+        return None
+    return token_expiry - time.time()
+
+
+class TokenRefreshSchedule(object):
+    """Decides when the login token is refreshed in the background. Shared by both runtimes.
+
+    A token is refreshed after TOKEN_REFRESH_FRACTION of its lifetime, but not before MIN_TOKEN_REFRESH_DELAY. Tokens
+    with an unknown lifetime are not refreshed in the background, but only after a request was rejected with 401.
+    Failed refreshes are retried while the token is still valid. The times are taken from the monotonic clock.
+    """
+
+    def __init__(self, configured_lifetime: float = DEFAULT_FLUX_SERVER_TOKEN_LIFETIME) -> None:
+        if configured_lifetime < 0:
+            raise ValueError("Argument token_lifetime must not be negative.")
+        self._configured_lifetime = configured_lifetime
+        self._expiry_time = float("inf")
+
+    def get_refresh_delay(self, token: str, login_time: float) -> Optional[float]:
+        """Records the token of a login started at the login time and returns the delay until it is refreshed."""
+        token_lifetime = get_token_lifetime(token, self._configured_lifetime)
+        if token_lifetime is None:
+            self._expiry_time = float("inf")
+            return None
+        self._expiry_time = login_time + token_lifetime
+        return max(MIN_TOKEN_REFRESH_DELAY, token_lifetime * TOKEN_REFRESH_FRACTION)
+
+    def get_retry_delay(self) -> Optional[float]:
+        """Returns the delay until a failed refresh is retried, or None if the token expires before."""
+        if time.monotonic() + TOKEN_REFRESH_RETRY_DELAY < self._expiry_time:
+            return TOKEN_REFRESH_RETRY_DELAY
+        return None
+
+
+class Upload(object):
+    """A batch of readings posted to the Flux-server, identified by its sequence number"""
+
+    def __init__(self, sequence_number: int, data: bytes, content_encoding: str, auth_token: str,
+                 future: Future) -> None:
+        self.sequence_number = sequence_number
+        self.data = data
+        self.content_encoding = content_encoding
+        self.auth_token = auth_token
+        self.future = future
+        self._send_time = time.monotonic()
+        self._round_trip_time = None  # type: Optional[float]
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future: Future) -> None:
+        self._round_trip_time = time.monotonic() - self._send_time
+
+    def is_done(self) -> bool:
+        return self.future.done()
+
+    def get_response(self) -> requests.Response:
+        """Returns the response of the finished upload or raises its request error."""
+        return self.future.result()
+
+    def get_round_trip_time(self) -> float:
+        if self._round_trip_time is None:
+            # The done callbacks run after the waiters are woken up.
+            return time.monotonic() - self._send_time
+        return self._round_trip_time
+
+    def get_status_code(self) -> Optional[int]:
+        """Returns the HTTP status of the finished upload or None when it failed without response."""
+        if not self.future.done() or self.future.cancelled() or self.future.exception() is not None:
+            return None
+        return self.future.result().status_code
+
+
 class FluxServer:
-    RESPONSE_PENDING = 0
-    MIN_BATCH_SIZE = 3
     CONTENT_TYPE_HEADER = "content-type"
+    ACCEPT_HEADER = "Accept"
+    CONTENT_ENCODING_HEADER = "Content-Encoding"
     AUTHORIZATION_HEADER = "Authorization"
     SENSOR_DEVICE_HEADER = "X-Flux-Sensor"
     CSRF_PROTECTION_HEADER = "X-Requested-With"
 
     @staticmethod
     def log_server_response(response: requests.Response) -> None:
+        FluxServer.log_server_status(response.status_code)
+
+    @staticmethod
+    def log_server_status(status_code: int) -> None:
         description = ""
-        if response.status_code == 204:
+        if status_code == 204:
             description = " -> no active measurement available"
-        elif response.status_code == 400:
+        elif status_code == 400:
             description = " -> check firewall settings or AllowedHostsFilter from flux-server"
-        logger.info("Response: {} ({}){}".format(response.status_code, responses[response.status_code],
-                                                 description))
+        logger.info("Response: {} ({}){}".format(status_code, responses.get(status_code, "Unknown"), description))
 
-    def __init__(self, credentials: Dict[str, str]) -> None:
-        self._check_ready_counter = 0
+    def __init__(self, credentials: Dict[str, str],
+                 max_in_flight_uploads: int = DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS,
+                 connection_pool_size: int = DEFAULT_FLUX_SERVER_CONNECTION_POOL_SIZE,
+                 max_retries: int = DEFAULT_FLUX_SERVER_MAX_RETRIES, metrics: Metrics = None,
+                 token_lifetime: float = DEFAULT_FLUX_SERVER_TOKEN_LIFETIME) -> None:
+        if max_in_flight_uploads < 1:
+            raise ValueError("Argument max_in_flight_uploads must be at least 1.")
+        self._token_refresh_schedule = TokenRefreshSchedule(token_lifetime)
+        self._metrics = metrics
+        if metrics is None:
+            self._metrics = Metrics()
         self._server_url = ""
-        self._poll_route = ""
-        self._session = FuturesSession()
-        self._last_response = 200
+        self._server_urls_without_events = set()  # type: Set[str]
+        self._max_in_flight_uploads = max_in_flight_uploads
+        self._http_session = FluxServer.create_http_session(max(connection_pool_size, max_in_flight_uploads),
+                                                            max_retries)
+        self._session = FuturesSession(max_workers=max_in_flight_uploads, session=self._http_session)
+        self._uploads = collections.OrderedDict()  # type: Dict[int, Upload]
+        self._uploads_lock = threading.Lock()
+        self._next_sequence_number = 0
         self._auth_token = ""
+        self._token_refresh_timer = None  # type: Optional[threading.Timer]
+        self._login_lock = threading.RLock()  # Reentrant, as login_for_upload logs in while holding it
         self._credentials = credentials
+        self._last_good_server_url = ""
+        self._server_latencies = {}  # type: Dict[str, float]
+
+    @staticmethod
+    def create_http_session(connection_pool_size: int, max_retries: int) -> requests.Session:
+        """Creates the session shared by polling, login and uploads, which keeps its connections alive.
+
+        Connection errors are retried for all requests, read errors only for the idempotent ones.
+        """
+        retry = Retry(total=max_retries, connect=max_retries, read=max_retries, backoff_factor=RETRY_BACKOFF_FACTOR)
+        adapter = HTTPAdapter(pool_connections=CACHED_CONNECTION_POOLS, pool_maxsize=connection_pool_size,
+                              max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @staticmethod
+    def create_headers(auth_token: str) -> Dict[str, str]:
+        return {FluxServer.AUTHORIZATION_HEADER: auth_token, FluxServer.SENSOR_DEVICE_HEADER: ''}
+
+    @staticmethod
+    def create_upload_headers(auth_token: str, content_encoding: str) -> Dict[str, str]:
+        """Returns the headers of a batch of readings encoded by the ReadingEncoder."""
+        headers = FluxServer.create_headers(auth_token)
+        headers[FluxServer.CONTENT_TYPE_HEADER] = 'application/json'
+        headers[FluxServer.CSRF_PROTECTION_HEADER] = 'XMLHttpRequest'
+        if content_encoding != reading_encoder.CONTENT_ENCODING_IDENTITY:
+            headers[FluxServer.CONTENT_ENCODING_HEADER] = content_encoding
+        return headers
 
     def _get_headers(self) -> Dict[str, str]:
-        return {FluxServer.AUTHORIZATION_HEADER: self._auth_token, FluxServer.SENSOR_DEVICE_HEADER: ''}
+        return FluxServer.create_headers(self._auth_token)
+
+    def get_server_url(self) -> str:
+        return self._server_url
 
     def poll_server_urls(self, server_urls: List[str], timeout: Optional[int] = 3) -> bool:
-        for server_url in server_urls:
-            if self._poll_server_route(server_url, CHECK_SERVER_READY_ROUTE, timeout):
-                self._server_url = server_url
+        """Probes all server URLs concurrently and selects the first one that responds.
+
+        The URL which responded last time gets a short head start, so a known server is found again without probing
+        the others. The other URLs are started in the order of their measured latency.
+        """
+        if len(server_urls) == 0:
+            return False
+        deadline = float("inf")
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        if self._last_good_server_url in server_urls:
+            head_start_deadline = min(deadline, time.monotonic() + LAST_GOOD_SERVER_URL_HEAD_START)
+            if self._probe_server_url(self._last_good_server_url, head_start_deadline, threading.Event()):
+                self._select_server_url(self._last_good_server_url)
                 return True
-        return False
 
-    def poll_active_measurement(self) -> bool:
-        return self._poll_server_route(self._server_url, CHECK_ACTIVE_MEASUREMENT_ROUTE)
+        ranked_server_urls = sorted(server_urls, key=lambda url: self._server_latencies.get(url, float("inf")))
+        stop_event = threading.Event()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(ranked_server_urls))
+        try:
+            futures = {}  # type: Dict[Future, str]
+            for server_url in ranked_server_urls:
+                futures[executor.submit(self._probe_server_url, server_url, deadline, stop_event)] = server_url
+            for future in concurrent.futures.as_completed(futures):
+                if future.result():
+                    self._select_server_url(futures[future])
+                    return True
+        finally:
+            stop_event.set()
+            executor.shutdown(wait=False)
+        logger.error("Polling timeout ({}s) exceeded.".format(timeout))
+        return False
 
-    def _poll_server_route(self, server_url: str, route: str, timeout: Optional[int] = None) -> bool:
-        self._check_ready_counter = 0
+    def _select_server_url(self, server_url: str) -> None:
         self._server_url = server_url
-        self._poll_route = route
+        self._last_good_server_url = server_url
+        logger.info("Selected Flux-server at {} ({:.0f}ms)".format(server_url,
+                                                                 self._server_latencies[server_url] * 1000))
 
-        logger.info("Polling Flux-server at {}".format(self._server_url + self._poll_route))
+    def _probe_server_url(self, server_url: str, deadline: float, stop_event: threading.Event) -> bool:
+        """Polls the server URL until it responds with 200, the deadline passes or another URL won the race."""
+        logger.info("Polling Flux-server at {}".format(server_url + CHECK_SERVER_READY_ROUTE))
+        while not stop_event.is_set():
+            remaining_time = deadline - time.monotonic()
+            if remaining_time <= 0:
+                return False
+            request_timeout = None  # type: Optional[float]
+            if remaining_time != float("inf"):
+                request_timeout = remaining_time
+            start_time = time.monotonic()
+            try:
+                response = self._http_session.get(server_url + CHECK_SERVER_READY_ROUTE, headers=self._get_headers(),
+                                                  timeout=request_timeout)
+            except requests.exceptions.RequestException as re:
+                logger.debug("Polling Flux-server at {} failed: {}".format(server_url, str(re)))
+            else:
+                if response.status_code == 200:
+                    self._record_server_latency(server_url, time.monotonic() - start_time)
+                    return True
+                self.log_server_response(response)
+            stop_event.wait(max(0.0, min(POLLING_STEP, deadline - time.monotonic())))
+        return False
 
-        ignore_exceptions = (requests.exceptions.RequestException,)
-        poll_forever = False
-        if timeout is None:
-            ignore_exceptions = ()
-            poll_forever = True
+    def _record_server_latency(self, server_url: str, latency: float) -> None:
+        previous_latency = self._server_latencies.get(server_url)
+        if previous_latency is not None:
+            latency = previous_latency + LATENCY_SMOOTHING_FACTOR * (latency - previous_latency)
+        self._server_latencies[server_url] = latency
+
+    def poll_active_measurement(self) -> bool:
+        """Waits until a measurement is active. Returns False when the server cannot be reached or the login failed.
 
+        If the server provides measurement events, the sensor subscribes to them before it checks the active
+        measurement, so a measurement started in between is not missed, and waits for the next event. Otherwise the
+        active measurement is polled with exponential backoff and jitter, so an idle fleet does not poll in lockstep.
+        """
+        logger.info("Waiting for an active measurement at {}".format(self._server_url + CHECK_ACTIVE_MEASUREMENT_ROUTE))
+        attempt = 0
+        event_received = False
         try:
-            polling.poll(
-                target=lambda: requests.get(server_url + route, headers=self._get_headers()),
-                check_success=self._check_polling_success,
-                step=2,
-                step_function=self._log_polling_step,
-                ignore_exceptions=ignore_exceptions,
-                timeout=timeout,
-                poll_forever=poll_forever)
-        except polling.TimeoutException:
-            logger.error("Polling timeout ({}s) exceeded.".format(timeout))
-            return False
+            while True:
+                # After an event, the active measurement is checked right away, without subscribing again first.
+                event_stream = None
+                if not event_received:
+                    event_stream = self._open_measurement_events()
+                event_received = False
+                try:
+                    response = self._http_session.get(self._server_url + CHECK_ACTIVE_MEASUREMENT_ROUTE,
+                                                      headers=self._get_headers())
+                    self.log_server_response(response)
+                    if response.status_code == 200:
+                        return True
+                    elif response.status_code == 401:
+                        self.login_at_server()
+                        continue
+                    if event_stream is not None:
+                        event_received = self._wait_for_measurement_event(event_stream)
+                        if event_received:
+                            attempt = 0  # Only a real event resets the backoff, a failing stream keeps it.
+                            continue
+                finally:
+                    if event_stream is not None:
+                        event_stream.close()
+                delay = get_polling_delay(attempt)
+                attempt += 1
+                logger.info("Polling Flux-server again in {:.1f}s".format(delay))
+                time.sleep(delay)
         except requests.exceptions.RequestException as re:
             logger.error("Error: RequestException {}".format(str(re)))
-            if re.response is not None:
-                self.log_server_response(re.response)
             return False
         except AuthorizationError as error:
             logger.error(error)
             return False
 
-        return True
-
-    def _check_polling_success(self, response: requests.Response) -> bool:
-        self.log_server_response(response)
+    def _open_measurement_events(self) -> Optional[requests.Response]:
+        """Subscribes to the measurement events. Returns None if the server does not provide them."""
+        if self._server_url in self._server_urls_without_events:
+            return None
+        response = self._request_measurement_events()
         if response.status_code == 401:
+            response.close()
             self.login_at_server()
-        return response.status_code == 200
+            response = self._request_measurement_events()
+        if response.status_code == 200 and \
+                response.headers.get(FluxServer.CONTENT_TYPE_HEADER, "").startswith(EVENT_STREAM_CONTENT_TYPE):
+            return response
+        response.close()
+        logger.info("Flux-server does not send measurement events ({}). Poll instead.".format(response.status_code))
+        self._server_urls_without_events.add(self._server_url)
+        return None
 
-    def _log_polling_step(self, step: int) -> int:
-        self._check_ready_counter += 1
-        logger.info("Polling Flux-server at {}: retry {}".format(self._server_url + self._poll_route,
-                                                                 self._check_ready_counter))
-        return step
+    def _request_measurement_events(self) -> requests.Response:
+        headers = self._get_headers()
+        headers[FluxServer.ACCEPT_HEADER] = EVENT_STREAM_CONTENT_TYPE
+        return self._http_session.get(self._server_url + MEASUREMENT_EVENTS_ROUTE, headers=headers, stream=True,
+                                      timeout=(None, EVENT_STREAM_READ_TIMEOUT))
+
+    @staticmethod
+    def _wait_for_measurement_event(event_stream: requests.Response) -> bool:
+        """Waits until the server sends an event, closes the stream or stays silent for too long.
+
+        Returns True if an event was received.
+        """
+        try:
+            for line in event_stream.iter_lines(chunk_size=EVENT_STREAM_CHUNK_SIZE):
+                if line.startswith(b"data:"):
+                    logger.info("Measurement event received")
+                    return True
+        except requests.exceptions.ConnectionError as err:
+            # Raised for read timeouts while streaming as well: neither an event nor a heartbeat arrived.
+            logger.debug("Measurement events interrupted: {}".format(str(err)))
+        return False
 
     def get_active_measurement(self) -> requests.Response:
-        return self.login_if_unauthorized(
-            lambda: requests.get(self._server_url + CHECK_ACTIVE_MEASUREMENT_ROUTE, headers=self._get_headers()))
+        response = self.login_if_unauthorized(
+            lambda: self._http_session.get(self._server_url + CHECK_ACTIVE_MEASUREMENT_ROUTE,
+                                           headers=self._get_headers()))
+        check_authorized(response.status_code, self._server_url)
+        return response
 
-    def initialize_last_response(self):
-        self._last_response = 200
+    def get_max_in_flight_uploads(self) -> int:
+        return self._max_in_flight_uploads
 
-    def reset_last_response(self):
-        self._last_response = self.RESPONSE_PENDING
+    def get_number_of_pending_uploads(self) -> int:
+        with self._uploads_lock:
+            return len(self._uploads)
 
-    def get_last_response(self):
-        return self._last_response
+    def has_free_upload_slot(self) -> bool:
+        return self.get_number_of_pending_uploads() < self._max_in_flight_uploads
 
-    def _post_callback(self, sess: FuturesSession, resp: requests.Response):
-        self._last_response = resp.status_code
-        self.log_server_response(resp)
+    def send_data_to_server(self, data: bytes,
+                            content_encoding: str = reading_encoder.CONTENT_ENCODING_IDENTITY) -> Upload:
+        """Posts a batch of readings encoded by the ReadingEncoder without waiting for the response.
 
-    def send_data_to_server(self, json_data: str) -> Future:
-        logger.info("Sending: {}".format(json_data))
-        headers = self._get_headers()
-        headers[FluxServer.CONTENT_TYPE_HEADER] = 'application/json'
-        headers[FluxServer.CSRF_PROTECTION_HEADER] = 'XMLHttpRequest'
-        return self._session.post(self._server_url + ADD_READINGS_ROUTE, data=json_data, headers=headers,
-                                  background_callback=self._post_callback)
+        Up to max_in_flight_uploads batches may be outstanding. The finished ones are collected with wait_for_uploads.
+        """
+        with self._uploads_lock:
+            sequence_number = self._next_sequence_number
+            self._next_sequence_number += 1
+        return self._post_readings(sequence_number, data, content_encoding)
+
+    def resend_upload(self, upload: Upload) -> Upload:
+        """Posts the batch of a finished upload again under its original sequence number."""
+        return self._post_readings(upload.sequence_number, upload.data, upload.content_encoding)
+
+    def resend_upload_uncompressed(self, upload: Upload) -> Upload:
+        """Posts the batch of a finished upload again as plain JSON, e.g. after the server rejected the compression."""
+        return self._post_readings(upload.sequence_number,
+                                   reading_encoder.decompress(upload.data, upload.content_encoding),
+                                   reading_encoder.CONTENT_ENCODING_IDENTITY)
+
+    def _post_readings(self, sequence_number: int, data: bytes, content_encoding: str) -> Upload:
+        logger.debug("Sending batch {} ({} bytes, {})".format(sequence_number, len(data), content_encoding))
+        headers = FluxServer.create_upload_headers(self._auth_token, content_encoding)
+        # The body is encoded completely before it is sent, as it is kept for resending, so it has a Content-Length.
+        future = self._session.post(self._server_url + ADD_READINGS_ROUTE, data=data, headers=headers)
+        upload = Upload(sequence_number, data, content_encoding, headers[FluxServer.AUTHORIZATION_HEADER], future)
+        with self._uploads_lock:
+            self._uploads[sequence_number] = upload
+        return upload
+
+    def wait_for_uploads(self, timeout: Optional[float] = None) -> List[Upload]:
+        """Waits until at least one pending upload finished and returns all finished uploads in sequence order."""
+        with self._uploads_lock:
+            futures = [upload.future for upload in self._uploads.values()]
+        if len(futures) == 0:
+            return []
+        concurrent.futures.wait(futures, timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+
+        finished_uploads = []
+        with self._uploads_lock:
+            for sequence_number, upload in list(self._uploads.items()):
+                if upload.is_done():
+                    finished_uploads.append(upload)
+                    del self._uploads[sequence_number]
+        for upload in finished_uploads:
+            status_code = upload.get_status_code()
+            if status_code is None:
+                if not upload.future.cancelled():
+                    self._metrics.upload_errors.inc()
+            else:
+                self._metrics.upload_seconds.observe(upload.get_round_trip_time())
+                logger.info("Batch {} finished".format(upload.sequence_number))
+                self.log_server_response(upload.get_response())
+        return finished_uploads
+
+    def cancel_uploads(self) -> None:
+        """Cancels all pending uploads which have not been started yet and stops tracking them."""
+        with self._uploads_lock:
+            for upload in self._uploads.values():
+                upload.future.cancel()
+            self._uploads.clear()
+
+    def login_for_upload(self, upload: Upload) -> None:
+        """Logs in again after an upload was rejected with 401, unless a newer token is already in use.
+
+        Every outstanding upload sent with the expired token is rejected as well, but only the first one triggers a
+        login.
+        """
+        with self._login_lock:
+            if upload.auth_token == self._auth_token:
+                self.login_at_server()
 
     def login_at_server(self):
+        """Logs in and schedules the refresh of the new token before it expires.
+
+        The token expires after the configured token lifetime or, if none is configured, at its exp claim. Tokens
+        without a known lifetime are only renewed after a request was rejected with 401.
+        """
         if self._server_url != "":
             login_route = self._server_url + LOGIN_ROUTE
             json_data = json.dumps(self._credentials, default=lambda o: o.__dict__)
             headers = {FluxServer.CONTENT_TYPE_HEADER: 'application/json'}
-            response = requests.post(login_route, data=json_data, headers=headers)
-            if response.status_code == 401:
-                raise AuthorizationError(
-                    "Login Flux-server at {} failed. Wrong password or username configured.".format(login_route))
-            self._auth_token = response.text
+            with self._login_lock:
+                start_time = time.monotonic()
+                response = self._http_session.post(login_route, data=json_data, headers=headers)
+                self._metrics.login_seconds.observe(time.monotonic() - start_time)
+                if response.status_code == 401:
+                    raise AuthorizationError(
+                        "Login Flux-server at {} failed. Wrong password or username configured.".format(login_route))
+                self._auth_token = response.text
+                refresh_delay = self._token_refresh_schedule.get_refresh_delay(response.text, start_time)
+                if refresh_delay is None:
+                    self.cancel_token_refresh()
+                else:
+                    self._schedule_token_refresh(refresh_delay)
             logger.info("Login Flux-server at {} successful".format(login_route))
 
+    def cancel_token_refresh(self) -> None:
+        with self._login_lock:
+            if self._token_refresh_timer is not None:
+                self._token_refresh_timer.cancel()
+                self._token_refresh_timer = None
+
+    def _schedule_token_refresh(self, delay: float) -> None:
+        with self._login_lock:
+            self.cancel_token_refresh()
+            self._token_refresh_timer = threading.Timer(delay, self._refresh_token, [self._auth_token])
+            self._token_refresh_timer.daemon = True
+            self._token_refresh_timer.start()
+
+    def _refresh_token(self, auth_token: str) -> None:
+        """Logs in again on the timer thread. The new token is used by all requests sent after the login."""
+        try:
+            with self._login_lock:
+                if auth_token != self._auth_token:
+                    return  # Already renewed after a 401
+                logger.debug("Refreshing the login token")
+                self.login_at_server()
+        except requests.exceptions.RequestException as err:
+            logger.warning("Refreshing the login token failed: {}".format(str(err)))
+            with self._login_lock:
+                retry_delay = self._token_refresh_schedule.get_retry_delay()
+                if retry_delay is not None:
+                    self._schedule_token_refresh(retry_delay)
+        except AuthorizationError as error:
+            logger.error(error)
+
     def login_if_unauthorized(self, server_request: Callable[[], requests.Response]) -> requests.Response:
         response = server_request()
         if response.status_code == 401:
@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 
+from typing import Dict, Optional
 from enum import IntEnum
 from smbus2 import SMBus
+import time
+import logging
 
 
 class BitValues(IntEnum):
@@ -24,6 +27,10 @@ class ConfigRegister(IntEnum):
     ID_REGISTER = 0x92  # ID Register with Part Number Identification
 
 
+class StatusRegister(IntEnum):
+    STATUS_REGISTER = 0x93  # ALS interrupt and saturation flags. Bits are cleared by writing 1.
+
+
 class DataRegister(IntEnum):
     CH0DATAL_REGISTER = 0X94  # Low Byte of CH0 ADC data. Contains Z data.
     CH1DATAL_REGISTER = 0X96  # Low Byte of CH1 ADC data. Contains Y data.
@@ -31,11 +38,27 @@ class DataRegister(IntEnum):
     CH3DATAL_REGISTER = 0X9A  # Low Byte of CH3 ADC data. Contains X or IR2 data (depends on ALS_MULTIPLEXER).
 
 
+CONFIG_REGISTER_BLOCK_LENGTH = ConfigRegister.ID_REGISTER - ConfigRegister.ENABLE_REGISTER + 1  # 0x80 to 0x92
+SHADOWED_REGISTERS = frozenset(register.value for register in ConfigRegister)
+CHANNEL_DATA_LENGTH = 8  # CH0 to CH3 with two bytes each, read in one block starting at CH0DATAL_REGISTER.
+INTEGRATION_CYCLE_TIME = 2.78  # Duration of one ALS integration cycle in ms. ATIME=n integrates n + 1 cycles.
+WLONG_FACTOR = 12  # WLONG multiplies the wait time by 12.
+CYCLE_TIME_TOLERANCE = 0.1  # The internal oscillator may deviate by up to 10% from the nominal cycle time.
+STATUS_POLL_INTERVAL = 0.002  # Seconds between reads of the ALS interrupt flag after the scheduled cycle end.
+MAX_MISSED_INTERRUPTS = 3  # Consecutive cycles without ALS interrupt flag after which only the timer is used.
+
+logger = logging.getLogger(__name__)
+
+
 # ENABLE_REGISTER
 WAIT_ENABLE = BitValues.BIT_3  # This bit activates the wait feature. (1=enabled / 0=disabled)
 ALS_ENABLE = BitValues.BIT_1  # This bit activates the ALS function (start measurement). (1=enabled / 0=disabled)
 POWER_ON = BitValues.BIT_0  # This bit activates the internal oscillator (power ON). (1=enabled / 0=disabled)
 
+# STATUS_REGISTER
+ALS_SATURATION = BitValues.BIT_7  # Set when the ALS was saturated during the last cycle.
+ALS_INTERRUPT = BitValues.BIT_4  # Set after every ALS cycle while the persistence filter (APERS) is 0.
+
 # CFG0_REGISTER
 RESET_CFG0 = BitValues.BIT_7  # Reserved. Must be set to 0b10000000.
 
@@ -50,6 +73,72 @@ class AlsGainControl(IntEnum):
     AGAIN_64x = 0b11
 
 
+ALS_GAIN_FACTORS = {
+    AlsGainControl.AGAIN_1x: 1,
+    AlsGainControl.AGAIN_4x: 4,
+    AlsGainControl.AGAIN_16x: 16,
+    AlsGainControl.AGAIN_64x: 64
+}
+
+
+# Settings of the auto-ranging from the least to the most sensitive. The shortest integration time is used with all
+# gains first; longer integrations are only used in the dark. Adjacent ranges differ by a factor of 4 at most.
+AUTO_RANGES = (
+    (AlsGainControl.AGAIN_1x, 17),  # 50 ms
+    (AlsGainControl.AGAIN_4x, 17),
+    (AlsGainControl.AGAIN_16x, 17),
+    (AlsGainControl.AGAIN_64x, 17),
+    (AlsGainControl.AGAIN_64x, 71),  # 200 ms
+    (AlsGainControl.AGAIN_64x, 255)  # 712 ms
+)
+DEFAULT_AUTO_RANGE_INDEX = 2
+MAX_CHANNEL_COUNT = 65535
+COUNTS_PER_INTEGRATION_CYCLE = 1024
+REFERENCE_ATIME = 53  # The setting the readings sent to Flux-server are scaled to, used before the auto-ranging
+REFERENCE_GAIN_FACTOR = 4
+SATURATION_THRESHOLD = 0.8  # Fraction of the full scale above which a less sensitive range is selected.
+NOISE_FLOOR_THRESHOLD = 0.15  # Fraction of the full scale below which a more sensitive range is selected.
+
+
+class ChannelData(object):
+    """Raw ADC counts of the four channels from one integration cycle"""
+    __slots__ = ("x", "y", "z", "ir1")
+
+    def __init__(self, x: int, y: int, z: int, ir1: int) -> None:
+        self.x = x
+        self.y = y
+        self.z = z
+        self.ir1 = ir1
+
+    def get_x(self) -> int:
+        return self.x
+
+    def get_y(self) -> int:
+        return self.y
+
+    def get_z(self) -> int:
+        return self.z
+
+    def get_ir1(self) -> int:
+        return self.ir1
+
+
+class LightSample(object):
+    """Illuminance of one integration cycle and whether it was not returned before"""
+    __slots__ = ("lux_value", "time_stamp", "is_fresh")
+
+    def __init__(self, lux_value: float, time_stamp: float, is_fresh: bool = True) -> None:
+        self.lux_value = lux_value
+        self.time_stamp = time_stamp  # Middle of the integration in seconds of time.monotonic()
+        self.is_fresh = is_fresh
+
+    def get_lux_value(self) -> float:
+        return self.lux_value
+
+    def get_time_stamp(self) -> float:
+        return self.time_stamp
+
+
 class LightSensorError(Exception):
     """Base class for exceptions in this module."""
 
@@ -64,13 +153,26 @@ class LightSensor(object):
     def __init__(self, device_address: int, device: SMBus) -> None:
         self._bus = device
         self._device_address = device_address
+        self._atime = 0
+        self._wtime = 0
+        self._wlong = 0
+        self._is_wait_enabled = False
+        self._gain = AlsGainControl.AGAIN_4x
+        self._next_cycle_end = None  # type: Optional[float]
+        self._last_sample = None  # type: Optional[LightSample]
+        self._is_auto_range_enabled = False
+        self._auto_range_index = DEFAULT_AUTO_RANGE_INDEX
+        self._is_saturated = False
+        self._is_interrupt_flag_used = True
+        self._missed_interrupt_count = 0
+        self._register_cache = {}  # type: Dict[int, int]
         self._is_initialized = False
 
     @staticmethod
     def get_device(i2c_port: int = 1):
-        """0 = /dev/i2c-0 (port I2C0), 1 = /dev/i2c-1 (port I2C1)"""
-        if i2c_port < 0 or i2c_port > 1:
-            raise ValueError("Argument I2C-port must be between 0 and 1.")
+        """n = /dev/i2c-n, e.g. 1 = /dev/i2c-1 (port I2C1). Further ports are added with device tree overlays."""
+        if i2c_port < 0:
+            raise ValueError("Argument I2C-port must not be negative.")
         return SMBus(i2c_port)
 
     def check_for_initialization(self) -> None:
@@ -85,12 +187,36 @@ class LightSensor(object):
         return self._is_initialized
 
     def read_register(self, register_address: IntEnum) -> int:
+        """Reads a register. Configuration registers are answered from the register cache once it is loaded."""
+        cached_value = self._register_cache.get(register_address)
+        if cached_value is not None:
+            return cached_value
         self.check_register_address(register_address)
         return self._bus.read_byte_data(self._device_address, register_address)
 
     def write_register(self, register_address: IntEnum, bit_value: int) -> None:
+        """Writes a register. Writes that would not change a cached configuration register are skipped."""
+        if self._register_cache.get(register_address) == bit_value:
+            return
         self.check_register_address(register_address)
-        self._bus.write_byte_data(self._device_address, register_address, bit_value)
+        try:
+            self._bus.write_byte_data(self._device_address, register_address, bit_value)
+        except OSError:
+            self.clear_register_cache()  # The state of the device is unknown after a failed write.
+            raise
+        if register_address in SHADOWED_REGISTERS:
+            self._register_cache[register_address] = bit_value
+
+    def load_register_cache(self) -> None:
+        """Reads all configuration registers in one I2C transaction into the write-through register cache."""
+        byte_values = self._bus.read_i2c_block_data(self._device_address, ConfigRegister.ENABLE_REGISTER,
+                                                    CONFIG_REGISTER_BLOCK_LENGTH)
+        self._register_cache = {register: byte_values[register - ConfigRegister.ENABLE_REGISTER]
+                                for register in SHADOWED_REGISTERS}
+
+    def clear_register_cache(self) -> None:
+        """Forgets the cached configuration, e.g. after the sensor lost power."""
+        self._register_cache = {}
 
     def read_16bit_register(self, register_address: IntEnum) -> int:
         self.check_register_address(register_address)
@@ -101,7 +227,14 @@ class LightSensor(object):
         """Returns the 6 Bit Part Number Identification (e.g. 110111=TCS3430)"""
         return self.read_register(ConfigRegister.ID_REGISTER) >> 2
 
-    def initialize(self, atime: int = 53, wtime: int = 0, wlong: int = 0) -> None:
+    def initialize(self, atime: int = 53, wtime: int = 0, wlong: int = 0, auto_range: bool = False) -> None:
+        """Configures the sensor. With auto_range, the gain and ATIME follow the light level and atime is ignored."""
+        gain = AlsGainControl.AGAIN_4x
+        if auto_range:
+            self._auto_range_index = DEFAULT_AUTO_RANGE_INDEX
+            gain, atime = AUTO_RANGES[self._auto_range_index]
+        self._is_auto_range_enabled = auto_range
+
         if atime < 0 or atime > 256:
             raise ValueError("Argument ATIME must be between 0 and 256.")
         elif wtime < 0 or wtime > 256:
@@ -109,10 +242,16 @@ class LightSensor(object):
         elif wlong < 0 or wlong > 1:
             raise ValueError("Argument WLONG must be between 0 and 1.")
 
+        if len(self._register_cache) == 0:
+            self.load_register_cache()
         self.write_register(ConfigRegister.ATIME_REGISTER, atime)
         self.write_register(ConfigRegister.WTIME_REGISTER, wtime)
         self.write_register(ConfigRegister.CFG0_REGISTER, RESET_CFG0 | (wlong * 4))
-        self.write_register(ConfigRegister.CFG1_REGISTER, AlsGainControl.AGAIN_4x)
+        self.write_register(ConfigRegister.CFG1_REGISTER, gain)
+        self._atime = atime
+        self._wtime = wtime
+        self._wlong = wlong
+        self._gain = gain
 
         self.startup()
         self.print_device_configuration()
@@ -121,6 +260,11 @@ class LightSensor(object):
 
     def startup(self) -> None:
         self.write_register(ConfigRegister.ENABLE_REGISTER, ALS_ENABLE | POWER_ON)
+        self._is_wait_enabled = False
+        self._next_cycle_end = None
+        self._last_sample = None
+        self._is_interrupt_flag_used = True
+        self._missed_interrupt_count = 0
 
     def print_device_configuration(self) -> None:
         print("---------------------------------------------")
@@ -130,10 +274,146 @@ class LightSensor(object):
             print("{0: >16}\t0x{1:02x}\t{2:08b}\t{2}".format(register.name, register.value, configValue))
         print("---------------------------------------------")
 
+    def get_integration_time(self) -> float:
+        """Returns the configured ALS integration time in ms."""
+        return (self._atime + 1) * INTEGRATION_CYCLE_TIME
+
+    def get_wait_time(self) -> float:
+        """Returns the wait time between two integrations in ms."""
+        if not self._is_wait_enabled:
+            return 0.0
+        return (self._wtime + 1) * INTEGRATION_CYCLE_TIME * (WLONG_FACTOR if self._wlong else 1)
+
+    def get_cycle_time(self) -> float:
+        """Returns the time in ms after which the sensor provides new data."""
+        return self.get_integration_time() + self.get_wait_time()
+
+    def get_gain_factor(self) -> int:
+        return ALS_GAIN_FACTORS[self._gain]
+
+    def get_full_scale(self) -> int:
+        """Returns the maximum channel count with the configured integration time."""
+        return min(MAX_CHANNEL_COUNT, (self._atime + 1) * COUNTS_PER_INTEGRATION_CYCLE)
+
+    def is_auto_range_enabled(self) -> bool:
+        return self._is_auto_range_enabled
+
+    def has_new_data(self) -> bool:
+        """Returns whether an integration cycle completed since the last call and clears the flag."""
+        status = self.read_register(StatusRegister.STATUS_REGISTER)
+        if not status & ALS_INTERRUPT:
+            return False
+        self._is_saturated = bool(status & ALS_SATURATION)
+        self.write_register(StatusRegister.STATUS_REGISTER, status & (ALS_INTERRUPT | ALS_SATURATION))
+        return True
+
+    def sample(self, wait: bool = True) -> LightSample:
+        """Returns the illuminance of the latest completed integration cycle.
+
+        The next cycle end is scheduled from ATIME and WTIME, and the ALS interrupt flag (set after every cycle
+        because the persistence filter is off) confirms it. Until then the status register is not polled. With wait,
+        the call blocks until the next cycle has completed. Without, it returns the previous sample flagged as not
+        fresh, without any bus transaction before the scheduled cycle end.
+
+        If the interrupt flag is not set for MAX_MISSED_INTERRUPTS cycles in a row, the flag is no longer read and
+        every cycle is assumed to be complete after its maximum cycle time, until the sensor is started again.
+
+        With auto-ranging, a saturated cycle is discarded and measured again with a less sensitive range.
+        """
+        self.check_for_initialization()
+        while True:
+            cycle_time = self.get_cycle_time() / 1000
+            if self._next_cycle_end is not None and time.monotonic() < self._next_cycle_end:
+                if not wait and self._last_sample is not None:
+                    return self._get_repeated_sample()
+                time.sleep(max(0.0, self._next_cycle_end - time.monotonic()))
+
+            deadline = time.monotonic() + cycle_time * (1 + CYCLE_TIME_TOLERANCE)
+            while self._is_interrupt_flag_used and not self.has_new_data():
+                if not wait and self._last_sample is not None:
+                    return self._get_repeated_sample()
+                elif time.monotonic() >= deadline:
+                    self._record_missed_interrupt()
+                    break
+                time.sleep(STATUS_POLL_INTERVAL)
+            else:
+                self._missed_interrupt_count = 0
+
+            cycle_end = time.monotonic()
+            if self._is_interrupt_flag_used:
+                self._next_cycle_end = cycle_end + cycle_time * (1 - CYCLE_TIME_TOLERANCE)
+            else:
+                self._next_cycle_end = cycle_end + cycle_time * (1 + CYCLE_TIME_TOLERANCE)
+            channels = self.read_all_channels()
+            illuminance = self.calculate_luminance(channels)
+            integration_middle = cycle_end - self.get_integration_time() / 2000
+            range_step = 0
+            if self._is_auto_range_enabled:
+                range_step = self._get_auto_range_step(channels)
+                if range_step != 0:
+                    self._set_auto_range(self._auto_range_index + range_step)
+            if range_step >= 0:
+                break  # Readings close to the noise floor are still valid, saturated ones are measured again.
+
+        self._last_sample = LightSample(illuminance, integration_middle)
+        return self._last_sample
+
+    def _record_missed_interrupt(self) -> None:
+        self._missed_interrupt_count += 1
+        if self._missed_interrupt_count < MAX_MISSED_INTERRUPTS:
+            logger.debug("Light sensor did not signal a completed integration cycle in time.")
+            return
+        self._is_interrupt_flag_used = False
+        logger.warning("Light sensor did not signal {} integration cycles in a row. The cycles are timed without the "
+                       "interrupt flag from now on.".format(self._missed_interrupt_count))
+
+    def _get_auto_range_step(self, channels: ChannelData) -> int:
+        """Returns -1 to select a less sensitive range, 1 to select a more sensitive one or 0 to stay."""
+        max_count = max(channels.get_x(), channels.get_y(), channels.get_z())
+        full_scale = self.get_full_scale()
+        if (self._is_saturated or max_count >= full_scale * SATURATION_THRESHOLD) and self._auto_range_index > 0:
+            return -1
+        elif max_count < full_scale * NOISE_FLOOR_THRESHOLD and self._auto_range_index < len(AUTO_RANGES) - 1:
+            return 1
+        return 0
+
+    def _set_auto_range(self, index: int) -> None:
+        """Switches gain and ATIME. The ALS is restarted, so the next cycle is integrated with the new range only."""
+        self._auto_range_index = index
+        self._gain, self._atime = AUTO_RANGES[index]
+        self.write_register(ConfigRegister.ENABLE_REGISTER, POWER_ON)
+        self.write_register(ConfigRegister.ATIME_REGISTER, self._atime)
+        self.write_register(ConfigRegister.CFG1_REGISTER, self._gain)
+        self.write_register(ConfigRegister.ENABLE_REGISTER, ALS_ENABLE | POWER_ON)
+        self.has_new_data()  # Clears the flags of the interrupted cycle.
+        self._next_cycle_end = time.monotonic() + self.get_cycle_time() / 1000 * (1 - CYCLE_TIME_TOLERANCE)
+        logger.debug("Light sensor range changed to gain {}x and {:.0f} ms integration time".format(
+            self.get_gain_factor(), self.get_integration_time()))
+
+    def _get_repeated_sample(self) -> LightSample:
+        return LightSample(self._last_sample.get_lux_value(), self._last_sample.get_time_stamp(), False)
+
     def do_measurement(self) -> float:
+        """Returns the luminance as Y counts of the reference setting, see calculate_luminance."""
         self.check_for_initialization()
-        y = self.read_y_data()
-        return y  # The tristimulus value Y alone is defined as the luminance.
+        return self.calculate_luminance(self.read_all_channels())
+
+    def read_all_channels(self) -> ChannelData:
+        """Reads CH0 to CH3 in one I2C transaction, so all values belong to the same integration cycle."""
+        byte_values = self._bus.read_i2c_block_data(self._device_address, DataRegister.CH0DATAL_REGISTER,
+                                                    CHANNEL_DATA_LENGTH)
+        return ChannelData(x=byte_values[7] * 256 + byte_values[6], y=byte_values[3] * 256 + byte_values[2],
+                           z=byte_values[1] * 256 + byte_values[0], ir1=byte_values[5] * 256 + byte_values[4])
+
+    def calculate_luminance(self, channels: ChannelData) -> float:
+        """Returns the Y counts scaled to the reference setting (ATIME 53 and 4x gain).
+
+        The tristimulus value Y alone is defined as the luminance. Flux-server has always stored the raw Y counts of
+        the reference setting, so the counts of other integration times and gains are scaled to it. They are no
+        calibrated lux values.
+        """
+        return channels.get_y() * ((REFERENCE_ATIME + 1) * REFERENCE_GAIN_FACTOR) / ((self._atime + 1) *
+                                                                                    self.get_gain_factor())
 
     def read_z_data(self) -> int:
         return self.read_16bit_register(DataRegister.CH0DATAL_REGISTER)
@@ -0,0 +1,132 @@
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from smbus2 import SMBus
+from flux_sensors.light_sensor.light_sensor import LightSensor, LightSample
+from flux_sensors.models import models
+from flux_sensors.config_loader import DEFAULT_MULTIPLEXER_ADDRESS
+import threading
+
+MULTIPLEXER_CHANNEL_COUNT = 8
+NO_OFFSET = models.Position(0, 0, 0)
+
+
+class I2CMultiplexer(object):
+    """TCA9548A I2C multiplexer, which connects one of its eight channels to the bus.
+
+    Sensors with the same I2C address are placed on different channels. The selected channel is remembered, so it is
+    only written when another channel is accessed. All accesses through the multiplexer hold its lock.
+    """
+
+    def __init__(self, device: SMBus, device_address: int = DEFAULT_MULTIPLEXER_ADDRESS) -> None:
+        self._bus = device
+        self._device_address = device_address
+        self._selected_channel = None  # type: Optional[int]
+        self.lock = threading.RLock()
+
+    def select_channel(self, channel: int) -> None:
+        if channel < 0 or channel >= MULTIPLEXER_CHANNEL_COUNT:
+            raise ValueError("Argument channel must be between 0 and {}.".format(MULTIPLEXER_CHANNEL_COUNT - 1))
+        if channel == self._selected_channel:
+            return
+        self._selected_channel = None
+        self._bus.write_byte(self._device_address, 1 << channel)
+        self._selected_channel = channel
+
+
+class MultiplexedBus(object):
+    """One channel of an I2C multiplexer with the interface of the SMBus used by the LightSensor"""
+
+    def __init__(self, multiplexer: I2CMultiplexer, device: SMBus, channel: int) -> None:
+        self._multiplexer = multiplexer
+        self._bus = device
+        self._channel = channel
+
+    def read_byte_data(self, device_address: int, register_address: int) -> int:
+        with self._multiplexer.lock:
+            self._multiplexer.select_channel(self._channel)
+            return self._bus.read_byte_data(device_address, register_address)
+
+    def write_byte_data(self, device_address: int, register_address: int, bit_value: int) -> None:
+        with self._multiplexer.lock:
+            self._multiplexer.select_channel(self._channel)
+            self._bus.write_byte_data(device_address, register_address, bit_value)
+
+    def read_i2c_block_data(self, device_address: int, register_address: int, length: int) -> List[int]:
+        with self._multiplexer.lock:
+            self._multiplexer.select_channel(self._channel)
+            return self._bus.read_i2c_block_data(device_address, register_address, length)
+
+
+class LightArraySample(LightSample):
+    """Illuminances of all sensors of a light sensor array from one pass, with one time stamp for all.
+
+    The lux value is the mean of all sensors.
+    """
+    __slots__ = ("lux_values", "offsets")
+
+    def __init__(self, lux_values: List[float], offsets: List[models.Position], time_stamp: float,
+                 is_fresh: bool = True) -> None:
+        super().__init__(sum(lux_values) / len(lux_values), time_stamp, is_fresh)
+        self.lux_values = lux_values
+        self.offsets = offsets
+
+
+def get_light_values(light_sample: LightSample) -> List[Tuple[float, models.Position]]:
+    """Returns the illuminance of every sensor of the sample with the offset of the sensor to the tag in mm."""
+    if isinstance(light_sample, LightArraySample):
+        return list(zip(light_sample.lux_values, light_sample.offsets))
+    return [(light_sample.get_lux_value(), NO_OFFSET)]
+
+
+class LightSensorArray(object):
+    """Several light sensors around one tag, sampled together in passes.
+
+    The sensors are grouped by their physical I2C bus and every bus is read by a reader thread of its own, so the
+    buses are read in parallel and a pass takes as long as the slowest bus. Sensors behind a multiplexer share the
+    bus of the multiplexer. Every sensor has an offset to the tag in mm along the room axes, which is added to the
+    position of the tag for its readings. All values of a pass share the mean time stamp of the sensors.
+    """
+
+    def __init__(self) -> None:
+        self._buses = OrderedDict()  # type: Dict[int, List[Tuple[LightSensor, models.Position]]]
+        self._executors = {}  # type: Dict[int, ThreadPoolExecutor]
+
+    def add_light_sensor(self, bus_id: int, light_sensor: LightSensor,
+                         offset: models.Position = NO_OFFSET) -> None:
+        """Adds a sensor. The bus ID identifies the physical bus, including the bus of a multiplexer."""
+        self._buses.setdefault(bus_id, []).append((light_sensor, offset))
+
+    def get_number_of_light_sensors(self) -> int:
+        return sum(len(sensors) for sensors in self._buses.values())
+
+    def get_offsets(self) -> List[models.Position]:
+        return [offset for sensors in self._buses.values() for light_sensor, offset in sensors]
+
+    def initialize(self, auto_range: bool = False) -> None:
+        if self.get_number_of_light_sensors() == 0:
+            raise ValueError("The light sensor array has no light sensors.")
+        for sensors in self._buses.values():
+            for light_sensor, offset in sensors:
+                light_sensor.initialize(auto_range=auto_range)
+        for bus_id in self._buses:
+            if bus_id not in self._executors:
+                self._executors[bus_id] = ThreadPoolExecutor(max_workers=1)
+
+    def close(self) -> None:
+        for executor in self._executors.values():
+            executor.shutdown()
+        self._executors.clear()
+
+    def sample(self, wait: bool = True) -> LightArraySample:
+        """Samples all sensors once, every bus on its reader thread. With wait, every sample is a fresh one."""
+        futures = [self._executors[bus_id].submit(self._sample_bus, sensors, wait)
+                   for bus_id, sensors in self._buses.items()]
+        light_samples = [light_sample for future in futures for light_sample in future.result()]
+        time_stamp = sum(light_sample.get_time_stamp() for light_sample in light_samples) / len(light_samples)
+        return LightArraySample([light_sample.get_lux_value() for light_sample in light_samples], self.get_offsets(),
+                                time_stamp, all(light_sample.is_fresh for light_sample in light_samples))
+
+    @staticmethod
+    def _sample_bus(sensors: List[Tuple[LightSensor, models.Position]], wait: bool) -> List[LightSample]:
+        return [light_sensor.sample(wait) for light_sensor, offset in sensors]
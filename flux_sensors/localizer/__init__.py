@@ -1 +1,2 @@
 from . import localizer
+from . import position_history
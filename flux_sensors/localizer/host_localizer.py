@@ -0,0 +1,65 @@
+from typing import List, Optional
+from pypozyx import DeviceCoordinates, DeviceRange, PozyxConstants, PozyxSerial
+from flux_sensors.localizer.localizer import Localizer, PozyxDeviceError
+from flux_sensors.localizer.multilateration import Multilateration, MIN_NUMBER_OF_RANGES
+from flux_sensors.models import models
+import numpy as np
+
+MAX_WARM_START_RESIDUAL = 500  # RMS range residual in mm above which the next fix is not started from this one.
+
+
+class HostLocalizer(Localizer):
+    """Positioning by multilateration on the host from raw UWB ranges to all cached anchors.
+
+    The Pozyx only measures the ranges, so neither the anchor limit nor the positioning algorithm of the firmware
+    apply. Every fix is started from the previous one and its RMS range residual is kept as quality measure.
+    Needs the optional dependency numpy.
+    """
+
+    def __init__(self, pozyx: PozyxSerial, anchors: List[DeviceCoordinates] = None, remote_id: int = None) -> None:
+        super().__init__(pozyx, anchors, remote_id=remote_id)
+        self._multilateration = None  # type: Optional[Multilateration]
+        self._last_position = None  # type: Optional[np.ndarray]
+        self._last_residual = None  # type: Optional[float]
+
+    def initialize(self) -> None:
+        """Prepares the solver for the cached anchors. The device list of the Pozyx is not used."""
+        self._check_number_of_anchors(len(self._anchors))
+        self._multilateration = Multilateration(
+            np.array([[anchor.pos.x, anchor.pos.y, anchor.pos.z] for anchor in self._anchors], dtype=float))
+        self._last_position = None
+        self._last_residual = None
+        self._is_initialized = True
+
+    def get_last_residual(self) -> Optional[float]:
+        """Returns the RMS range residual of the last fix in mm."""
+        return self._last_residual
+
+    def do_ranging(self) -> np.ndarray:
+        """Returns the distances to all cached anchors in mm. Failed ranges are NaN.
+
+        The Pozyx API only ranges with one device per call, so the anchors are ranged one after another.
+        """
+        distances = np.full(len(self._anchors), np.nan)
+        for index, anchor in enumerate(self._anchors):
+            device_range = DeviceRange()
+            status = self._pozyx.doRanging(anchor.network_id, device_range, self._remote_id)
+            if status == PozyxConstants.POZYX_SUCCESS:
+                distances[index] = device_range.distance
+        return distances
+
+    def do_positioning(self) -> models.Position:
+        """Performs ranging with all anchors and returns the position solved from it."""
+        self.check_for_initialization()
+        distances = self.do_ranging()
+        number_of_ranges = np.count_nonzero(np.isfinite(distances) & (distances > 0))
+        if number_of_ranges < MIN_NUMBER_OF_RANGES:
+            raise PozyxDeviceError("Only {} of {} anchors could be ranged.".format(number_of_ranges,
+                                                                                  len(self._anchors)))
+        position, residual = self._multilateration.solve(distances, self._last_position)
+
+        self._last_residual = residual
+        self._last_position = position
+        if residual > MAX_WARM_START_RESIDUAL or not np.all(np.isfinite(position)):
+            self._last_position = None
+        return models.Position(float(position[0]), float(position[1]), float(position[2]))
@@ -1,11 +1,12 @@
 #!/usr/bin/env python
 
-from typing import List
-from pypozyx import (Coordinates, DeviceCoordinates, SingleRegister, DeviceList, PozyxConstants,
+from typing import Dict, List, Optional, Tuple
+from pypozyx import (Coordinates, DeviceCoordinates, SingleRegister, DeviceList, NetworkID, PozyxConstants,
                      get_first_pozyx_serial_port, PozyxSerial)
 from flux_sensors.models import models
 
 NUMBER_OF_CALIBRATION_CYCLES = 10
+MIN_NUMBER_OF_ANCHORS = 4
 
 class LocalizerError(Exception):
     """Base class for exceptions in this module."""
@@ -45,6 +46,8 @@ class Localizer(object):
         self._position_filter = position_filter
         self._filter_strength = filter_strength
         self._remote_id = remote_id
+        self._device_anchors = None  # type: Optional[Dict[int, Tuple[int, int, int]]]
+        self._device_position_filter = None  # type: Optional[Tuple[int, int]]
         self._is_initialized = False
 
     @staticmethod
@@ -71,6 +74,18 @@ class Localizer(object):
     def is_initialized(self) -> bool:
         return self._is_initialized
 
+    def get_remote_id(self) -> Optional[int]:
+        return self._remote_id
+
+    def get_network_id(self) -> int:
+        """Returns the network ID of the positioned Pozyx, read from the device if it is the local one."""
+        if self._remote_id is not None:
+            return self._remote_id
+        network_id = NetworkID()
+        status = self._pozyx.getNetworkId(network_id)
+        self.check_for_device_error(status)
+        return network_id.id
+
     def add_anchor_to_cache(self, anchor_id: int, coordinates: Coordinates) -> None:
         self._is_initialized = False
         self._anchors.append(DeviceCoordinates(anchor_id, 1, coordinates))
@@ -83,13 +98,27 @@ class Localizer(object):
         return len(self._anchors)
 
     def initialize(self) -> None:
-        """Sets up the Pozyx for positioning by calibrating its anchor list."""
-        self.write_anchors_from_cache_to_device()
-        self._pozyx.setPositionFilter(self._position_filter, self._filter_strength, self._remote_id)
-        self.print_device_configuration()
-        self.check_device_configuration()
+        """Sets up the Pozyx for positioning by calibrating its anchor list.
+
+        Only the differences to the configuration already on the device are written. If nothing changed, e.g. for
+        the next measurement in the same room, the device is neither reconfigured nor calibrated again.
+        """
+        self._check_number_of_anchors(len(self._anchors))
+        configuration_changed = self.write_anchors_from_cache_to_device()
+        position_filter = (self._position_filter, self._filter_strength)
+        if self._device_position_filter != position_filter:
+            self._device_position_filter = None
+            status = self._pozyx.setPositionFilter(self._position_filter, self._filter_strength, self._remote_id)
+            self.check_for_device_error(status)
+            self._device_position_filter = position_filter
+            configuration_changed = True
+
+        if configuration_changed:
+            self.print_device_configuration()
+            self.check_device_configuration()
         self._is_initialized = True
-        self.calibratePositioning()
+        if configuration_changed:
+            self.calibratePositioning()
 
     def calibratePositioning(self) -> None:
         for i in range(0, NUMBER_OF_CALIBRATION_CYCLES):
@@ -99,25 +128,72 @@ class Localizer(object):
         self._is_initialized = False
         self.clear_anchors_in_cache()
 
-    def write_anchors_from_cache_to_device(self) -> None:
-        """Adds the cached anchors to the Pozyx's device list one for one."""
-        status = self._pozyx.clearDevices(self._remote_id)
+    def _get_cached_anchor_configuration(self) -> Dict[int, Tuple[int, int, int]]:
+        return {anchor.network_id: (anchor.pos.x, anchor.pos.y, anchor.pos.z) for anchor in self._anchors}
+
+    def read_anchors_from_device(self) -> Dict[int, Tuple[int, int, int]]:
+        """Returns the coordinates of the anchors in the Pozyx's device list by their network ID."""
+        list_size = SingleRegister()
+        status = self._pozyx.getDeviceListSize(list_size, self._remote_id)
+        self.check_for_device_error(status)
+        device_anchors = {}  # type: Dict[int, Tuple[int, int, int]]
+        if list_size[0] == 0:
+            return device_anchors
+
+        device_list = DeviceList(list_size=list_size[0])
+        status = self._pozyx.getDeviceIds(device_list, self._remote_id)
         self.check_for_device_error(status)
-        for anchor in self._anchors:
+        for device_id in device_list:
+            coordinates = Coordinates()
+            status = self._pozyx.getDeviceCoordinates(device_id, coordinates, self._remote_id)
+            self.check_for_device_error(status)
+            device_anchors[device_id] = (coordinates.x, coordinates.y, coordinates.z)
+        return device_anchors
+
+    def write_anchors_from_cache_to_device(self) -> bool:
+        """Brings the Pozyx's device list in line with the cached anchors and returns whether it was changed.
+
+        The device list is read once and then tracked. New anchors are added to it; if anchors were removed or moved,
+        the list is cleared and written again, because the Pozyx cannot update single entries in place.
+        """
+        if self._device_anchors is None:
+            self._device_anchors = self.read_anchors_from_device()
+        cached_anchors = self._get_cached_anchor_configuration()
+        if cached_anchors == self._device_anchors and len(cached_anchors) == len(self._anchors):
+            return False
+
+        device_anchors = self._device_anchors
+        self._device_anchors = None  # The device list is unknown until all writes succeeded.
+        is_extension = all(cached_anchors.get(anchor_id) == coordinates
+                           for anchor_id, coordinates in device_anchors.items())
+        if is_extension:
+            anchors_to_add = [anchor for anchor in self._anchors if anchor.network_id not in device_anchors]
+        else:
+            status = self._pozyx.clearDevices(self._remote_id)
+            self.check_for_device_error(status)
+            anchors_to_add = self._anchors
+        for anchor in anchors_to_add:
             status = self._pozyx.addDevice(anchor, self._remote_id)
             self.check_for_device_error(status)
         if len(self._anchors) > 4:
             status = self._pozyx.setSelectionOfAnchors(PozyxConstants.POZYX_ANCHOR_SEL_AUTO, len(self._anchors),
                                                        self._remote_id)
             self.check_for_device_error(status)
+        self._device_anchors = cached_anchors
+        return True
 
     def check_device_configuration(self) -> None:
         list_size = SingleRegister()
         status = self._pozyx.getDeviceListSize(list_size, self._remote_id)
         self.check_for_device_error(status)
         if list_size[0] != len(self._anchors):
+            self._device_anchors = None
             raise DeviceConfigurationError("The anchors configured in cache do not match with the list on the device.")
-        if list_size[0] < 4:
+        self._check_number_of_anchors(list_size[0])
+
+    @staticmethod
+    def _check_number_of_anchors(number_of_anchors: int) -> None:
+        if number_of_anchors < MIN_NUMBER_OF_ANCHORS:
             raise DeviceConfigurationError(
                 "There must be at least 4 anchors configured to use Pozyx for 3D positioning")
 
@@ -0,0 +1,89 @@
+from typing import Optional, Tuple
+import numpy as np
+
+MIN_NUMBER_OF_RANGES = 4  # Ranges needed for a 3D fix
+MAX_ITERATIONS = 10
+CONVERGENCE_TOLERANCE = 0.1  # Position update in mm below which the iteration stops.
+DAMPING = 1e-6  # Keeps the normal equations solvable when the anchor geometry is degenerate.
+MIN_RANGE = 1e-3
+MAX_PLANE_DEVIATION = 100  # RMS distance in mm of the anchors from their best-fit plane up to which they are coplanar.
+
+
+class Multilateration(object):
+    """Least-squares solver for a position from ranges to anchors with known coordinates.
+
+    The fix is refined with Gauss-Newton iterations on the range residuals, started from the given initial position
+    (e.g. the previous fix) or from a linearized least-squares estimate. Missing ranges are passed as NaN and ignored.
+
+    Ranges to coplanar anchors (e.g. all mounted at the same height) do not determine on which side of the anchor plane
+    the tag is. For them the estimate is solved within the plane and the tag is placed below it.
+    """
+
+    def __init__(self, anchor_coordinates: np.ndarray) -> None:
+        self._anchors = np.asarray(anchor_coordinates, dtype=float).reshape(-1, 3)
+        self._centroid = self._anchors.mean(axis=0)
+        _, singular_values, axes = np.linalg.svd(self._anchors - self._centroid)
+        self._plane_axes = axes[:2]
+        self._plane_normal = axes[2] if axes[2, 2] <= 0 else -axes[2]
+        self._is_coplanar = (len(singular_values) < 3 or
+                             singular_values[2] / np.sqrt(len(self._anchors)) < MAX_PLANE_DEVIATION)
+
+    def get_number_of_anchors(self) -> int:
+        return len(self._anchors)
+
+    def is_coplanar(self) -> bool:
+        return self._is_coplanar
+
+    def solve(self, distances: np.ndarray, initial_position: Optional[np.ndarray] = None) -> Tuple[np.ndarray, float]:
+        """Returns the position and the RMS range residual in mm for the distances to all anchors."""
+        distances = np.asarray(distances, dtype=float).reshape(-1)
+        if len(distances) != len(self._anchors):
+            raise ValueError("Expected one distance per anchor.")
+        is_valid = np.isfinite(distances) & (distances > 0)
+        number_of_ranges = np.count_nonzero(is_valid)
+        if number_of_ranges < MIN_NUMBER_OF_RANGES:
+            raise ValueError("A fix needs at least {} valid ranges.".format(MIN_NUMBER_OF_RANGES))
+        anchors = self._anchors[is_valid]
+        distances = distances[is_valid]
+
+        if initial_position is None:
+            position = self._estimate_linear(anchors, distances)
+        else:
+            position = np.array(initial_position, dtype=float).reshape(3)
+        damping = DAMPING * np.eye(3)
+        for iteration in range(0, MAX_ITERATIONS):
+            residuals, jacobian = self._linearize(position, anchors, distances)
+            step = np.linalg.solve(jacobian.T.dot(jacobian) + damping, jacobian.T.dot(residuals))
+            position -= step
+            if np.max(np.abs(step)) < CONVERGENCE_TOLERANCE:
+                break
+
+        residuals, _ = self._linearize(position, anchors, distances)
+        return position, float(np.sqrt((residuals ** 2).sum() / number_of_ranges))
+
+    @staticmethod
+    def _linearize(position: np.ndarray, anchors: np.ndarray, distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        offsets = position - anchors
+        ranges = np.maximum(np.linalg.norm(offsets, axis=1), MIN_RANGE)
+        return ranges - distances, offsets / ranges[:, np.newaxis]
+
+    def _estimate_linear(self, anchors: np.ndarray, distances: np.ndarray) -> np.ndarray:
+        """Subtracts the sphere equation of the first anchor from the others and solves the linear system.
+
+        For coplanar anchors the system is solved in plane coordinates and the distance from the plane follows from the
+        ranges, because the component along the plane normal is not observable in the linear system.
+        """
+        if not self._is_coplanar:
+            return self._solve_differences(anchors, distances)
+        planar_anchors = (anchors - self._centroid).dot(self._plane_axes.T)
+        planar_position = self._solve_differences(planar_anchors, distances)
+        squared_heights = distances ** 2 - ((planar_anchors - planar_position) ** 2).sum(axis=1)
+        height = np.sqrt(max(float(squared_heights.mean()), 0.0))
+        return self._centroid + planar_position.dot(self._plane_axes) + height * self._plane_normal
+
+    @staticmethod
+    def _solve_differences(anchors: np.ndarray, distances: np.ndarray) -> np.ndarray:
+        squared_norms = (anchors ** 2).sum(axis=1)
+        matrix = 2 * (anchors[1:] - anchors[0])
+        vector = squared_norms[1:] - squared_norms[0] - distances[1:] ** 2 + distances[0] ** 2
+        return np.linalg.lstsq(matrix, vector, rcond=None)[0]
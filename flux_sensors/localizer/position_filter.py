@@ -0,0 +1,92 @@
+from typing import Optional, Tuple
+from flux_sensors.models import models
+import numpy as np
+
+DEFAULT_MEASUREMENT_NOISE = 100.0  # Standard deviation of a fix per axis in mm
+DEFAULT_ACCELERATION_NOISE = 1000.0  # Standard deviation of the acceleration per axis in mm/s^2
+DEFAULT_OUTLIER_THRESHOLD = 16.27  # Squared Mahalanobis distance (chi-square, 3 degrees of freedom, 99.9%)
+MAX_CONSECUTIVE_OUTLIERS = 5  # Rejected fixes in a row after which the filter restarts at the current fix.
+INITIAL_VELOCITY_VARIANCE = 1000.0 ** 2
+
+
+class PositionFilter(object):
+    """Constant-velocity Kalman filter with outlier rejection for the positions of one tag.
+
+    The three axes are independent, so the state is kept as arrays of position and velocity per axis and all axes are
+    predicted and updated at once. Fixes whose innovation is too unlikely are rejected as outliers. Every accepted fix
+    is returned with its uncertainty: the square root of the trace of the position covariance in mm.
+    """
+
+    def __init__(self, measurement_noise: float = DEFAULT_MEASUREMENT_NOISE,
+                 acceleration_noise: float = DEFAULT_ACCELERATION_NOISE,
+                 outlier_threshold: float = DEFAULT_OUTLIER_THRESHOLD) -> None:
+        self._measurement_variance = measurement_noise ** 2
+        self._acceleration_variance = acceleration_noise ** 2
+        self._outlier_threshold = outlier_threshold
+        self._state = np.zeros((3, 2))  # Position and velocity per axis
+        self._covariance = np.zeros((3, 2, 2))
+        self._time_stamp = None  # type: Optional[float]
+        self._consecutive_outliers = 0
+
+    def reset(self) -> None:
+        self._time_stamp = None
+        self._consecutive_outliers = 0
+
+    def get_uncertainty(self) -> Optional[float]:
+        if self._time_stamp is None:
+            return None
+        return float(np.sqrt(self._covariance[:, 0, 0].sum()))
+
+    def update(self, time_stamp: float, position: models.Position) -> Optional[models.Position]:
+        """Filters a fix taken at the time stamp in seconds. Returns None if the fix is rejected as outlier."""
+        measurement = np.array([position.get_x(), position.get_y(), position.get_z()], dtype=float)
+        if self._time_stamp is None or self._consecutive_outliers >= MAX_CONSECUTIVE_OUTLIERS:
+            self._start(time_stamp, measurement)
+            return self._get_position()
+
+        self._predict(max(0.0, time_stamp - self._time_stamp))
+        self._time_stamp = max(self._time_stamp, time_stamp)
+        innovation = measurement - self._state[:, 0]
+        innovation_variance = self._covariance[:, 0, 0] + self._measurement_variance
+        if (innovation ** 2 / innovation_variance).sum() > self._outlier_threshold:
+            self._consecutive_outliers += 1
+            return None
+
+        self._consecutive_outliers = 0
+        gain = self._covariance[:, :, 0] / innovation_variance[:, np.newaxis]
+        self._state += gain * innovation[:, np.newaxis]
+        self._covariance -= gain[:, :, np.newaxis] * self._covariance[:, np.newaxis, 0, :]
+        return self._get_position()
+
+    def filter_fixes(self, time_stamps: np.ndarray,
+                     positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Filters the fixes (n x 3) in order and returns the filtered positions, uncertainties and accepted mask."""
+        filtered_positions = np.full((len(positions), 3), np.nan)
+        uncertainties = np.full(len(positions), np.nan)
+        is_accepted = np.zeros(len(positions), dtype=bool)
+        for index in range(0, len(positions)):
+            filtered_position = self.update(float(time_stamps[index]), models.Position(*positions[index]))
+            if filtered_position is not None:
+                filtered_positions[index] = (filtered_position.get_x(), filtered_position.get_y(),
+                                             filtered_position.get_z())
+                uncertainties[index] = filtered_position.get_uncertainty()
+                is_accepted[index] = True
+        return filtered_positions, uncertainties, is_accepted
+
+    def _start(self, time_stamp: float, measurement: np.ndarray) -> None:
+        self._state[:, 0] = measurement
+        self._state[:, 1] = 0.0
+        self._covariance[:] = np.diag([self._measurement_variance, INITIAL_VELOCITY_VARIANCE])
+        self._time_stamp = time_stamp
+        self._consecutive_outliers = 0
+
+    def _predict(self, time_step: float) -> None:
+        transition = np.array([[1.0, time_step], [0.0, 1.0]])
+        noise_gain = np.array([time_step ** 2 / 2, time_step])
+        self._state = self._state @ transition.T
+        self._covariance = (transition @ self._covariance @ transition.T +
+                            self._acceleration_variance * np.outer(noise_gain, noise_gain))
+
+    def _get_position(self) -> models.Position:
+        return models.Position(float(self._state[0, 0]), float(self._state[1, 0]), float(self._state[2, 0]),
+                               self.get_uncertainty())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+from typing import Optional
+from collections import deque
+from bisect import bisect_left
+from flux_sensors.models import models
+import threading
+
+DEFAULT_HISTORY_SIZE = 32
+
+
+class PositionHistory(object):
+    """Time-indexed history of the most recent positions, used to align positions with other samples
+
+    The timestamps are taken from time.monotonic(), so a clock step of the system time cannot reorder them.
+    """
+
+    def __init__(self, size: int = DEFAULT_HISTORY_SIZE) -> None:
+        self._timestamps = deque(maxlen=size)  # type: deque
+        self._positions = deque(maxlen=size)  # type: deque
+        self._condition = threading.Condition()
+
+    def add_position(self, timestamp: float, position: models.Position) -> None:
+        with self._condition:
+            if len(self._timestamps) > 0 and timestamp < self._timestamps[-1]:
+                return  # Out-of-order samples would break the sorted index.
+            self._timestamps.append(timestamp)
+            self._positions.append(position)
+            self._condition.notify_all()
+
+    def clear(self) -> None:
+        with self._condition:
+            self._timestamps.clear()
+            self._positions.clear()
+
+    def is_empty(self) -> bool:
+        with self._condition:
+            return len(self._timestamps) == 0
+
+    def get_latest_timestamp(self) -> Optional[float]:
+        with self._condition:
+            if len(self._timestamps) == 0:
+                return None
+            return self._timestamps[-1]
+
+    def wait_for_position_after(self, timestamp: float, timeout: float) -> bool:
+        """Blocks until a position at or after the timestamp is available. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: len(self._timestamps) > 0 and self._timestamps[-1] >= timestamp, timeout)
+
+    def get_position_at(self, timestamp: float) -> Optional[models.Position]:
+        """Interpolates the position linearly at the timestamp.
+
+        Outside of the recorded time span the nearest recorded position is returned.
+        """
+        with self._condition:
+            if len(self._timestamps) == 0:
+                return None
+            index = bisect_left(self._timestamps, timestamp)
+            if index == 0:
+                return self._positions[0]
+            if index == len(self._timestamps):
+                return self._positions[-1]
+
+            start_time = self._timestamps[index - 1]
+            end_time = self._timestamps[index]
+            start = self._positions[index - 1]
+            end = self._positions[index]
+
+        if end_time == start_time:
+            return end
+        ratio = (timestamp - start_time) / (end_time - start_time)
+        uncertainty = None
+        if start.get_uncertainty() is not None and end.get_uncertainty() is not None:
+            uncertainty = max(start.get_uncertainty(), end.get_uncertainty())
+        return models.Position(start.get_x() + (end.get_x() - start.get_x()) * ratio,
+                               start.get_y() + (end.get_y() - start.get_y()) * ratio,
+                               start.get_z() + (end.get_z() - start.get_z()) * ratio, uncertainty)
@@ -0,0 +1,87 @@
+from typing import List, Tuple
+from flux_sensors.localizer.localizer import Localizer
+from flux_sensors.localizer.position_history import PositionHistory
+from flux_sensors.light_sensor.light_sensor import LightSensor
+from flux_sensors.models import models
+import threading
+import time
+
+
+class Tag(object):
+    """One measurement point: a Pozyx tag and the light sensor next to it.
+
+    The tag ID is the network ID of the Pozyx or NO_TAG_ID if only one tag is used. Every tag keeps its own position
+    history and, optionally, its own position filter.
+    """
+
+    def __init__(self, tag_id: int, localizer: Localizer, light_sensor: LightSensor, weight: int = 1,
+                 position_filter=None) -> None:
+        if weight < 1:
+            raise ValueError("Argument weight must be at least 1.")
+        self.tag_id = tag_id
+        self.localizer = localizer
+        self.light_sensor = light_sensor
+        self.weight = weight
+        self.position_filter = position_filter
+        self.position_history = PositionHistory()
+
+    def get_name(self) -> str:
+        if self.tag_id == models.NO_TAG_ID:
+            return "tag"
+        return "tag-0x{:04x}".format(self.tag_id)
+
+    def reset(self) -> None:
+        self.position_history.clear()
+        if self.position_filter is not None:
+            self.position_filter.reset()
+
+
+class TagScheduler(object):
+    """Shares the serial connection to one Pozyx among several tags.
+
+    Remote tags are positioned through the local Pozyx with their remote_id. The serial protocol handles one request
+    at a time and two remote positionings at once would collide on the UWB channel, so the Pozyx calls are serialized
+    by a lock which is held for the serial round-trip only: the light sensors of all tags are read in parallel and
+    the positions are filtered while the next tag is already being positioned.
+
+    The tags take turns by smooth weighted round-robin. A tag with weight 2 gets twice as many positionings as a tag
+    with weight 1, spread evenly instead of in bursts.
+    """
+
+    def __init__(self, tags: List[Tag]) -> None:
+        if len(tags) == 0:
+            raise ValueError("At least one tag is needed.")
+        self._tags = tags
+        self._total_weight = sum(tag.weight for tag in tags)
+        self._current_weights = [0] * len(tags)
+        self._serial_lock = threading.Lock()
+
+    def get_tags(self) -> List[Tag]:
+        return self._tags
+
+    def get_serial_lock(self) -> threading.Lock:
+        """Returns the lock every access to the shared Pozyx must hold."""
+        return self._serial_lock
+
+    def reset(self) -> None:
+        self._current_weights = [0] * len(self._tags)
+        for tag in self._tags:
+            tag.reset()
+
+    def next_tag(self) -> Tag:
+        """Returns the tag to position next."""
+        best_index = 0
+        for index, tag in enumerate(self._tags):
+            self._current_weights[index] += tag.weight
+            if self._current_weights[index] > self._current_weights[best_index]:
+                best_index = index
+        self._current_weights[best_index] -= self._total_weight
+        return self._tags[best_index]
+
+    def do_positioning(self, tag: Tag) -> Tuple[float, models.Position]:
+        """Positions the tag and returns the time stamp (of time.monotonic()) and the unfiltered position."""
+        with self._serial_lock:
+            start_time = time.monotonic()
+            position = tag.localizer.do_positioning()
+            # The position is taken somewhere within the serial round-trip, the midpoint is the best estimate.
+            return (start_time + time.monotonic()) / 2, position
@@ -0,0 +1,460 @@
+from typing import Dict, List, Optional, Tuple
+from flux_sensors.localizer.localizer import Localizer, PozyxDeviceError
+from flux_sensors.localizer.position_history import PositionHistory
+from flux_sensors.localizer.tag_scheduler import Tag, TagScheduler
+from flux_sensors.light_sensor.light_sensor import LightSensor
+from flux_sensors.light_sensor.light_sensor_array import get_light_values
+from flux_sensors.flux_server import FluxServer, FluxServerError, Upload
+from flux_sensors.models import models
+from flux_sensors.batch_policy import BatchPolicy
+from flux_sensors.metrics import Metrics
+from flux_sensors import reading_encoder
+from flux_sensors.reading_spool import ReadingSpool
+from flux_sensors.config_loader import DEFAULT_SPOOL_REPLAY_RATE
+from concurrent.futures import CancelledError
+import threading
+import queue
+import time
+import requests
+import logging
+
+# lux, x, y, z, timestamp in seconds since the epoch, position uncertainty in mm and tag ID
+ReadingValues = Tuple[float, float, float, float, float, float, int]
+# Request body, content encoding, number of readings and spool range of an encoded batch
+Payload = Tuple[bytes, str, int, Optional[Tuple[int, int]]]
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """Limits a rate of items per second, allowing bursts of up to one second"""
+
+    def __init__(self, rate: float) -> None:
+        self._rate = rate
+        self._tokens = rate
+        self._last_update = time.monotonic()
+
+    def get_available(self) -> int:
+        now = time.monotonic()
+        self._tokens = min(self._rate, self._tokens + (now - self._last_update) * self._rate)
+        self._last_update = now
+        return int(self._tokens)
+
+    def consume(self, count: int) -> None:
+        self._tokens -= count
+
+
+def get_position_uncertainty(position: models.Position) -> float:
+    """Returns the uncertainty of the position in mm or NaN if it is unknown."""
+    if position.get_uncertainty() is None:
+        return models.NO_POSITION_UNCERTAINTY
+    return position.get_uncertainty()
+
+
+def create_readings(light_values: List[Tuple[float, models.Position]], position: Optional[models.Position],
+                    time_stamp: float, tag_id: int, max_position_uncertainty: float,
+                    metrics: Metrics) -> List[ReadingValues]:
+    """Places the light values of one sample at the position of the tag plus the offset of each light sensor.
+
+    Returns no readings if the position is unknown or more uncertain than max_position_uncertainty (in mm, 0 keeps
+    all). The dropped readings are counted in the metrics. The time stamp of the sample is taken from
+    time.monotonic() and converted to wall-clock time for the readings.
+    """
+    if position is None:
+        metrics.readings_dropped.inc(len(light_values))
+        return []
+    position_uncertainty = get_position_uncertainty(position)
+    if 0 < max_position_uncertainty < position_uncertainty:
+        metrics.readings_dropped.inc(len(light_values))
+        return []
+    time_to_first_reading = metrics.record_first_reading()
+    if time_to_first_reading is not None:
+        logger.info("First reading taken {:.1f}s after the start".format(time_to_first_reading))
+    time_stamp = models.to_wall_clock_time(time_stamp)
+    return [(illuminance, position.get_x() + offset.get_x(), position.get_y() + offset.get_y(),
+             position.get_z() + offset.get_z(), time_stamp, position_uncertainty, tag_id)
+            for illuminance, offset in light_values]
+
+
+class BatchAssembler(object):
+    """Collects the readings of the next batch and picks the readings to replay from the spool.
+
+    Every reading is spooled when it is added. The assembler neither waits nor sends anything, so the threaded
+    MeasurementPipeline and the asyncio runtime share it and only do the queueing and the uploads themselves.
+    """
+
+    def __init__(self, batch_policy: BatchPolicy, encoder: reading_encoder.ReadingEncoder,
+                 spool: ReadingSpool = None, replay_rate: float = DEFAULT_SPOOL_REPLAY_RATE,
+                 metrics: Metrics = None) -> None:
+        self._batch_policy = batch_policy
+        self._reading_encoder = encoder
+        self._spool = spool
+        self._metrics = metrics
+        if metrics is None:
+            self._metrics = Metrics()
+        self._readings = models.ReadingBuffer()
+        self._replay_readings = models.ReadingBuffer()
+        self._replay_limiter = TokenBucket(replay_rate)
+        self._replay_index = 0
+        self._replay_end_index = 0
+        self._batch_start_time = time.monotonic()
+        self._batch_start_index = 0
+
+    def reset(self) -> None:
+        """Drops the collected readings. The readings left in the spool are replayed from its start."""
+        self._readings.clear()
+        if self._spool is not None:
+            self._replay_index = self._spool.get_start_index()
+            self._replay_end_index = self._spool.get_end_index()
+
+    def add(self, reading: ReadingValues) -> None:
+        spool_index = 0
+        if self._spool is not None:
+            # The position uncertainty is not spooled.
+            spool_index = self._spool.append(*reading[:5], tag_id=reading[6])
+        if len(self._readings) == 0:
+            self._batch_start_time = time.monotonic()
+            self._batch_start_index = spool_index
+        self._readings.append(*reading)
+
+    def get_wait_timeout(self, poll_interval: float) -> float:
+        """Returns how long to wait for the next reading before the batch reaches its maximum age."""
+        if len(self._readings) == 0:
+            return poll_interval
+        batch_age = time.monotonic() - self._batch_start_time
+        return max(0.0, min(poll_interval, self._batch_policy.get_max_batch_age() - batch_age))
+
+    def should_flush(self) -> bool:
+        return self._batch_policy.should_flush(len(self._readings), time.monotonic() - self._batch_start_time)
+
+    def take_batch(self) -> Payload:
+        """Encodes the collected readings and starts the next batch."""
+        spool_range = None  # type: Optional[Tuple[int, int]]
+        if self._spool is not None:
+            spool_range = (self._batch_start_index, self._batch_start_index + len(self._readings))
+        payload = self._encode(self._readings, spool_range)
+        self._batch_policy.record_flush(len(self._readings), len(payload[0]), time.monotonic())
+        self._readings.clear()
+        return payload
+
+    def take_replay_batch(self) -> Optional[Payload]:
+        """Encodes the next unacknowledged readings of the spool within the replay rate, or returns None."""
+        if self._replay_index >= self._replay_end_index:
+            return None
+        max_count = min(self._batch_policy.get_max_batch_size(), self._replay_limiter.get_available())
+        if max_count < 1:
+            return None
+        spool_range = self._spool.get_unacknowledged_range(self._replay_index, self._replay_end_index, max_count)
+        if spool_range is None:
+            self._replay_index = self._replay_end_index
+            logger.info("All readings from the spool are replayed.")
+            return None
+        self._replay_readings.clear()
+        self._spool.read_into(self._replay_readings, spool_range[0], spool_range[1])
+        self._replay_index = spool_range[1]
+        self._replay_limiter.consume(spool_range[1] - spool_range[0])
+        if len(self._replay_readings) == 0:
+            self._spool.acknowledge(spool_range[0], spool_range[1])  # Only torn records, nothing to send.
+            return None
+        self._metrics.readings_replayed.inc(len(self._replay_readings))
+        return self._encode(self._replay_readings, spool_range)
+
+    def _encode(self, readings: models.ReadingBuffer, spool_range: Optional[Tuple[int, int]]) -> Payload:
+        start_time = time.monotonic()
+        data, content_encoding = self._reading_encoder.encode(readings)
+        self._metrics.encode_seconds.observe(time.monotonic() - start_time)
+        self._metrics.batch_size.observe(len(readings))
+        return data, content_encoding, len(readings), spool_range
+
+    def record_upload(self, payload_size: int, round_trip_time: float, batch_size: int,
+                      spool_range: Optional[Tuple[int, int]]) -> None:
+        """Records a batch accepted by the Flux-server and acknowledges its readings in the spool."""
+        self._batch_policy.record_upload(payload_size, round_trip_time)
+        self._metrics.readings_sent.inc(batch_size)
+        if spool_range is not None:
+            self._spool.acknowledge(spool_range[0], spool_range[1])
+
+    def disable_compression(self, content_encoding: str) -> None:
+        """Sends the following batches as plain JSON after the Flux-server rejected the content encoding."""
+        logger.warning("Flux-server rejected {} compressed readings. Fall back to plain JSON.".format(content_encoding))
+        self._reading_encoder.disable_compression()
+
+
+class MeasurementPipeline:
+    """Runs acquisition, serialization and upload of readings as separate stages linked by queues.
+
+    The acquisition stages only talk to the hardware, so neither a JSON dump nor an upload or a re-login at the
+    Flux-server interrupts the sampling. Positions and illuminance are sampled in parallel, each with its own
+    clock, and every illuminance sample gets the position interpolated to its timestamp. The light sensor is read
+    once per completed integration cycle, so no illuminance value is uploaded twice.
+
+    With a spool, every reading is written to disk before it is uploaded and acknowledged after the Flux-server
+    accepted it. Readings left in the spool by earlier runs are replayed alongside the live readings, limited to
+    replay_rate readings per second and only while no live batch is waiting.
+
+    With a position filter, every fix is filtered on the host and rejected outliers are not used. Readings whose
+    position uncertainty exceeds max_position_uncertainty (in mm, 0 keeps all) are dropped before they are spooled.
+
+    With a tag scheduler, several tags share the Pozyx and every tag's light sensor is sampled by its own stage. The
+    readings are tagged with the tag they belong to. The localizer, light sensor and position filter arguments are
+    only used without a tag scheduler. A light sensor array yields one reading per sensor and pass, all with the
+    position interpolated once for the pass plus the offset of the sensor.
+
+    Every stage records its timings and the readings it handled in the metrics.
+    """
+    QUEUE_POLL_INTERVAL = 0.1
+    UPLOAD_POLL_INTERVAL = 0.02
+    POSITION_WAIT_TIMEOUT = 1
+    THREAD_JOIN_TIMEOUT = 5
+
+    def __init__(self, localizer: Localizer, light_sensor: LightSensor, flux_server: FluxServer,
+                 timeout: int, batch_policy: BatchPolicy = None,
+                 encoder: reading_encoder.ReadingEncoder = None, spool: ReadingSpool = None,
+                 replay_rate: float = DEFAULT_SPOOL_REPLAY_RATE, position_filter=None,
+                 max_position_uncertainty: float = 0, tag_scheduler: TagScheduler = None,
+                 metrics: Metrics = None) -> None:
+        self._tag_scheduler = tag_scheduler
+        if tag_scheduler is None:
+            self._tag_scheduler = TagScheduler([Tag(models.NO_TAG_ID, localizer, light_sensor,
+                                                    position_filter=position_filter)])
+        self._flux_server = flux_server
+        if batch_policy is None:
+            batch_policy = BatchPolicy(max_in_flight_uploads=flux_server.get_max_in_flight_uploads())
+        if encoder is None:
+            encoder = reading_encoder.ReadingEncoder()
+        self._spool = spool
+        self._max_position_uncertainty = max_position_uncertainty
+        self._spool_ranges = {}  # type: Dict[int, Tuple[int, int]]
+        self._batch_sizes = {}  # type: Dict[int, int]
+        self._metrics = metrics
+        if metrics is None:
+            self._metrics = Metrics()
+        self._batch_assembler = BatchAssembler(batch_policy, encoder, spool, replay_rate, self._metrics)
+        self._timeout = timeout
+        self._reading_queue = queue.Queue()  # type: queue.Queue
+        self._payload_queue = queue.Queue(maxsize=1)  # type: queue.Queue
+        self._stop_event = threading.Event()
+        self._deadline = time.monotonic() + timeout
+        self._threads = []  # type: List[threading.Thread]
+        self._light_sample_count = 0
+        self._light_sample_count_lock = threading.Lock()
+
+    def run(self) -> None:
+        """Starts all stages and blocks until the measurement is stopped."""
+        self._stop_event.clear()
+        start_time = time.monotonic()
+        self._reset_timeout()
+        self._tag_scheduler.reset()
+        self._batch_assembler.reset()
+        self._threads = [self._start_stage("positioning", self._sample_positions)]
+        for tag in self._tag_scheduler.get_tags():
+            self._threads.append(self._start_stage("light-sampling-{}".format(tag.get_name()),
+                                                   self._sample_illuminance, tag))
+        self._threads += [self._start_stage("serializer", self._serialize),
+                          self._start_stage("uploader", self._upload)]
+        try:
+            while not self._stop_event.wait(self.QUEUE_POLL_INTERVAL):
+                if self._is_timeout_exceeded():
+                    logger.error("Timeout of {}s is exceeded while waiting for Flux-server response".format(
+                        self._timeout))
+                    self.stop()
+        finally:
+            self.stop()
+            self._join_stages()
+            if self._spool is not None:
+                self._spool.sync()
+            logger.info("Light sensor delivered {} samples ({:.1f} per second)".format(
+                self._light_sample_count, self._light_sample_count / max(time.monotonic() - start_time, 1e-3)))
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def is_stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def _start_stage(self, name: str, target, *args) -> threading.Thread:
+        thread = threading.Thread(target=self._run_stage, args=(target,) + args, name="flux-{}".format(name),
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def _run_stage(self, target, *args) -> None:
+        try:
+            target(*args)
+        except Exception:
+            logger.exception("Unexpected error in measurement stage '{}'".format(threading.current_thread().name))
+        finally:
+            self.stop()
+
+    def _join_stages(self) -> None:
+        for thread in self._threads:
+            thread.join(self.THREAD_JOIN_TIMEOUT)
+            if thread.is_alive():
+                logger.warning("Measurement stage '{}' did not stop in time".format(thread.name))
+        del self._threads[:]
+
+    def _reset_timeout(self) -> None:
+        self._deadline = time.monotonic() + self._timeout
+
+    def _is_timeout_exceeded(self) -> bool:
+        return time.monotonic() > self._deadline
+
+    def _sample_positions(self) -> None:
+        while not self._stop_event.is_set():
+            tag = self._tag_scheduler.next_tag()
+            start_time = time.monotonic()
+            try:
+                time_stamp, position = self._tag_scheduler.do_positioning(tag)
+            except PozyxDeviceError as err:
+                self._metrics.positioning_errors.inc()
+                logger.error("Pozyx error while creating new readings ({})".format(tag.get_name()))
+                logger.error(err)
+                continue
+            self._metrics.positioning_seconds.observe(time.monotonic() - start_time)
+            if tag.position_filter is not None:
+                start_time = time.monotonic()
+                position = tag.position_filter.update(time_stamp, position)
+                self._metrics.position_filter_seconds.observe(time.monotonic() - start_time)
+                if position is None:
+                    logger.debug("Position rejected as outlier ({})".format(tag.get_name()))
+                    continue
+            tag.position_history.add_position(time_stamp, position)
+
+    def _sample_illuminance(self, tag: Tag) -> None:
+        while not self._stop_event.is_set():
+            start_time = time.monotonic()
+            try:
+                light_sample = tag.light_sensor.sample()
+            except OSError as err:
+                self._metrics.light_sensor_errors.inc()
+                logger.error("I2C error while sampling the light sensor ({})".format(tag.get_name()))
+                logger.error(err)
+                continue
+            self._metrics.light_sample_seconds.observe(time.monotonic() - start_time)
+            if not light_sample.is_fresh:
+                continue
+            light_values = get_light_values(light_sample)
+            with self._light_sample_count_lock:
+                self._light_sample_count += len(light_values)
+            self._metrics.readings_taken.inc(len(light_values))
+            time_stamp = light_sample.get_time_stamp()
+
+            # Wait for the next position so the reading is interpolated instead of extrapolated.
+            position = None
+            if self._wait_for_position_after(tag.position_history, time_stamp):
+                position = tag.position_history.get_position_at(time_stamp)
+            for reading in create_readings(light_values, position, time_stamp, tag.tag_id,
+                                           self._max_position_uncertainty, self._metrics):
+                self._reading_queue.put(reading)
+
+    def _wait_for_position_after(self, position_history: PositionHistory, time_stamp: float) -> bool:
+        deadline = time.monotonic() + self.POSITION_WAIT_TIMEOUT
+        while not self._stop_event.is_set():
+            if position_history.wait_for_position_after(time_stamp, self.QUEUE_POLL_INTERVAL):
+                return True
+            if time.monotonic() > deadline:
+                # Positioning stalls, e.g. due to Pozyx errors. Fall back to the latest known position.
+                return not position_history.is_empty()
+        return False
+
+    def _serialize(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                reading = self._reading_queue.get(timeout=self._batch_assembler.get_wait_timeout(
+                    self.QUEUE_POLL_INTERVAL))
+                self._batch_assembler.add(reading)
+            except queue.Empty:
+                pass
+            self._drain_reading_queue()
+
+            if self._payload_queue.full():
+                # The uploader holds at most one batch in advance. Until it takes it, readings keep accumulating.
+                continue
+            if self._batch_assembler.should_flush():
+                self._payload_queue.put_nowait(self._batch_assembler.take_batch())
+            else:
+                payload = self._batch_assembler.take_replay_batch()
+                if payload is not None:
+                    self._payload_queue.put_nowait(payload)
+
+    def _drain_reading_queue(self) -> None:
+        while True:
+            try:
+                reading = self._reading_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._batch_assembler.add(reading)
+
+    def _upload(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                self._fill_upload_window()
+                for upload in self._flux_server.wait_for_uploads(self.UPLOAD_POLL_INTERVAL):
+                    if not self._handle_finished_upload(upload):
+                        return
+        finally:
+            self._flux_server.cancel_uploads()
+
+    def _fill_upload_window(self) -> None:
+        timeout = None  # type: Optional[float]
+        if self._flux_server.get_number_of_pending_uploads() == 0:
+            timeout = self.QUEUE_POLL_INTERVAL
+        while self._flux_server.has_free_upload_slot():
+            try:
+                if timeout is None:
+                    data, content_encoding, batch_size, spool_range = self._payload_queue.get_nowait()
+                else:
+                    data, content_encoding, batch_size, spool_range = self._payload_queue.get(timeout=timeout)
+            except queue.Empty:
+                return
+            upload = self._flux_server.send_data_to_server(data, content_encoding)
+            self._batch_sizes[upload.sequence_number] = batch_size
+            if spool_range is not None:
+                self._spool_ranges[upload.sequence_number] = spool_range
+            timeout = None
+
+    def _handle_finished_upload(self, upload: Upload) -> bool:
+        """Handles the result of one upload and returns whether the measurement continues."""
+        try:
+            response = upload.get_response()
+        except CancelledError:
+            self._spool_ranges.pop(upload.sequence_number, None)
+            self._batch_sizes.pop(upload.sequence_number, None)
+            return True
+        except requests.exceptions.RequestException as err:
+            logger.error("Request error while sending new readings to Flux-server")
+            logger.error(err)
+            return False
+
+        if response.status_code == 200:
+            self._reset_timeout()
+            self._batch_assembler.record_upload(len(upload.data), upload.get_round_trip_time(),
+                                                self._batch_sizes.pop(upload.sequence_number, 0),
+                                                self._spool_ranges.pop(upload.sequence_number, None))
+            return True
+        elif response.status_code in (400, 415) and \
+                upload.content_encoding != reading_encoder.CONTENT_ENCODING_IDENTITY:
+            self._batch_assembler.disable_compression(upload.content_encoding)
+            self._metrics.readings_retried.inc(self._batch_sizes.get(upload.sequence_number, 0))
+            self._flux_server.resend_upload_uncompressed(upload)
+            return True
+        elif response.status_code == 401:
+            logger.info("Auth token expired. Try new login...")
+            try:
+                self._flux_server.login_for_upload(upload)
+            except requests.exceptions.RequestException as err:
+                logger.error("Request error while sending new readings to Flux-server")
+                logger.error(err)
+                return False
+            except FluxServerError as err:
+                logger.error("Server error while sending new readings to Flux-server")
+                logger.error(err)
+                return False
+            self._metrics.readings_retried.inc(self._batch_sizes.get(upload.sequence_number, 0))
+            self._flux_server.resend_upload(upload)
+            return True
+        elif response.status_code == 404:
+            logger.info("The measurement has been stopped by the server.")
+            return False
+        logger.info("The measurement has been stopped.")
+        return False
@@ -0,0 +1,175 @@
+from typing import List, Optional, Sequence, Tuple, Union
+import bisect
+import threading
+import time
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # in seconds
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)  # in readings
+
+
+def _format_value(value: Union[int, float]) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    elif value != value:
+        return "NaN"
+    return repr(value)
+
+
+class Counter(object):
+    """Total count of an event, only ever increased"""
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def get_value(self) -> int:
+        return self._value
+
+    def render(self) -> List[str]:
+        return ["# HELP {} {}".format(self.name, self.description),
+                "# TYPE {} counter".format(self.name),
+                "{} {}".format(self.name, self._value)]
+
+
+class Gauge(object):
+    """Value which is set to its current state, NaN until it is set for the first time"""
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._value = float("nan")
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def get_value(self) -> float:
+        return self._value
+
+    def render(self) -> List[str]:
+        return ["# HELP {} {}".format(self.name, self.description),
+                "# TYPE {} gauge".format(self.name),
+                "{} {}".format(self.name, _format_value(self._value))]
+
+
+class Histogram(object):
+    """Distribution of observed values in fixed buckets, e.g. the durations of one stage.
+
+    Observing a value costs one binary search and one locked increment, so it can be used on every sample.
+    """
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DURATION_BUCKETS) -> None:
+        if list(buckets) != sorted(buckets) or len(buckets) == 0:
+            raise ValueError("Argument buckets must be a non-empty, ascending sequence.")
+        self.name = name
+        self.description = description
+        self._upper_bounds = tuple(buckets) + (float("inf"),)
+        self._bucket_counts = [0] * len(self._upper_bounds)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._bucket_counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def get_count(self) -> int:
+        return self._count
+
+    def get_sum(self) -> float:
+        return self._sum
+
+    def get_buckets(self) -> List[Tuple[float, int]]:
+        """Returns the upper bound of every bucket with the cumulative count of values up to it."""
+        with self._lock:
+            bucket_counts = list(self._bucket_counts)
+        buckets = []
+        cumulative_count = 0
+        for upper_bound, bucket_count in zip(self._upper_bounds, bucket_counts):
+            cumulative_count += bucket_count
+            buckets.append((upper_bound, cumulative_count))
+        return buckets
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {} {}".format(self.name, self.description),
+                 "# TYPE {} histogram".format(self.name)]
+        with self._lock:
+            count = self._count
+            total = self._sum
+        for upper_bound, cumulative_count in self.get_buckets():
+            lines.append('{}_bucket{{le="{}"}} {}'.format(self.name, _format_value(upper_bound), cumulative_count))
+        lines.append("{}_sum {}".format(self.name, _format_value(total)))
+        lines.append("{}_count {}".format(self.name, count))
+        return lines
+
+
+class Metrics(object):
+    """Timings of the measurement stages and the Flux-server requests and counts of the readings.
+
+    The durations are measured with the monotonic clock. The light sensor sample time includes the wait for the end
+    of the integration cycle, the upload time is the round-trip of the POST request including the retries of the
+    HTTP session. The time to the first reading is measured from the start time on the monotonic clock, by default
+    the creation of the metrics.
+    """
+
+    def __init__(self, start_time: Optional[float] = None) -> None:
+        self._start_time = start_time
+        if start_time is None:
+            self._start_time = time.monotonic()
+        self._has_first_reading = False
+        self._first_reading_lock = threading.Lock()
+        self.time_to_first_reading = Gauge("flux_time_to_first_reading_seconds",
+                                           "Time from the start of the process to the first reading.")
+        self.positioning_seconds = Histogram("flux_positioning_seconds",
+                                             "Serial round-trip of one positioning on the Pozyx.")
+        self.position_filter_seconds = Histogram("flux_position_filter_seconds",
+                                                 "Time to filter one position on the host.")
+        self.light_sample_seconds = Histogram("flux_light_sample_seconds",
+                                              "Time to sample the light sensor, including the integration.")
+        self.encode_seconds = Histogram("flux_encode_seconds", "Time to encode and compress one batch of readings.")
+        self.upload_seconds = Histogram("flux_upload_seconds", "Round-trip of one batch posted to Flux-server.")
+        self.login_seconds = Histogram("flux_login_seconds", "Round-trip of one login at Flux-server.")
+        self.batch_size = Histogram("flux_batch_size_readings", "Number of readings per batch.", BATCH_SIZE_BUCKETS)
+        self.readings_taken = Counter("flux_readings_taken_total", "Readings taken by the light sensors.")
+        self.readings_dropped = Counter("flux_readings_dropped_total",
+                                        "Readings dropped without or with a too uncertain position.")
+        self.readings_sent = Counter("flux_readings_sent_total", "Readings accepted by Flux-server.")
+        self.readings_retried = Counter("flux_readings_retried_total",
+                                        "Readings sent again after Flux-server rejected their batch.")
+        self.readings_replayed = Counter("flux_readings_replayed_total", "Readings replayed from the spool.")
+        self.positioning_errors = Counter("flux_positioning_errors_total", "Failed positionings.")
+        self.light_sensor_errors = Counter("flux_light_sensor_errors_total", "Failed samples of the light sensors.")
+        self.upload_errors = Counter("flux_upload_errors_total", "Batches failed without response from Flux-server.")
+
+    def record_first_reading(self) -> Optional[float]:
+        """Records the time to the first reading and returns it, or None if a reading was recorded before."""
+        if self._has_first_reading:
+            return None
+        with self._first_reading_lock:
+            if self._has_first_reading:
+                return None
+            self._has_first_reading = True
+        seconds = time.monotonic() - self._start_time
+        self.time_to_first_reading.set(seconds)
+        return seconds
+
+    def get_metrics(self) -> List[Union[Counter, Gauge, Histogram]]:
+        return [self.time_to_first_reading, self.positioning_seconds, self.position_filter_seconds,
+                self.light_sample_seconds, self.encode_seconds, self.upload_seconds, self.login_seconds,
+                self.batch_size, self.readings_taken, self.readings_dropped, self.readings_sent, self.readings_retried,
+                self.readings_replayed, self.positioning_errors, self.light_sensor_errors, self.upload_errors]
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []  # type: List[str]
+        for metric in self.get_metrics():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,56 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from flux_sensors.metrics import Metrics
+from flux_sensors.config_loader import DEFAULT_METRICS_ADDRESS
+import threading
+import logging
+
+METRICS_ROUTE = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path != METRICS_ROUTE:
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """Serves the metrics at /metrics in the Prometheus text format, e.g. for a Prometheus scraper or curl.
+
+    The server listens on localhost by default, as the metrics are not protected.
+    """
+    daemon_threads = True
+
+    def __init__(self, metrics: Metrics, port: int, address: str = DEFAULT_METRICS_ADDRESS) -> None:
+        super().__init__((address, port), MetricsRequestHandler)
+        self.metrics = metrics
+        self._thread = None  # type: threading.Thread
+
+    def get_port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever, name="flux-metrics", daemon=True)
+        self._thread.start()
+        logger.info("Serving metrics at http://{}:{}{}".format(self.server_address[0], self.get_port(),
+                                                               METRICS_ROUTE))
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
@@ -1,16 +1,30 @@
 #!/usr/bin/env python
 
+from typing import Iterator, Optional
+from array import array
 import time
+import math
 import datetime
 
+DEFAULT_READING_BUFFER_CAPACITY = 1024
+MICROSECONDS_PER_SECOND = 1000000
+NO_POSITION_UNCERTAINTY = float("nan")
+NO_TAG_ID = 0  # Readings of a single tag are not tagged.
+READING_JSON_FORMAT = '{{"luxValue":{},"xposition":{},"yposition":{},"zposition":{},"timestamp":"{}"}}'
+TAGGED_READING_JSON_FORMAT = ('{{"luxValue":{},"xposition":{},"yposition":{},"zposition":{},"timestamp":"{}",'
+                              '"tagId":"0x{:04x}"}}')
+
 
 class Position(object):
-    """Model class for a 3D position"""
+    """Model class for a 3D position with an optional uncertainty in mm"""
+    __slots__ = ("x", "y", "z", "uncertainty")
 
-    def __init__(self, x_position: float, y_position: float, z_position: float) -> None:
+    def __init__(self, x_position: float, y_position: float, z_position: float,
+                 uncertainty: Optional[float] = None) -> None:
         self.x = x_position
         self.y = y_position
         self.z = z_position
+        self.uncertainty = uncertainty
 
     def get_x(self) -> float:
         return self.x
@@ -21,15 +35,149 @@ class Position(object):
     def get_z(self) -> float:
         return self.z
 
+    def get_uncertainty(self) -> Optional[float]:
+        return self.uncertainty
+
+
+def to_json_number(value: float) -> str:
+    """Formats a finite value as JSON number. Integral values are written without fraction, as they were stored."""
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def to_wall_clock_time(monotonic_time: float) -> float:
+    """Converts a time of time.monotonic(), which the samples are taken with, to seconds since the epoch."""
+    return time.time() - (time.monotonic() - monotonic_time)
+
+
+def to_iso_timestamp(time_stamp: int) -> str:
+    """Formats a timestamp in microseconds since the epoch as local ISO 8601 date and time."""
+    return datetime.datetime.fromtimestamp(time_stamp / MICROSECONDS_PER_SECOND).isoformat()
+
 
 class Reading(object):
-    """Model class for a flux reading"""
+    """Model class for a flux reading. The position uncertainty is kept on the sensor and not sent."""
+    __slots__ = ("luxValue", "xposition", "yposition", "zposition", "time_stamp", "position_uncertainty", "tag_id")
 
-    def __init__(self, lux_value: float, position: Position) -> None:
+    def __init__(self, lux_value: float, position: Position, time_stamp: Optional[float] = None,
+                 tag_id: int = NO_TAG_ID) -> None:
         self.luxValue = lux_value
         self.xposition = position.get_x()
         self.yposition = position.get_y()
         self.zposition = position.get_z()
+        self.position_uncertainty = position.get_uncertainty()
+        self.tag_id = tag_id
+
+        if time_stamp is None:
+            time_stamp = time.time()
+        self.time_stamp = int(time_stamp * MICROSECONDS_PER_SECOND)  # Microseconds since the epoch
+
+    @property
+    def timestamp(self) -> str:
+        return to_iso_timestamp(self.time_stamp)
+
+
+class ReadingBuffer(object):
+    """Columnar store of readings backed by typed arrays.
+
+    The columns are preallocated and reused after clear(), so buffering many readings neither allocates one object
+    per reading nor leaves garbage behind for the collector. Indexing returns a Reading view of one row.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_READING_BUFFER_CAPACITY) -> None:
+        if capacity < 1:
+            raise ValueError("Argument capacity must be at least 1.")
+        self._size = 0
+        self._capacity = 0
+        self._lux_values = array('d')
+        self._x_positions = array('d')
+        self._y_positions = array('d')
+        self._z_positions = array('d')
+        self._time_stamps = array('q')
+        self._position_uncertainties = array('d')  # NaN if unknown
+        self._tag_ids = array('l')
+        self._grow(capacity)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> Reading:
+        if index < 0:
+            index += self._size
+        if index < 0 or index >= self._size:
+            raise IndexError("Reading index out of range.")
+        position_uncertainty = self._position_uncertainties[index]
+        if math.isnan(position_uncertainty):
+            position_uncertainty = None
+        reading = Reading(self._lux_values[index], Position(self._x_positions[index], self._y_positions[index],
+                                                            self._z_positions[index], position_uncertainty),
+                          tag_id=self._tag_ids[index])
+        reading.time_stamp = self._time_stamps[index]
+        return reading
+
+    def get_capacity(self) -> int:
+        return self._capacity
+
+    def _grow(self, capacity: int) -> None:
+        additional_rows = capacity - self._capacity
+        for column in (self._lux_values, self._x_positions, self._y_positions, self._z_positions, self._time_stamps,
+                       self._position_uncertainties, self._tag_ids):
+            column.frombytes(bytes(additional_rows * column.itemsize))
+        self._capacity = capacity
+
+    def append(self, lux_value: float, x_position: float, y_position: float, z_position: float,
+               time_stamp: float, position_uncertainty: float = NO_POSITION_UNCERTAINTY,
+               tag_id: int = NO_TAG_ID) -> None:
+        """Appends one reading. The timestamp is given in seconds since the epoch, the uncertainty in mm."""
+        if self._size == self._capacity:
+            self._grow(self._capacity * 2)
+        index = self._size
+        self._lux_values[index] = lux_value
+        self._x_positions[index] = x_position
+        self._y_positions[index] = y_position
+        self._z_positions[index] = z_position
+        self._time_stamps[index] = int(time_stamp * MICROSECONDS_PER_SECOND)
+        self._position_uncertainties[index] = position_uncertainty
+        self._tag_ids[index] = tag_id
+        self._size += 1
+
+    def append_reading(self, reading: Reading) -> None:
+        position_uncertainty = reading.position_uncertainty
+        if position_uncertainty is None:
+            position_uncertainty = NO_POSITION_UNCERTAINTY
+        self.append(reading.luxValue, reading.xposition, reading.yposition, reading.zposition,
+                    reading.time_stamp / MICROSECONDS_PER_SECOND, position_uncertainty, reading.tag_id)
+
+    def clear(self) -> None:
+        """Removes all readings but keeps the allocated columns for reuse."""
+        self._size = 0
+
+    def get_oldest_time_stamp(self) -> Optional[float]:
+        if self._size == 0:
+            return None
+        return self._time_stamps[0] / MICROSECONDS_PER_SECOND
+
+    def iter_json_rows(self) -> Iterator[str]:
+        """Serializes the readings one by one directly from the columns as JSON objects.
+
+        Readings of several tags get the network ID of their tag as hexadecimal string. Readings with a NaN or
+        infinite value are skipped, as JSON has no representation for them.
+        """
+        for index in range(0, self._size):
+            values = (self._lux_values[index], self._x_positions[index], self._y_positions[index],
+                      self._z_positions[index])
+            if not all(math.isfinite(value) for value in values):
+                continue
+            lux_value, x_position, y_position, z_position = (to_json_number(value) for value in values)
+            tag_id = self._tag_ids[index]
+            if tag_id == NO_TAG_ID:
+                yield READING_JSON_FORMAT.format(lux_value, x_position, y_position, z_position,
+                                                 to_iso_timestamp(self._time_stamps[index]))
+            else:
+                yield TAGGED_READING_JSON_FORMAT.format(lux_value, x_position, y_position, z_position,
+                                                        to_iso_timestamp(self._time_stamps[index]), tag_id)
 
-        time_stamp = time.time()
-        self.timestamp = datetime.datetime.now().isoformat()
+    def to_json(self) -> str:
+        """Serializes the readings as JSON list of reading objects."""
+        return "[" + ",".join(self.iter_json_rows()) + "]"
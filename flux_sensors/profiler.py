@@ -0,0 +1,149 @@
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+import sys
+import os
+import signal
+import threading
+import time
+import logging
+from flux_sensors.config_loader import (DEFAULT_PROFILE_DIRECTORY, DEFAULT_PROFILE_DURATION,
+                                        DEFAULT_PROFILE_SAMPLING_INTERVAL)
+
+REPORT_FILE_SUFFIX = ".txt"
+STACKS_FILE_SUFFIX = ".folded"
+TOP_FUNCTION_COUNT = 20
+
+logger = logging.getLogger(__name__)
+
+
+def _get_function_name(frame) -> str:
+    code = frame.f_code
+    return "{}:{}".format(frame.f_globals.get("__name__", os.path.basename(code.co_filename)), code.co_name)
+
+
+class SamplingProfiler(object):
+    """Statistical profiler which samples the stacks of all threads of the process for a fixed time.
+
+    The stacks are read with sys._current_frames() by a thread of the profiler, so the profiled threads are not
+    instrumented and keep running while they are profiled. Waiting threads are sampled as well, so the profile shows
+    where the wall-clock time goes, not only the CPU time. Nothing runs while no profile is taken. Every profile is
+    written to two files in the profile directory: a report with the most frequent functions per thread and the
+    collapsed stacks (one 'thread;outer;...;inner count' line per stack), which flamegraph.pl or speedscope display.
+
+    The sampling holds the GIL for a few microseconds per thread, so an interval of some milliseconds costs a few
+    percent of a Raspberry Pi core while profiling.
+    """
+
+    def __init__(self, directory: str = DEFAULT_PROFILE_DIRECTORY, duration: float = DEFAULT_PROFILE_DURATION,
+                 interval: float = DEFAULT_PROFILE_SAMPLING_INTERVAL) -> None:
+        if duration <= 0:
+            raise ValueError("Argument duration must be positive.")
+        elif interval <= 0:
+            raise ValueError("Argument interval must be positive.")
+        self._directory = directory
+        self._duration = duration
+        self._interval = interval
+        self._thread = None  # type: Optional[threading.Thread]
+        self._lock = threading.RLock()  # Reentrant, as the signal handler interrupts the main thread anywhere
+        self._last_report_path = None  # type: Optional[str]
+
+    def is_running(self) -> bool:
+        with self._lock:
+            return self._thread is not None and self._thread.is_alive()
+
+    def get_last_report_path(self) -> Optional[str]:
+        return self._last_report_path
+
+    def start(self) -> bool:
+        """Starts a profile in the background. Returns False if a profile is already being taken."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._run, name="flux-profiler", daemon=True)
+            self._thread.start()
+        return True
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def install_signal_handler(self, signal_number: int = None) -> bool:
+        """Starts a profile whenever the process receives the signal, SIGUSR1 by default.
+
+        Must be called from the main thread. Returns False if the platform has no such signal.
+        """
+        if signal_number is None:
+            signal_number = getattr(signal, "SIGUSR1", None)
+            if signal_number is None:
+                return False
+        signal.signal(signal_number, self._handle_signal)
+        return True
+
+    def _handle_signal(self, signal_number: int, frame) -> None:
+        # Runs between two bytecodes of the main thread: only start the profiler thread, which logs for itself.
+        self.start()
+
+    def _run(self) -> None:
+        logger.info("Profiling all threads for {}s...".format(self._duration))
+        try:
+            start_time = time.time()
+            stacks, sample_count = self._sample()
+            self._last_report_path = self._write_report(start_time, stacks, sample_count)
+        except Exception:
+            logger.exception("Error while profiling")
+            return
+        logger.info("Profile written to {}".format(self._last_report_path))
+
+    def _sample(self) -> Tuple[Counter, int]:
+        """Samples the stacks of all other threads and returns the count of every (thread, stack) pair."""
+        stacks = Counter()  # type: Counter
+        sample_count = 0
+        own_thread_id = threading.get_ident()
+        deadline = time.monotonic() + self._duration
+        while time.monotonic() < deadline:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                stack = []  # type: List[str]
+                while frame is not None:
+                    stack.append(_get_function_name(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                stacks[(thread_names.get(thread_id, str(thread_id)), tuple(stack))] += 1
+            sample_count += 1
+            time.sleep(self._interval)
+        return stacks, sample_count
+
+    def _write_report(self, start_time: float, stacks: Counter, sample_count: int) -> str:
+        os.makedirs(self._directory, exist_ok=True)
+        base_path = os.path.join(self._directory, "flux-profile-{}".format(
+            time.strftime("%Y%m%d-%H%M%S", time.localtime(start_time))))
+
+        with open(base_path + STACKS_FILE_SUFFIX, "w") as stacks_file:
+            for (thread_name, stack), count in sorted(stacks.items()):
+                stacks_file.write("{};{} {}\n".format(thread_name, ";".join(stack), count))
+
+        thread_sample_counts = Counter()  # type: Counter
+        self_counts = {}  # type: Dict[str, Counter]
+        total_counts = {}  # type: Dict[str, Counter]
+        for (thread_name, stack), count in stacks.items():
+            thread_sample_counts[thread_name] += count
+            self_counts.setdefault(thread_name, Counter())[stack[-1]] += count
+            for function_name in set(stack):
+                total_counts.setdefault(thread_name, Counter())[function_name] += count
+
+        lines = ["Profile of process {} started at {} with {} samples every {}s for {}s".format(
+            os.getpid(), time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start_time)), sample_count,
+            self._interval, self._duration)]
+        for thread_name, thread_sample_count in thread_sample_counts.most_common():
+            lines += ["", "Thread {} ({} samples)".format(thread_name, thread_sample_count),
+                      "{:>7} {:>7}  function".format("self %", "total %")]
+            for function_name, total_count in total_counts[thread_name].most_common(TOP_FUNCTION_COUNT):
+                lines.append("{:7.1f} {:7.1f}  {}".format(
+                    100 * self_counts[thread_name][function_name] / thread_sample_count,
+                    100 * total_count / thread_sample_count, function_name))
+        with open(base_path + REPORT_FILE_SUFFIX, "w") as report_file:
+            report_file.write("\n".join(lines) + "\n")
+        return base_path + REPORT_FILE_SUFFIX
@@ -0,0 +1,70 @@
+from typing import Optional, Tuple
+from flux_sensors.models import models
+import zlib
+
+CONTENT_ENCODING_IDENTITY = "identity"
+CONTENT_ENCODING_GZIP = "gzip"
+CONTENT_ENCODING_DEFLATE = "deflate"
+CONTENT_ENCODINGS = (CONTENT_ENCODING_IDENTITY, CONTENT_ENCODING_GZIP, CONTENT_ENCODING_DEFLATE)
+DEFAULT_COMPRESSION_LEVEL = 6
+GZIP_WINDOW_BITS = 16 + zlib.MAX_WBITS
+DEFLATE_WINDOW_BITS = zlib.MAX_WBITS  # HTTP deflate is the zlib format, not raw deflate.
+
+
+class ReadingEncoder(object):
+    """Encodes batches of readings as JSON request bodies, optionally compressed.
+
+    The JSON is written row by row into a reusable buffer and compressed on the fly, so no intermediate string of
+    the whole batch is built.
+    """
+
+    def __init__(self, content_encoding: str = CONTENT_ENCODING_IDENTITY,
+                 compression_level: int = DEFAULT_COMPRESSION_LEVEL) -> None:
+        if content_encoding not in CONTENT_ENCODINGS:
+            raise ValueError("Content encoding must be one of {}.".format(", ".join(CONTENT_ENCODINGS)))
+        self._content_encoding = content_encoding
+        self._compression_level = compression_level
+        self._buffer = bytearray()
+
+    def get_content_encoding(self) -> str:
+        return self._content_encoding
+
+    def disable_compression(self) -> None:
+        self._content_encoding = CONTENT_ENCODING_IDENTITY
+
+    def encode(self, readings: models.ReadingBuffer) -> Tuple[bytes, str]:
+        """Returns the request body and the content encoding it was compressed with."""
+        del self._buffer[:]
+        content_encoding = self._content_encoding
+        compressor = self._get_compressor(content_encoding)
+        separator = b""
+        self._write(compressor, b"[")
+        for row in readings.iter_json_rows():
+            self._write(compressor, separator + row.encode())
+            separator = b","
+        self._write(compressor, b"]")
+        if compressor is not None:
+            self._buffer.extend(compressor.flush())
+        return bytes(self._buffer), content_encoding
+
+    def _get_compressor(self, content_encoding: str):
+        if content_encoding == CONTENT_ENCODING_GZIP:
+            return zlib.compressobj(self._compression_level, zlib.DEFLATED, GZIP_WINDOW_BITS)
+        elif content_encoding == CONTENT_ENCODING_DEFLATE:
+            return zlib.compressobj(self._compression_level, zlib.DEFLATED, DEFLATE_WINDOW_BITS)
+        return None
+
+    def _write(self, compressor, data: bytes) -> None:
+        if compressor is None:
+            self._buffer.extend(data)
+        else:
+            self._buffer.extend(compressor.compress(data))
+
+
+def decompress(data: bytes, content_encoding: Optional[str]) -> bytes:
+    """Restores the plain JSON of a request body encoded by the ReadingEncoder."""
+    if content_encoding == CONTENT_ENCODING_GZIP:
+        return zlib.decompress(data, GZIP_WINDOW_BITS)
+    elif content_encoding == CONTENT_ENCODING_DEFLATE:
+        return zlib.decompress(data, DEFLATE_WINDOW_BITS)
+    return data
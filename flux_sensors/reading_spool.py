@@ -0,0 +1,337 @@
+from typing import Dict, List, Optional, Tuple
+from flux_sensors.models import models
+from flux_sensors.config_loader import DEFAULT_SPOOL_MAX_SIZE
+import os
+import mmap
+import struct
+import zlib
+import time
+import threading
+import logging
+
+DEFAULT_SEGMENT_SIZE = 1024 * 1024
+DEFAULT_MAX_SPOOL_SIZE = DEFAULT_SPOOL_MAX_SIZE * 1024 * 1024  # in bytes
+DEFAULT_SYNC_GROUP_SIZE = 64  # Number of appended readings after which the spool is synced to disk.
+DEFAULT_SYNC_INTERVAL = 1.0  # Seconds after which appended readings are synced to disk at the latest.
+SEGMENT_FILE_SUFFIX = ".seg"
+WATERMARK_FILE_SUFFIX = ".ack"  # Holds the number of leading records of the segment which are acknowledged.
+WATERMARK_FORMAT = struct.Struct("<II")  # acknowledged record count, checksum
+RECORD_FORMAT = struct.Struct("<ddddqH")  # lux, x, y, z, timestamp in microseconds, tag ID
+RECORD_CHECKSUM_FORMAT = struct.Struct("<I")
+RECORD_SIZE = RECORD_FORMAT.size + RECORD_CHECKSUM_FORMAT.size
+
+logger = logging.getLogger(__name__)
+
+
+class ReadingSpoolError(Exception):
+    """Base class for exceptions in this module."""
+
+
+class _Segment(object):
+    """Memory-mapped, preallocated file holding a fixed number of reading records
+
+    The acknowledgement watermark, the number of leading records which are all acknowledged, is persisted in a file
+    next to the segment, so the acknowledged records are not replayed after a restart.
+    """
+
+    def __init__(self, segment_id: int, path: str, size: int, is_full: bool = False, is_new: bool = False) -> None:
+        self.segment_id = segment_id
+        self.path = path
+        self.watermark_path = path[:-len(SEGMENT_FILE_SUFFIX)] + WATERMARK_FILE_SUFFIX
+        self.capacity = size // RECORD_SIZE
+        if is_new and os.path.exists(self.watermark_path):
+            os.remove(self.watermark_path)  # Left behind by a deleted segment with the same ID
+        self._file = open(path, "a+b")
+        if os.fstat(self._file.fileno()).st_size < size:
+            self._file.truncate(size)
+        self.map = mmap.mmap(self._file.fileno(), size)
+        self.record_count = self.capacity
+        if not is_full:
+            self.record_count = self._count_valid_records()
+        self.acknowledged = bytearray(self.capacity)
+        self.acknowledged_count = 0
+        self.watermark = min(self._read_watermark(), self.record_count)
+        self.acknowledged[0:self.watermark] = bytes([1]) * self.watermark
+        self.acknowledged_count = self.watermark
+
+    def _read_watermark(self) -> int:
+        try:
+            with open(self.watermark_path, "rb") as watermark_file:
+                watermark, checksum = WATERMARK_FORMAT.unpack(watermark_file.read(WATERMARK_FORMAT.size))
+        except (OSError, struct.error):
+            return 0
+        if checksum != zlib.crc32(struct.pack("<I", watermark)):
+            return 0
+        return watermark
+
+    def _write_watermark(self, watermark: int) -> None:
+        """Replaces the watermark file atomically, so a power cut leaves either the old or the new watermark."""
+        temporary_path = self.watermark_path + ".tmp"
+        with open(temporary_path, "wb") as watermark_file:
+            watermark_file.write(WATERMARK_FORMAT.pack(watermark, zlib.crc32(struct.pack("<I", watermark))))
+            watermark_file.flush()
+            os.fsync(watermark_file.fileno())
+        os.replace(temporary_path, self.watermark_path)
+        self.watermark = watermark
+
+    def _is_valid_record(self, index: int) -> bool:
+        offset = index * RECORD_SIZE
+        record = self.map[offset:offset + RECORD_FORMAT.size]
+        checksum, = RECORD_CHECKSUM_FORMAT.unpack_from(self.map, offset + RECORD_FORMAT.size)
+        return checksum != 0 and checksum == zlib.crc32(record)
+
+    def _count_valid_records(self) -> int:
+        """Returns the number of records until the first empty or torn one."""
+        for index in range(0, self.capacity):
+            if not self._is_valid_record(index):
+                return index
+        return self.capacity
+
+    def is_full(self) -> bool:
+        return self.record_count == self.capacity
+
+    def is_acknowledged(self) -> bool:
+        return self.is_full() and self.acknowledged_count == self.capacity
+
+    def append(self, record: bytes) -> None:
+        offset = self.record_count * RECORD_SIZE
+        self.map[offset:offset + RECORD_FORMAT.size] = record
+        RECORD_CHECKSUM_FORMAT.pack_into(self.map, offset + RECORD_FORMAT.size, zlib.crc32(record))
+        self.record_count += 1
+
+    def acknowledge(self, start: int, end: int) -> None:
+        for index in range(start, min(end, self.record_count)):
+            if not self.acknowledged[index]:
+                self.acknowledged[index] = 1
+                self.acknowledged_count += 1
+        if start <= self.watermark < end:
+            watermark = self.acknowledged.find(0, self.watermark, self.record_count)
+            if watermark < 0:
+                watermark = self.record_count
+            if watermark > self.watermark and not self.is_acknowledged():
+                self._write_watermark(watermark)
+
+    def get_unacknowledged_range(self, start: int) -> Optional[Tuple[int, int]]:
+        first = self.acknowledged.find(0, start, self.record_count)
+        if first < 0:
+            return None
+        end = self.acknowledged.find(1, first, self.record_count)
+        if end < 0:
+            end = self.record_count
+        return first, end
+
+    def read(self, start: int, end: int) -> List[Tuple[float, float, float, float, int, int]]:
+        records = []
+        for index in range(start, end):
+            if self._is_valid_record(index):  # Torn records may remain in segments written before a crash.
+                records.append(RECORD_FORMAT.unpack_from(self.map, index * RECORD_SIZE))
+        return records
+
+    def sync(self) -> None:
+        self.map.flush()
+
+    def close(self) -> None:
+        self.map.flush()
+        self.map.close()
+        self._file.close()
+
+    def delete(self) -> None:
+        self.map.close()
+        self._file.close()
+        # The watermark goes first: a segment left without it is replayed, a watermark without segment is not used.
+        if os.path.exists(self.watermark_path):
+            os.remove(self.watermark_path)
+        os.remove(self.path)
+
+
+class ReadingSpool(object):
+    """Append-only write-ahead log of readings on disk.
+
+    Readings are written to the spool before they are uploaded and stay there until the Flux-server acknowledged
+    them, so they survive failed uploads, timeouts and restarts. The spool consists of memory-mapped segment files of
+    fixed size. Appended readings are synced to disk in groups, fully acknowledged segments are deleted and the
+    oldest segment is dropped when the spool exceeds its maximum size.
+
+    Every reading is addressed by a spool index, which increases with every appended reading. The delivery is
+    at-least-once: only the acknowledgements up to the first unacknowledged reading of every segment are persisted,
+    so after a restart the readings after it are replayed, at most those of the uploads in flight at the time.
+    """
+
+    def __init__(self, directory: str, segment_size: int = DEFAULT_SEGMENT_SIZE,
+                 max_size: int = DEFAULT_MAX_SPOOL_SIZE, sync_group_size: int = DEFAULT_SYNC_GROUP_SIZE,
+                 sync_interval: float = DEFAULT_SYNC_INTERVAL) -> None:
+        if segment_size < RECORD_SIZE:
+            raise ValueError("Argument segment_size must hold at least one reading.")
+        elif max_size < segment_size:
+            raise ValueError("Argument max_size must not be smaller than segment_size.")
+        self._directory = directory
+        self._segment_size = segment_size - segment_size % RECORD_SIZE
+        self._max_segments = max_size // self._segment_size
+        self._sync_group_size = sync_group_size
+        self._sync_interval = sync_interval
+        self._segments = []  # type: List[_Segment]
+        self._segments_by_id = {}  # type: Dict[int, _Segment]
+        self._lock = threading.RLock()
+        self._unsynced_count = 0
+        self._last_sync_time = time.monotonic()
+        self._is_open = False
+
+    def _get_records_per_segment(self) -> int:
+        return self._segment_size // RECORD_SIZE
+
+    def open(self) -> None:
+        with self._lock:
+            if self._is_open:
+                return
+            os.makedirs(self._directory, exist_ok=True)
+            segment_ids = []
+            for file_name in os.listdir(self._directory):
+                if file_name.endswith(SEGMENT_FILE_SUFFIX):
+                    try:
+                        segment_ids.append(int(file_name[:-len(SEGMENT_FILE_SUFFIX)]))
+                    except ValueError:
+                        continue
+            segment_ids.sort()
+            for segment_id in segment_ids:
+                # Segments are synced when they are full and the next one is started, so only the last is scanned.
+                segment = self._open_segment(segment_id, segment_id != segment_ids[-1])
+                self._segments.append(segment)
+                self._segments_by_id[segment_id] = segment
+            self._is_open = True
+            backlog = sum(segment.record_count - segment.acknowledged_count for segment in self._segments)
+            if backlog > 0:
+                logger.info("Reading spool at {} contains {} readings to replay".format(self._directory, backlog))
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            del self._segments[:]
+            self._segments_by_id.clear()
+            self._is_open = False
+
+    def _open_segment(self, segment_id: int, is_full: bool = False, is_new: bool = False) -> _Segment:
+        path = os.path.join(self._directory, "{:016d}{}".format(segment_id, SEGMENT_FILE_SUFFIX))
+        segment = _Segment(segment_id, path, self._segment_size, is_full, is_new)
+        if segment.capacity != self._get_records_per_segment():
+            raise ReadingSpoolError("Segment {} does not match the configured segment size.".format(path))
+        return segment
+
+    def _check_open(self) -> None:
+        if not self._is_open:
+            raise ReadingSpoolError("The reading spool must be opened first.")
+
+    def get_start_index(self) -> int:
+        """Returns the spool index of the oldest reading kept in the spool."""
+        with self._lock:
+            if len(self._segments) == 0:
+                return 0
+            return self._segments[0].segment_id * self._get_records_per_segment()
+
+    def get_end_index(self) -> int:
+        """Returns the spool index the next appended reading gets."""
+        with self._lock:
+            if len(self._segments) == 0:
+                return 0
+            last_segment = self._segments[-1]
+            return last_segment.segment_id * self._get_records_per_segment() + last_segment.record_count
+
+    def append(self, lux_value: float, x_position: float, y_position: float, z_position: float,
+               time_stamp: float, tag_id: int = models.NO_TAG_ID) -> int:
+        """Appends one reading and returns its spool index. The timestamp is given in seconds since the epoch."""
+        record = RECORD_FORMAT.pack(lux_value, x_position, y_position, z_position,
+                                    int(time_stamp * models.MICROSECONDS_PER_SECOND), tag_id)
+        with self._lock:
+            self._check_open()
+            segment = self._get_writable_segment()
+            index = segment.segment_id * self._get_records_per_segment() + segment.record_count
+            segment.append(record)
+            self._unsynced_count += 1
+            if self._unsynced_count >= self._sync_group_size or \
+                    time.monotonic() - self._last_sync_time >= self._sync_interval:
+                self.sync()
+            return index
+
+    def _get_writable_segment(self) -> _Segment:
+        if len(self._segments) > 0 and not self._segments[-1].is_full():
+            return self._segments[-1]
+        if len(self._segments) > 0:
+            self._segments[-1].sync()
+        segment_id = 0
+        if len(self._segments) > 0:
+            segment_id = self._segments[-1].segment_id + 1
+        segment = self._open_segment(segment_id, is_new=True)
+        self._segments.append(segment)
+        self._segments_by_id[segment_id] = segment
+        while len(self._segments) > self._max_segments:
+            self._drop_oldest_segment()
+        return segment
+
+    def _drop_oldest_segment(self) -> None:
+        segment = self._segments.pop(0)
+        del self._segments_by_id[segment.segment_id]
+        lost_count = segment.record_count - segment.acknowledged_count
+        logger.warning("Reading spool is full. Dropped {} readings which were not sent yet.".format(lost_count))
+        segment.delete()
+
+    def sync(self) -> None:
+        """Writes all appended readings to disk."""
+        with self._lock:
+            if self._unsynced_count > 0 and len(self._segments) > 0:
+                self._segments[-1].sync()
+            self._unsynced_count = 0
+            self._last_sync_time = time.monotonic()
+
+    def acknowledge(self, start_index: int, end_index: int) -> None:
+        """Marks the readings from start_index up to end_index (exclusive) as received by the Flux-server."""
+        records_per_segment = self._get_records_per_segment()
+        with self._lock:
+            index = start_index
+            while index < end_index:
+                segment_id = index // records_per_segment
+                segment_start = segment_id * records_per_segment
+                segment_end = min(end_index, segment_start + records_per_segment)
+                segment = self._segments_by_id.get(segment_id)
+                if segment is not None:
+                    segment.acknowledge(index - segment_start, segment_end - segment_start)
+                    if segment.is_acknowledged():
+                        self._segments.remove(segment)
+                        del self._segments_by_id[segment_id]
+                        segment.delete()
+                index = segment_end
+
+    def get_unacknowledged_range(self, start_index: int, end_index: int,
+                                 max_count: int) -> Optional[Tuple[int, int]]:
+        """Returns the first contiguous range of unacknowledged readings between start_index and end_index."""
+        records_per_segment = self._get_records_per_segment()
+        with self._lock:
+            for segment in self._segments:
+                segment_start = segment.segment_id * records_per_segment
+                if segment_start + segment.record_count <= start_index:
+                    continue
+                if segment_start >= end_index:
+                    return None
+                unacknowledged_range = segment.get_unacknowledged_range(max(0, start_index - segment_start))
+                if unacknowledged_range is None:
+                    continue
+                first = segment_start + unacknowledged_range[0]
+                if first >= end_index:
+                    return None
+                return first, min(segment_start + unacknowledged_range[1], end_index, first + max_count)
+        return None
+
+    def read_into(self, readings: models.ReadingBuffer, start_index: int, end_index: int) -> None:
+        """Appends the readings from start_index up to end_index (exclusive) of one segment to the buffer."""
+        records_per_segment = self._get_records_per_segment()
+        segment_id = start_index // records_per_segment
+        if (end_index - 1) // records_per_segment != segment_id:
+            raise ValueError("The readings must be stored in the same segment.")
+        with self._lock:
+            segment = self._segments_by_id.get(segment_id)
+            if segment is None:
+                return
+            records = segment.read(start_index % records_per_segment,
+                                   min(end_index - segment_id * records_per_segment, segment.record_count))
+        for lux_value, x_position, y_position, z_position, time_stamp, tag_id in records:
+            readings.append(lux_value, x_position, y_position, z_position,
+                            time_stamp / models.MICROSECONDS_PER_SECOND, tag_id=tag_id)
@@ -0,0 +1,57 @@
+import pytest
+from .context import flux_sensors
+from flux_sensors.localizer.localizer import Localizer
+from flux_sensors.light_sensor.light_sensor import LightSensor
+from flux_sensors.models import models
+from .mock import mock_pozyx, mock_i2c_bus
+from .mock.stub_flux_server import StubFluxServer
+from pypozyx import Coordinates
+
+TEST_POSITION = models.Position(1000, 2000, 3000)
+TEST_ANCHORS = {
+    0x6e4e: Coordinates(-100, 100, 1150),
+    0x6964: Coordinates(8450, 1200, 2150),
+    0x6e5f: Coordinates(1250, 12000, 1150),
+    0x6e62: Coordinates(7350, 11660, 1590)
+}
+
+
+def add_test_anchors(localizer: Localizer) -> None:
+    for anchor_id, coordinates in TEST_ANCHORS.items():
+        localizer.add_anchor_to_cache(anchor_id, coordinates)
+
+
+def create_ams_register(y_count: int = 123) -> dict:
+    return {0x39: {0x80: 0, 0x81: 0, 0x83: 0, 0x8D: 0, 0x90: 0, 0x92: 0, 0X94: 255, 0X95: 73, 0X96: y_count,
+                   0X97: 0, 0X98: 128, 0X99: 64, 0X9A: 147, 0X9B: 0, 0x93: 0x10}}
+
+
+@pytest.fixture
+def pozyx() -> mock_pozyx.MockPozyx:
+    return mock_pozyx.MockPozyx(TEST_POSITION)
+
+
+@pytest.fixture
+def pozyx_localizer(pozyx: mock_pozyx.MockPozyx) -> Localizer:
+    """Initialized localizer at TEST_POSITION with the test anchors."""
+    localizer = Localizer(pozyx)
+    add_test_anchors(localizer)
+    localizer.initialize()
+    return localizer
+
+
+@pytest.fixture
+def ams_light_sensor() -> LightSensor:
+    """Initialized light sensor on a mocked I2C bus."""
+    light_sensor = LightSensor(0x39, mock_i2c_bus.MockI2CBus(create_ams_register()))
+    light_sensor.initialize()
+    return light_sensor
+
+
+@pytest.fixture
+def stub_server(request) -> StubFluxServer:
+    """Running stub of Flux-server, configured by the constructor arguments of an indirect parametrization."""
+    stub_server = StubFluxServer(**getattr(request, "param", {}))
+    stub_server.start()
+    yield stub_server
+    stub_server.stop()
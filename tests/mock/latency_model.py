@@ -0,0 +1,47 @@
+from typing import Optional
+import random
+import threading
+import time
+
+
+class LatencyModel(object):
+    """Latency, jitter and injected errors of a simulated device or connection.
+
+    Every call is delayed by a normally distributed latency (latency +- jitter in seconds, never negative) and fails
+    with the probability error_rate. With a seed, the sequence of delays and errors is reproducible.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 seed: Optional[int] = None) -> None:
+        self._latency = latency
+        self._jitter = jitter
+        self._error_rate = 0.0
+        self.set_error_rate(error_rate)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.call_count = 0
+        self.error_count = 0
+
+    def set_error_rate(self, error_rate: float) -> None:
+        if error_rate < 0 or error_rate > 1:
+            raise ValueError("Argument error_rate must be between 0 and 1.")
+        self._error_rate = error_rate
+
+    def get_delay(self) -> float:
+        with self._lock:
+            return max(0.0, self._random.gauss(self._latency, self._jitter))
+
+    def is_error(self) -> bool:
+        with self._lock:
+            self.call_count += 1
+            if self._error_rate > 0 and self._random.random() < self._error_rate:
+                self.error_count += 1
+                return True
+            return False
+
+    def simulate(self) -> bool:
+        """Waits for the latency of one call and returns whether the call fails."""
+        delay = self.get_delay()
+        if delay > 0:
+            time.sleep(delay)
+        return self.is_error()
@@ -0,0 +1,50 @@
+from typing import List
+from concurrent.futures import Future
+from flux_sensors.flux_server import FluxServer
+
+
+class MockResponse(object):
+
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+
+
+class MockFuturesSession(object):
+
+    def __init__(self, status_codes: List[int], default_status_code: int) -> None:
+        self._status_codes = status_codes
+        self._default_status_code = default_status_code
+        self.sent_data = []  # type: List[bytes]
+        self.sent_headers = []  # type: List[dict]
+
+    def post(self, url: str, data: bytes = None, headers: dict = None) -> Future:
+        if not isinstance(data, bytes):
+            data = b"".join(data)
+        self.sent_data.append(data)
+        self.sent_headers.append(headers)
+        status_code = self._default_status_code
+        if len(self._status_codes) > 0:
+            status_code = self._status_codes.pop(0)
+        future = Future()
+        future.set_result(MockResponse(status_code))
+        return future
+
+
+class MockFluxServer(FluxServer):
+
+    def __init__(self, status_codes: List[int] = None, default_status_code: int = 200,
+                 max_in_flight_uploads: int = 1) -> None:
+        super().__init__({"username": "user", "password": "secret"}, max_in_flight_uploads)
+        if status_codes is None:
+            status_codes = []
+        self._session = MockFuturesSession(list(status_codes), default_status_code)
+        self.sent_data = self._session.sent_data
+        self.sent_headers = self._session.sent_headers
+        self.login_count = 0
+
+    def log_server_response(self, response: MockResponse) -> None:
+        pass
+
+    def login_at_server(self) -> None:
+        self.login_count += 1
+        self._auth_token = "token{}".format(self.login_count)
@@ -1,21 +1,49 @@
 from typing import Dict, List
 from smbus2 import SMBus
+from .latency_model import LatencyModel
+import errno
 
 
 class MockI2CBus(SMBus):
 
-    def __init__(self, register: Dict[int, Dict[int, int]]) -> None:
+    def __init__(self, register: Dict[int, Dict[int, int]], latency_model: LatencyModel = None) -> None:
         super().__init__()
         self._register = register
+        self._latency_model = latency_model
+        self.transaction_count = 0
+
+    def _transaction(self) -> None:
+        self.transaction_count += 1
+        if self._latency_model is not None and self._latency_model.simulate():
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
 
     def read_byte_data(self, device_address: int, register_address: int) -> int:
+        self._transaction()
         return self._register.get(device_address).get(register_address)
 
     def write_byte_data(self, device_address: int, register_address: int, bit_value: int) -> None:
+        self._transaction()
         self._register[device_address][register_address] = bit_value
 
     def read_i2c_block_data(self, device_address: int, register_address: int, length: int) -> List[int]:
+        self._transaction()
         byte_values = []
         for i in range(0, length):
-            byte_values.append(self._register[device_address][register_address + i])
+            byte_values.append(self._register[device_address].get(register_address + i, 0))  # Reserved reads 0
         return byte_values
+
+
+class MockMultiplexedI2CBus(MockI2CBus):
+    """I2C bus with a TCA9548A multiplexer. The registers of the devices behind it are given per channel."""
+
+    def __init__(self, channel_registers: Dict[int, Dict[int, Dict[int, int]]],
+                 multiplexer_address: int = 0x70) -> None:
+        super().__init__({})
+        self._channel_registers = channel_registers
+        self._multiplexer_address = multiplexer_address
+        self.channel_select_count = 0
+
+    def write_byte(self, device_address: int, value: int) -> None:
+        assert device_address == self._multiplexer_address
+        self.channel_select_count += 1
+        self._register = self._channel_registers[value.bit_length() - 1]
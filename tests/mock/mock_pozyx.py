@@ -1,13 +1,16 @@
-from typing import List
+from typing import Dict, List
 from pypozyx import (PozyxSerial, PozyxConstants, PozyxConnectionError, SingleRegister, Data, Coordinates,
-                     DeviceCoordinates, DeviceList)
+                     DeviceCoordinates, DeviceList, DeviceRange, NetworkID)
 from flux_sensors.models import models
+from .latency_model import LatencyModel
 
 
 class MockPozyx(PozyxSerial):
 
     def __init__(self, position: models.Position, error_code: int = 0x00, error_message: str = "none",
-                 state: PozyxConstants = PozyxConstants.POZYX_SUCCESS) -> None:
+                 state: PozyxConstants = PozyxConstants.POZYX_SUCCESS,
+                 anchors_in_range: Dict[int, Coordinates] = None, network_id: int = 0x6000,
+                 latency_model: LatencyModel = None) -> None:
         try:
             super().__init__("")
         except PozyxConnectionError:
@@ -18,6 +21,14 @@ class MockPozyx(PozyxSerial):
         self._state = state
         self._devices = []  # type: List[DeviceCoordinates]
         self._selection_is_set = False
+        self._anchors_in_range = anchors_in_range
+        if anchors_in_range is None:
+            self._anchors_in_range = {}
+        self._network_id = network_id
+        self._latency_model = latency_model
+        self.device_list_write_count = 0
+        self.positioning_count = 0
+        self.positioned_remote_ids = []  # type: List[int]
 
     def getErrorCode(self, error_code: Data, remote_id: int = None) -> PozyxConstants:
         error_code.load(self._error_code)
@@ -28,10 +39,12 @@ class MockPozyx(PozyxSerial):
         return self._error_message
 
     def clearDevices(self, remote_id: int = None) -> PozyxConstants:
+        self.device_list_write_count += 1
         del self._devices[:]
         return self._state
 
     def addDevice(self, device_coordinates: DeviceCoordinates, remote_id: int = None) -> PozyxConstants:
+        self.device_list_write_count += 1
         self._devices.append(device_coordinates)
         return self._state
 
@@ -46,10 +59,29 @@ class MockPozyx(PozyxSerial):
     def doPositioning(self, position: Coordinates, dimension: int = PozyxConstants.POZYX_3D, height: int = 0,
                       algorithm: int = PozyxConstants.POZYX_POS_ALG_TRACKING,
                       remote_id: int = None) -> PozyxConstants:
+        self.positioning_count += 1
+        self.positioned_remote_ids.append(remote_id)
+        if self._latency_model is not None and self._latency_model.simulate():
+            return PozyxConstants.POZYX_FAILURE
         pos = [self._position.get_x(), self._position.get_y(), self._position.get_z()]
         position.load(pos)
         return self._state
 
+    def doRanging(self, destination: int, device_range: DeviceRange, remote_id: int = None) -> PozyxConstants:
+        anchor = self._anchors_in_range.get(destination)
+        if self._latency_model is not None and self._latency_model.simulate():
+            return PozyxConstants.POZYX_FAILURE
+        if anchor is None:
+            return PozyxConstants.POZYX_FAILURE
+        distance = ((anchor.x - self._position.get_x()) ** 2 + (anchor.y - self._position.get_y()) ** 2 +
+                    (anchor.z - self._position.get_z()) ** 2) ** 0.5
+        device_range.load([0, int(round(distance)), -80])
+        return self._state
+
+    def getNetworkId(self, network_id: NetworkID) -> PozyxConstants:
+        network_id.load([self._network_id])
+        return self._state
+
     def printDeviceInfo(self, remote_id: int = None) -> None:
         pass
 
@@ -0,0 +1,236 @@
+from typing import Any, Dict, List, Optional
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from .latency_model import LatencyModel
+import threading
+import time
+import json
+import zlib
+import base64
+
+STUB_AUTH_TOKEN = "Bearer stub-token"
+STUB_TOKEN_HEADER = '{"alg": "HS256", "typ": "JWT"}'
+STUB_EVENT_HEARTBEAT_INTERVAL = 0.5
+STUB_MEASUREMENT = {
+    "name": "Stub measurement",
+    "anchorPositions": [
+        {"anchor": {"networkId": "6e4e"}, "xposition": -100, "yposition": 100, "zposition": 1150},
+        {"anchor": {"networkId": "6964"}, "xposition": 8450, "yposition": 1200, "zposition": 2150},
+        {"anchor": {"networkId": "6e5f"}, "xposition": 1250, "yposition": 12000, "zposition": 1150},
+        {"anchor": {"networkId": "6e62"}, "xposition": 7350, "yposition": 11660, "zposition": 1590}
+    ]
+}
+
+
+def _encode_token_part(part: str) -> str:
+    return base64.urlsafe_b64encode(part.encode()).decode().rstrip("=")
+
+
+def create_stub_token(token_id: int, expiry: float) -> str:
+    """Returns a JSON web token with the exp claim, signed with a dummy signature."""
+    payload = json.dumps({"sub": "user", "jti": token_id, "exp": expiry})
+    return "Bearer {}.{}.stub-signature".format(_encode_token_part(STUB_TOKEN_HEADER), _encode_token_part(payload))
+
+
+class StubFluxServerHandler(BaseHTTPRequestHandler):
+    """Implements the Flux-server routes used by the sensors"""
+    protocol_version = "HTTP/1.1"  # Keeps connections alive
+    disable_nagle_algorithm = True  # Headers and body are written separately
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.count_connection()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.server.count_request()
+        if self.server.simulate_failure():
+            self._send_response(503)
+        elif self.path == "/":
+            self._send_response(200)
+        elif self.path == "/measurements/events" and self.server.measurement_events:
+            if not self._is_authorized():
+                self._send_response(401)
+            else:
+                self._send_measurement_events()
+        elif self.path == "/measurements/active":
+            if not self._is_authorized():
+                self._send_response(401)
+            elif self.server.get_active_measurement() is None:
+                self._send_response(204)
+            else:
+                self._send_response(200, json.dumps(self.server.get_active_measurement()).encode())
+        else:
+            self._send_response(404)
+
+    def do_POST(self) -> None:
+        self.server.count_request()
+        body = self._read_body()
+        if self.server.simulate_failure():
+            self._send_response(503)
+        elif self.path == "/login":
+            credentials = json.loads(body.decode())
+            if credentials != self.server.credentials:
+                self._send_response(401)
+            else:
+                self._send_response(200, self.server.issue_token().encode())
+        elif self.path == "/measurements/active/readings":
+            if not self._is_authorized():
+                self._send_response(401)
+            elif self.server.get_active_measurement() is None:
+                self._send_response(404)
+            else:
+                content_encoding = self.headers.get("Content-Encoding")
+                if content_encoding == "gzip":
+                    body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+                elif content_encoding == "deflate":
+                    body = zlib.decompress(body)
+                self.server.add_readings(json.loads(body.decode()))
+                self._send_response(200)
+        else:
+            self._send_response(404)
+
+    def _send_measurement_events(self) -> None:
+        """Streams heartbeats until a measurement is started, sends its event and closes the stream."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        if self.server.interrupt_measurement_events:
+            return
+        generation = self.server.get_measurement_generation()
+        while True:
+            new_generation = self.server.wait_for_measurement_change(generation, STUB_EVENT_HEARTBEAT_INTERVAL)
+            if new_generation is None:
+                self.wfile.write(b": heartbeat\n\n")
+                self.wfile.flush()
+                continue
+            generation = new_generation
+            active_measurement = self.server.get_active_measurement()
+            if active_measurement is not None:
+                self.wfile.write("event: measurement\ndata: {}\n\n".format(json.dumps(active_measurement)).encode())
+                return
+
+    def _is_authorized(self) -> bool:
+        return self.server.is_valid_token(self.headers.get("Authorization", ""))
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send_response(self, status_code: int, body: bytes = b"") -> None:
+        self.send_response(status_code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubFluxServer(ThreadingMixIn, HTTPServer):
+    """Local stand-in for the Flux-server which counts the opened connections and the handled requests
+
+    With a latency model, every request is answered after the simulated latency and fails with 503 as injected.
+    The time every reading was received is recorded along with it. With measurement_events, the server streams an
+    event when a measurement is started, unless interrupt_measurement_events is set, which closes every stream right
+    away. With a token lifetime, every login issues a new JSON web token, which is
+    rejected once it expired. The token clock offset shifts the exp claim, as a server clock which differs would.
+    """
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, credentials: Dict[str, str] = None,
+                 active_measurement: Optional[Dict[str, Any]] = STUB_MEASUREMENT,
+                 latency_model: LatencyModel = None, measurement_events: bool = False,
+                 token_lifetime: Optional[float] = None, token_clock_offset: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", port), StubFluxServerHandler)
+        self.credentials = credentials
+        if credentials is None:
+            self.credentials = {"username": "user", "password": "secret"}
+        self._active_measurement = active_measurement
+        self._latency_model = latency_model
+        self.measurement_events = measurement_events
+        self.interrupt_measurement_events = False
+        self._token_lifetime = token_lifetime
+        self._token_clock_offset = token_clock_offset
+        self._token_expiries = {}  # type: Dict[str, float]
+        self._lock = threading.Lock()
+        self._measurement_changed = threading.Condition(self._lock)
+        self._measurement_generation = 0
+        self._thread = None  # type: Optional[threading.Thread]
+        self.connection_count = 0
+        self.request_count = 0
+        self.login_count = 0
+        self.rejected_token_count = 0
+        self.readings = []  # type: List[Dict[str, Any]]
+        self.reading_receive_times = []  # type: List[float]
+
+    def get_url(self) -> str:
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def count_connection(self) -> None:
+        with self._lock:
+            self.connection_count += 1
+
+    def simulate_failure(self) -> bool:
+        return self._latency_model is not None and self._latency_model.simulate()
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.request_count += 1
+
+    def issue_token(self) -> str:
+        with self._lock:
+            self.login_count += 1
+            if self._token_lifetime is None:
+                return STUB_AUTH_TOKEN
+            expiry = time.time() + self._token_lifetime
+            token = create_stub_token(self.login_count, expiry + self._token_clock_offset)
+            self._token_expiries[token] = expiry
+            return token
+
+    def is_valid_token(self, token: str) -> bool:
+        with self._lock:
+            if self._token_lifetime is None:
+                is_valid = token == STUB_AUTH_TOKEN
+            else:
+                is_valid = time.time() < self._token_expiries.get(token, 0.0)
+            if not is_valid:
+                self.rejected_token_count += 1
+            return is_valid
+
+    def get_active_measurement(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._active_measurement
+
+    def set_active_measurement(self, active_measurement: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._active_measurement = active_measurement
+            self._measurement_generation += 1
+            self._measurement_changed.notify_all()
+
+    def get_measurement_generation(self) -> int:
+        with self._lock:
+            return self._measurement_generation
+
+    def wait_for_measurement_change(self, generation: int, timeout: float) -> Optional[int]:
+        """Returns the new generation of the active measurement or None if it did not change within the timeout."""
+        with self._lock:
+            self._measurement_changed.wait_for(lambda: self._measurement_generation != generation, timeout)
+            if self._measurement_generation == generation:
+                return None
+            return self._measurement_generation
+
+    def add_readings(self, readings: List[Dict[str, Any]]) -> None:
+        receive_time = time.time()
+        with self._lock:
+            self.readings.extend(readings)
+            self.reading_receive_times.extend([receive_time] * len(readings))
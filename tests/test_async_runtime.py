@@ -0,0 +1,191 @@
+import pytest
+from typing import List
+import asyncio
+import threading
+import time
+from .context import flux_sensors
+from flux_sensors.localizer.localizer import Localizer
+from flux_sensors.light_sensor.light_sensor import LightSensor
+from flux_sensors.batch_policy import BatchPolicy
+from flux_sensors.reading_encoder import ReadingEncoder, CONTENT_ENCODING_GZIP
+from concurrent.futures import ThreadPoolExecutor
+from .mock.stub_flux_server import StubFluxServer, STUB_MEASUREMENT
+from .conftest import TEST_POSITION
+
+async_runtime = pytest.importorskip("flux_sensors.async_runtime")
+
+UNREACHABLE_SERVER_URL = "http://127.0.0.1:9"
+
+
+class TestAsyncRuntime(object):
+
+    @staticmethod
+    def run(coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_measurement_stops_when_stopped_by_server(self, pozyx_localizer: Localizer, ams_light_sensor: LightSensor,
+                                                      stub_server: StubFluxServer) -> None:
+        flux_server = async_runtime.AsyncFluxServer(stub_server.credentials)
+        stopper = threading.Timer(0.5, stub_server.set_active_measurement, [None])
+
+        async def run_measurement() -> None:
+            await flux_server.open()
+            try:
+                assert await flux_server.poll_server_urls([UNREACHABLE_SERVER_URL, stub_server.get_url()], 5)
+                await flux_server.login_at_server()
+                measurement = async_runtime.AsyncMeasurement(
+                    pozyx_localizer, ams_light_sensor, flux_server, ThreadPoolExecutor(max_workers=1),
+                    ThreadPoolExecutor(max_workers=1), 5, BatchPolicy(max_batch_age=0.1),
+                    ReadingEncoder(CONTENT_ENCODING_GZIP))
+                stopper.start()
+                await measurement.run()
+            finally:
+                await flux_server.close()
+
+        self.run(run_measurement())
+        stopper.join()
+
+        assert flux_server.get_server_url() == stub_server.get_url()
+        assert len(stub_server.readings) > 0
+        assert stub_server.readings[0]["xposition"] == TEST_POSITION.get_x()
+
+    def test_measurement_runs_longer_than_its_timeout(self, pozyx_localizer: Localizer,
+                                                      ams_light_sensor: LightSensor,
+                                                      stub_server: StubFluxServer) -> None:
+        flux_server = async_runtime.AsyncFluxServer(stub_server.credentials)
+        stopper = threading.Timer(2.5, stub_server.set_active_measurement, [None])
+
+        async def run_measurement() -> float:
+            await flux_server.open()
+            try:
+                assert await flux_server.poll_server_urls([stub_server.get_url()], 5)
+                await flux_server.login_at_server()
+                measurement = async_runtime.AsyncMeasurement(
+                    pozyx_localizer, ams_light_sensor, flux_server, ThreadPoolExecutor(max_workers=1),
+                    ThreadPoolExecutor(max_workers=1), 1, BatchPolicy(max_batch_age=0.1),
+                    ReadingEncoder(CONTENT_ENCODING_GZIP))
+                start_time = time.monotonic()
+                stopper.start()
+                await measurement.run()
+                return time.monotonic() - start_time
+            finally:
+                await flux_server.close()
+
+        duration = self.run(run_measurement())
+        stopper.join()
+        # Every accepted batch extends the timeout, so only the server stops the measurement.
+        assert duration >= 2.5
+
+    def test_poll_server_urls_fails_without_server(self) -> None:
+        flux_server = async_runtime.AsyncFluxServer({})
+
+        async def poll() -> bool:
+            await flux_server.open()
+            try:
+                return await flux_server.poll_server_urls([UNREACHABLE_SERVER_URL], 1)
+            finally:
+                await flux_server.close()
+
+        assert not self.run(poll())
+
+    @pytest.mark.parametrize("stub_server", [{"active_measurement": None, "measurement_events": True}], indirect=True)
+    def test_measurement_starts_on_event(self, stub_server: StubFluxServer) -> None:
+        flux_server = async_runtime.AsyncFluxServer(stub_server.credentials)
+        starter = threading.Timer(1.0, stub_server.set_active_measurement, [STUB_MEASUREMENT])
+
+        async def poll() -> bool:
+            await flux_server.open()
+            try:
+                assert await flux_server.poll_server_urls([stub_server.get_url()], 3)
+                starter.start()
+                return await flux_server.poll_active_measurement()
+            finally:
+                await flux_server.close()
+
+        request_count = stub_server.request_count
+        assert self.run(poll())
+        starter.join()
+        # The probe, the event stream with a login, the check before the event and the check after it
+        assert stub_server.request_count - request_count == 6
+
+    @pytest.mark.parametrize("stub_server", [{"active_measurement": None, "measurement_events": True}], indirect=True)
+    def test_interrupted_event_stream_keeps_backoff(self, stub_server: StubFluxServer) -> None:
+        stub_server.interrupt_measurement_events = True
+        flux_server = async_runtime.AsyncFluxServer(stub_server.credentials)
+        starter = threading.Timer(1.5, stub_server.set_active_measurement, [STUB_MEASUREMENT])
+
+        async def poll() -> bool:
+            await flux_server.open()
+            try:
+                assert await flux_server.poll_server_urls([stub_server.get_url()], 3)
+                starter.start()
+                return await flux_server.poll_active_measurement()
+            finally:
+                await flux_server.close()
+
+        request_count = stub_server.request_count
+        assert self.run(poll())
+        starter.join()
+        assert stub_server.request_count - request_count <= 11
+
+    # Every token has expired when it arrives.
+    @pytest.mark.parametrize("stub_server", [{"token_lifetime": -1.0}], indirect=True)
+    def test_active_measurement_is_not_read_with_rejected_token(self, stub_server: StubFluxServer) -> None:
+        flux_server = async_runtime.AsyncFluxServer(stub_server.credentials)
+
+        async def get_active_measurement() -> str:
+            await flux_server.open()
+            try:
+                assert await flux_server.poll_server_urls([stub_server.get_url()], 3)
+                return await flux_server.get_active_measurement()
+            finally:
+                await flux_server.close()
+
+        with pytest.raises(async_runtime.AuthorizationError):
+            self.run(get_active_measurement())
+
+    def test_failed_connections_are_retried(self, stub_server: StubFluxServer, monkeypatch) -> None:
+        retries = []  # type: List[int]
+        monkeypatch.setattr("flux_sensors.async_runtime.get_retry_backoff", lambda retry: retries.append(retry) or 0)
+        flux_server = async_runtime.AsyncFluxServer(stub_server.credentials, max_retries=2)
+
+        async def get_active_measurement() -> str:
+            await flux_server.open()
+            assert await flux_server.poll_server_urls([stub_server.get_url()], 3)
+            await flux_server.close()  # Drops the open connection, so the next request connects again.
+            stub_server.stop()
+            await flux_server.open()
+            try:
+                return await flux_server.get_active_measurement()
+            finally:
+                await flux_server.close()
+
+        with pytest.raises(async_runtime.aiohttp.ClientConnectorError):
+            self.run(get_active_measurement())
+        assert retries == [0, 1]
+
+    @pytest.mark.parametrize("stub_server", [{"token_lifetime": 1.0}], indirect=True)
+    def test_token_is_refreshed_before_it_expires(self, stub_server: StubFluxServer, monkeypatch) -> None:
+        monkeypatch.setattr("flux_sensors.flux_server.MIN_TOKEN_REFRESH_DELAY", 0.1)
+        flux_server = async_runtime.AsyncFluxServer(stub_server.credentials)
+
+        async def send_readings() -> List[int]:
+            await flux_server.open()
+            try:
+                assert await flux_server.poll_server_urls([stub_server.get_url()], 3)
+                await flux_server.login_at_server()
+                status_codes = []
+                for i in range(0, 25):
+                    status_codes.append(await flux_server.send_data_to_server(b'[{"luxValue": 123}]'))
+                    await asyncio.sleep(0.1)
+                return status_codes
+            finally:
+                await flux_server.close()
+
+        assert set(self.run(send_readings())) == {200}
+        assert stub_server.rejected_token_count == 0
+        assert stub_server.login_count >= 3
@@ -0,0 +1,34 @@
+import pytest
+from .context import flux_sensors
+from flux_sensors.batch_policy import BatchPolicy
+
+
+class TestBatchPolicy(object):
+
+    @pytest.fixture
+    def batch_policy(self) -> BatchPolicy:
+        return BatchPolicy(min_batch_size=3, max_batch_size=500, max_batch_age=1.0, max_in_flight_uploads=1)
+
+    def test_flush_on_size_or_age(self, batch_policy: BatchPolicy) -> None:
+        assert not batch_policy.should_flush(0, 5.0)
+        assert not batch_policy.should_flush(2, 0.5)
+        assert batch_policy.should_flush(3, 0.5)
+        assert batch_policy.should_flush(1, 1.0)
+
+    def test_target_size_follows_latency(self, batch_policy: BatchPolicy) -> None:
+        # 100 readings per second with 100 bytes each
+        batch_policy.record_flush(10, 1000, 0.0)
+        batch_policy.record_flush(10, 1000, 0.1)
+        batch_policy.record_upload(1000, 0.01)
+        fast_target_size = batch_policy.get_target_size()
+
+        batch_policy.record_upload(1000, 0.5)
+        batch_policy.record_upload(1000, 0.5)
+        assert fast_target_size == 3
+        assert batch_policy.get_target_size() > fast_target_size
+
+    def test_target_size_is_limited(self, batch_policy: BatchPolicy) -> None:
+        batch_policy.record_flush(100, 10000, 0.0)
+        batch_policy.record_flush(100, 10000, 0.1)
+        batch_policy.record_upload(10000, 10.0)
+        assert batch_policy.get_target_size() == 500
@@ -0,0 +1,60 @@
+import pytest
+import logging
+from .context import flux_sensors
+from flux_sensors.batch_policy import BatchPolicy
+from flux_sensors.config_loader import (ConfigLoader, DEFAULT_MIN_BATCH_SIZE, DEFAULT_MAX_BATCH_SIZE,
+                                        DEFAULT_MAX_BATCH_AGE, DEFAULT_SPOOL_MAX_SIZE,
+                                        DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS)
+
+BASE_CONFIG = """[Flux Server Credentials]
+username=user
+password=secret
+
+[Flux Server Connection Settings]
+timeout=10
+
+[Flux Server URLs]
+server1=http://localhost:9000
+"""
+
+
+class TestConfigLoader(object):
+
+    def test_missing_optional_sections_are_not_errors(self, tmpdir, caplog) -> None:
+        config_file = tmpdir.join("flux-config.ini")
+        config_file.write(BASE_CONFIG)
+        with caplog.at_level(logging.INFO):
+            config_loader = ConfigLoader(str(config_file))
+        assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+        assert config_loader.get_min_batch_size() == DEFAULT_MIN_BATCH_SIZE
+        assert config_loader.get_spool_max_size() == DEFAULT_SPOOL_MAX_SIZE
+
+    def test_wrong_int_value_falls_back_to_default(self, tmpdir) -> None:
+        config_file = tmpdir.join("flux-config.ini")
+        config_file.write(BASE_CONFIG + "\n[Flux Server Batch Settings]\nmin_batch_size=many\n")
+        assert ConfigLoader(str(config_file)).get_min_batch_size() == DEFAULT_MIN_BATCH_SIZE
+
+    @pytest.mark.parametrize("max_in_flight_uploads", [0, -2])
+    def test_upload_window_below_one_falls_back_to_default(self, tmpdir, max_in_flight_uploads: int) -> None:
+        config_file = tmpdir.join("flux-config.ini")
+        config_file.write(BASE_CONFIG.replace("timeout=10", "timeout=10\nmax_in_flight_uploads={}".format(
+            max_in_flight_uploads)))
+        assert ConfigLoader(str(config_file)).get_max_in_flight_uploads() == DEFAULT_FLUX_SERVER_MAX_IN_FLIGHT_UPLOADS
+
+    def test_too_small_spool_falls_back_to_default(self, tmpdir, caplog) -> None:
+        config_file = tmpdir.join("flux-config.ini")
+        config_file.write(BASE_CONFIG + "\n[Flux Sensor Spool]\nmax_size=0\n")
+        assert ConfigLoader(str(config_file)).get_spool_max_size() == DEFAULT_SPOOL_MAX_SIZE
+        assert "max_size" in caplog.text
+
+    @pytest.mark.parametrize("batch_settings", ["min_batch_size=0", "min_batch_size=10\nmax_batch_size=5",
+                                                "max_batch_age=0", "max_batch_age=-1.5"])
+    def test_invalid_batch_settings_fall_back_to_defaults(self, tmpdir, batch_settings: str) -> None:
+        config_file = tmpdir.join("flux-config.ini")
+        config_file.write(BASE_CONFIG + "\n[Flux Server Batch Settings]\n" + batch_settings + "\n")
+        config_loader = ConfigLoader(str(config_file))
+        BatchPolicy(config_loader.get_min_batch_size(), config_loader.get_max_batch_size(),
+                    config_loader.get_max_batch_age())
+        assert config_loader.get_min_batch_size() == DEFAULT_MIN_BATCH_SIZE
+        assert config_loader.get_max_batch_size() == DEFAULT_MAX_BATCH_SIZE
+        assert config_loader.get_max_batch_age() == DEFAULT_MAX_BATCH_AGE
@@ -0,0 +1,37 @@
+import json
+import os
+from .context import flux_sensors
+from flux_sensors.config_loader import ConfigLoader
+from flux_sensors.flux_sensor import FluxSensor
+from .mock.stub_flux_server import STUB_MEASUREMENT
+
+
+class TestFluxSensor(object):
+
+    @staticmethod
+    def create_flux_sensor(tmpdir) -> FluxSensor:
+        config_file = tmpdir.join("flux-config.ini")
+        config_file.write("[Flux Sensor Spool]\ndirectory={}\n".format(tmpdir.join("spool")))
+        return FluxSensor(None, None, ConfigLoader(str(config_file)), None)
+
+    def test_measurement_key_depends_on_name_and_anchors(self) -> None:
+        measurement = dict(STUB_MEASUREMENT)
+        key = FluxSensor.get_measurement_key(json.dumps(measurement))
+        assert key is not None
+        measurement["anchorPositions"] = list(reversed(measurement["anchorPositions"]))
+        assert FluxSensor.get_measurement_key(json.dumps(measurement)) == key
+        measurement["name"] = "Other measurement"
+        assert FluxSensor.get_measurement_key(json.dumps(measurement)) != key
+        del measurement["name"]
+        assert FluxSensor.get_measurement_key(json.dumps(measurement)) is None
+
+    def test_spool_is_not_used_without_measurement_name(self, tmpdir) -> None:
+        flux_sensor = self.create_flux_sensor(tmpdir)
+        measurement = dict(STUB_MEASUREMENT)
+        flux_sensor.open_spool(json.dumps(measurement))
+        assert os.listdir(str(tmpdir.join("spool"))) == [FluxSensor.get_measurement_key(json.dumps(measurement))]
+
+        del measurement["name"]
+        flux_sensor.open_spool(json.dumps(measurement))
+        assert flux_sensor.get_spool() is None
+        flux_sensor.close_spool()
@@ -0,0 +1,209 @@
+import pytest
+import socket
+import threading
+import time
+from .context import flux_sensors
+from flux_sensors.flux_server import (FluxServer, AuthorizationError, TokenRefreshSchedule, get_polling_delay,
+                                      get_token_expiry, MIN_POLLING_DELAY, MAX_POLLING_DELAY, MIN_TOKEN_REFRESH_DELAY)
+from .mock import mock_flux_server
+from .mock.stub_flux_server import StubFluxServer, STUB_MEASUREMENT, STUB_AUTH_TOKEN, create_stub_token
+
+
+class TestFluxServer(object):
+
+    @pytest.fixture
+    def flux_server(self) -> mock_flux_server.MockFluxServer:
+        return mock_flux_server.MockFluxServer([401, 401, 200], max_in_flight_uploads=3)
+
+    def test_upload_window(self, flux_server: mock_flux_server.MockFluxServer) -> None:
+        for i in range(0, 3):
+            assert flux_server.has_free_upload_slot()
+            flux_server.send_data_to_server("[{}]".format(i).encode())
+        assert not flux_server.has_free_upload_slot()
+
+        uploads = flux_server.wait_for_uploads(1)
+        assert [upload.sequence_number for upload in uploads] == [0, 1, 2]
+        assert [upload.get_status_code() for upload in uploads] == [401, 401, 200]
+        assert flux_server.get_number_of_pending_uploads() == 0
+
+    def test_single_login_for_outstanding_uploads(self, flux_server: mock_flux_server.MockFluxServer) -> None:
+        flux_server.send_data_to_server(b"[0]")
+        flux_server.send_data_to_server(b"[1]")
+        for upload in flux_server.wait_for_uploads(1):
+            flux_server.login_for_upload(upload)
+            resent_upload = flux_server.resend_upload(upload)
+            assert resent_upload.sequence_number == upload.sequence_number
+        assert flux_server.login_count == 1
+
+
+class TestFluxServerTransport(object):
+
+    @pytest.fixture
+    def hanging_server_url(self) -> str:
+        """URL of a server which accepts connections but never responds."""
+        hanging_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            hanging_socket.bind(("127.0.0.1", 0))
+            hanging_socket.listen(1)
+            yield "http://127.0.0.1:{}".format(hanging_socket.getsockname()[1])
+        finally:
+            hanging_socket.close()
+
+    def test_requests_share_one_connection(self, stub_server: StubFluxServer) -> None:
+        flux_server = FluxServer({"username": "user", "password": "secret"})
+        assert flux_server.poll_server_urls([stub_server.get_url()], 3)
+        assert flux_server.get_active_measurement().status_code == 200
+        flux_server.send_data_to_server(b'[{"luxValue": 123}]')
+        uploads = flux_server.wait_for_uploads(3)
+
+        assert uploads[0].get_status_code() == 200
+        assert stub_server.readings == [{"luxValue": 123}]
+        assert stub_server.connection_count == 1
+
+    def test_large_batch_is_sent_with_content_length(self, stub_server: StubFluxServer) -> None:
+        flux_server = FluxServer(stub_server.credentials)
+        assert flux_server.poll_server_urls([stub_server.get_url()], 3)
+        flux_server.login_at_server()
+        data = ("[" + ",".join(['{"luxValue": 123}'] * 10000) + "]").encode()
+        flux_server.send_data_to_server(data)
+        uploads = flux_server.wait_for_uploads(3)
+
+        assert uploads[0].get_status_code() == 200
+        assert len(stub_server.readings) == 10000
+
+    def test_first_responding_server_url_is_selected(self, stub_server: StubFluxServer,
+                                                     hanging_server_url: str) -> None:
+        flux_server = FluxServer({"username": "user", "password": "secret"})
+
+        start_time = time.monotonic()
+        assert flux_server.poll_server_urls([hanging_server_url, stub_server.get_url()], 5)
+        assert time.monotonic() - start_time < 1
+        assert flux_server.get_server_url() == stub_server.get_url()
+
+        start_time = time.monotonic()
+        assert flux_server.poll_server_urls([hanging_server_url, stub_server.get_url()], 5)
+        assert time.monotonic() - start_time < 1
+
+    @staticmethod
+    def start_measurement_later(stub_server: StubFluxServer, delay: float) -> threading.Timer:
+        start_timer = threading.Timer(delay, stub_server.set_active_measurement, [STUB_MEASUREMENT])
+        start_timer.start()
+        return start_timer
+
+    @pytest.mark.parametrize("stub_server", [{"active_measurement": None, "measurement_events": True}], indirect=True)
+    def test_measurement_starts_on_event(self, stub_server: StubFluxServer) -> None:
+        flux_server = FluxServer(stub_server.credentials)
+        assert flux_server.poll_server_urls([stub_server.get_url()], 3)
+        request_count = stub_server.request_count
+
+        start_time = time.monotonic()
+        start_timer = self.start_measurement_later(stub_server, 1.5)
+        assert flux_server.poll_active_measurement()
+        assert time.monotonic() - start_time < 2.0
+        # The event stream with a login, the check before the event and the check after it
+        assert stub_server.request_count - request_count == 5
+        start_timer.join()
+
+    @pytest.mark.parametrize("stub_server", [{"active_measurement": None, "measurement_events": True}], indirect=True)
+    def test_interrupted_event_stream_keeps_backoff(self, stub_server: StubFluxServer) -> None:
+        stub_server.interrupt_measurement_events = True
+        flux_server = FluxServer(stub_server.credentials)
+        assert flux_server.poll_server_urls([stub_server.get_url()], 3)
+        request_count = stub_server.request_count
+
+        start_timer = self.start_measurement_later(stub_server, 1.5)
+        assert flux_server.poll_active_measurement()
+        # Each backoff step opens the stream and checks the active measurement, a tight loop would send hundreds
+        assert stub_server.request_count - request_count <= 10
+        start_timer.join()
+
+    @pytest.mark.parametrize("stub_server", [{"active_measurement": None}], indirect=True)
+    def test_polling_falls_back_to_backoff_without_events(self, stub_server: StubFluxServer) -> None:
+        flux_server = FluxServer(stub_server.credentials)
+        assert flux_server.poll_server_urls([stub_server.get_url()], 3)
+        request_count = stub_server.request_count
+
+        start_timer = self.start_measurement_later(stub_server, 1.0)
+        assert flux_server.poll_active_measurement()
+        assert stub_server.request_count - request_count <= 6
+        start_timer.join()
+
+    @pytest.mark.parametrize("stub_server", [{"token_lifetime": 1.0}], indirect=True)
+    def test_token_is_refreshed_before_it_expires(self, stub_server: StubFluxServer, monkeypatch) -> None:
+        monkeypatch.setattr("flux_sensors.flux_server.MIN_TOKEN_REFRESH_DELAY", 0.1)
+        flux_server = FluxServer(stub_server.credentials)
+        assert flux_server.poll_server_urls([stub_server.get_url()], 3)
+        flux_server.login_at_server()
+
+        status_codes = []
+        end_time = time.monotonic() + 2.5
+        while time.monotonic() < end_time:
+            flux_server.send_data_to_server(b'[{"luxValue": 123}]')
+            status_codes += [upload.get_status_code() for upload in flux_server.wait_for_uploads(1)]
+            time.sleep(0.1)
+        flux_server.cancel_token_refresh()
+
+        assert set(status_codes) == {200}
+        assert stub_server.rejected_token_count == 0
+        assert stub_server.login_count >= 3
+
+    def test_token_without_expiry_is_refreshed_after_configured_lifetime(self, stub_server: StubFluxServer,
+                                                                         monkeypatch) -> None:
+        monkeypatch.setattr("flux_sensors.flux_server.MIN_TOKEN_REFRESH_DELAY", 0.1)
+        flux_server = FluxServer(stub_server.credentials, token_lifetime=0.5)
+        assert flux_server.poll_server_urls([stub_server.get_url()], 3)
+        flux_server.login_at_server()
+        time.sleep(1.0)
+        flux_server.cancel_token_refresh()
+        assert stub_server.login_count >= 2
+
+    def test_token_without_expiry_is_not_refreshed(self, stub_server: StubFluxServer) -> None:
+        flux_server = FluxServer(stub_server.credentials)
+        assert flux_server.poll_server_urls([stub_server.get_url()], 3)
+        flux_server.login_at_server()
+        time.sleep(0.5)
+        assert stub_server.login_count == 1
+
+    # Every token has expired when it arrives.
+    @pytest.mark.parametrize("stub_server", [{"token_lifetime": -1.0}], indirect=True)
+    def test_active_measurement_is_not_read_with_rejected_token(self, stub_server: StubFluxServer) -> None:
+        flux_server = FluxServer(stub_server.credentials)
+        assert flux_server.poll_server_urls([stub_server.get_url()], 3)
+        with pytest.raises(AuthorizationError):
+            flux_server.get_active_measurement()
+        assert stub_server.login_count == 1
+
+    @pytest.mark.parametrize("stub_server", [{"token_lifetime": 60.0, "token_clock_offset": -120.0}], indirect=True)
+    def test_token_expired_by_the_local_clock_is_not_refreshed(self, stub_server: StubFluxServer, monkeypatch) -> None:
+        monkeypatch.setattr("flux_sensors.flux_server.MIN_TOKEN_REFRESH_DELAY", 0.1)
+        # The exp claim lies in the past, as it does on a Raspberry Pi whose clock is not synchronized yet.
+        flux_server = FluxServer(stub_server.credentials)
+        assert flux_server.poll_server_urls([stub_server.get_url()], 3)
+        flux_server.login_at_server()
+        time.sleep(0.5)
+        flux_server.cancel_token_refresh()
+        assert stub_server.login_count == 1
+
+
+def test_token_refresh_delay() -> None:
+    token_refresh_schedule = TokenRefreshSchedule()
+    assert token_refresh_schedule.get_refresh_delay(create_stub_token(1, time.time() - 10), time.monotonic()) is None
+    assert token_refresh_schedule.get_refresh_delay(create_stub_token(2, time.time() + 1), time.monotonic()) == \
+        MIN_TOKEN_REFRESH_DELAY
+    refresh_delay = token_refresh_schedule.get_refresh_delay(create_stub_token(3, time.time() + 3600), time.monotonic())
+    assert 2800 < refresh_delay < 2900
+    assert TokenRefreshSchedule(60.0).get_refresh_delay(STUB_AUTH_TOKEN, time.monotonic()) == 48.0
+
+
+def test_token_expiry() -> None:
+    assert get_token_expiry(create_stub_token(1, 1500000000.5)) == 1500000000.5
+    assert get_token_expiry(STUB_AUTH_TOKEN) is None
+    assert get_token_expiry("Bearer a.!!!.c") is None
+    assert get_token_expiry("Bearer a.W10.c") is None  # The payload is a JSON array
+
+
+def test_polling_delay_grows_with_jitter() -> None:
+    delays = [get_polling_delay(attempt) for attempt in range(0, 10)]
+    assert MIN_POLLING_DELAY / 2 <= delays[0] <= MIN_POLLING_DELAY
+    assert all(MAX_POLLING_DELAY / 2 <= delay <= MAX_POLLING_DELAY for delay in delays[6:])
+    assert len(set(get_polling_delay(3) for i in range(0, 10))) > 1
@@ -0,0 +1,67 @@
+import pytest
+from .context import flux_sensors
+from flux_sensors.localizer.localizer import PozyxDeviceError
+from flux_sensors.models import models
+from .mock import mock_pozyx
+from pypozyx import Coordinates
+
+np = pytest.importorskip("numpy")
+from flux_sensors.localizer.host_localizer import HostLocalizer
+from flux_sensors.localizer.multilateration import Multilateration
+
+TEST_POSITION = models.Position(4000, 5000, 1000)
+TEST_ANCHORS = {
+    0x6e4e: Coordinates(-100, 100, 1150),
+    0x6964: Coordinates(8450, 1200, 2150),
+    0x6e5f: Coordinates(1250, 12000, 1150),
+    0x6e62: Coordinates(7350, 11660, 1590),
+    0x6e63: Coordinates(4000, 6000, 2500)
+}
+
+
+class TestHostLocalizer(object):
+
+    def create_localizer(self, anchors_in_range) -> HostLocalizer:
+        localizer = HostLocalizer(mock_pozyx.MockPozyx(TEST_POSITION, anchors_in_range=anchors_in_range))
+        for anchor_id, coordinates in TEST_ANCHORS.items():
+            localizer.add_anchor_to_cache(anchor_id, coordinates)
+        localizer.initialize()
+        return localizer
+
+    def test_positioning(self) -> None:
+        localizer = self.create_localizer(TEST_ANCHORS)
+        for i in range(0, 2):  # The second fix starts from the first one.
+            position = localizer.do_positioning()
+            assert position.get_x() == pytest.approx(TEST_POSITION.get_x(), abs=5)
+            assert position.get_y() == pytest.approx(TEST_POSITION.get_y(), abs=5)
+            assert position.get_z() == pytest.approx(TEST_POSITION.get_z(), abs=5)
+            assert localizer.get_last_residual() < 5
+
+    def test_positioning_fails_without_enough_ranges(self) -> None:
+        localizer = self.create_localizer({0x6e4e: TEST_ANCHORS[0x6e4e], 0x6964: TEST_ANCHORS[0x6964]})
+        with pytest.raises(PozyxDeviceError):
+            localizer.do_positioning()
+
+    def test_missing_ranges_are_ignored(self) -> None:
+        anchors = np.array([[c.x, c.y, c.z] for c in TEST_ANCHORS.values()], dtype=float)
+        position = np.array([2000, 3000, 800], dtype=float)
+        distances = np.linalg.norm(position - anchors, axis=1)
+        distances[2] = np.nan
+
+        solved, residual = Multilateration(anchors).solve(distances)
+        assert np.allclose(solved, position, atol=1)
+        assert residual < 1
+
+    def test_coplanar_anchors_place_the_tag_below_them(self) -> None:
+        anchors = np.array([[0, 0, 2500], [8000, 0, 2510], [8000, 10000, 2490], [0, 10000, 2505],
+                            [4000, 6000, 2500]], dtype=float)
+        position = np.array([3000, 4000, 1000], dtype=float)
+        multilateration = Multilateration(anchors)
+        assert multilateration.is_coplanar()
+
+        random_state = np.random.RandomState(1)
+        for i in range(0, 100):
+            distances = np.linalg.norm(position - anchors, axis=1) + random_state.normal(0, 30, len(anchors))
+            solved, residual = multilateration.solve(distances)
+            assert np.allclose(solved, position, atol=300)
+            assert residual < 100
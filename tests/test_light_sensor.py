@@ -1,37 +1,17 @@
 import pytest
 import json
+import time
+import logging
 from .context import flux_sensors
-from flux_sensors.light_sensor.light_sensor import LightSensor
+from flux_sensors.light_sensor.light_sensor import LightSensor, MAX_MISSED_INTERRUPTS
 from .mock import mock_i2c_bus
-
-mock_ams_register = {
-    0x39: {
-        0x80: 0,
-        0x81: 0,
-        0x83: 0,
-        0x8D: 0,
-        0x90: 0,
-        0x92: 0,
-        0X94: 255,
-        0X95: 73,
-        0X96: 123,
-        0X97: 0,
-        0X98: 128,
-        0X99: 64,
-        0X9A: 147,
-        0X9B: 0
-    }
-}
-
+from .conftest import create_ams_register
 
 class TestLightSensor(object):
 
-    @pytest.fixture
-    def ams_light_sensor(self) -> LightSensor:
-        return LightSensor(0x39, mock_i2c_bus.MockI2CBus(mock_ams_register))
-
-    def test_initialization(self, ams_light_sensor: LightSensor) -> None:
-        ams_light_sensor.initialize()
+    def test_initialization(self) -> None:
+        register = create_ams_register()
+        LightSensor(0x39, mock_i2c_bus.MockI2CBus(register)).initialize()
 
         target_ams_register = {
             0x39: {
@@ -48,16 +28,79 @@ class TestLightSensor(object):
                 0X98: 128,
                 0X99: 64,
                 0X9A: 147,
-                0X9B: 0
+                0X9B: 0,
+                0x93: 0x10
             }
         }
 
-        mock_ams_register_json = json.dumps(mock_ams_register, sort_keys=True)
-        target_ams_register_json = json.dumps(target_ams_register, sort_keys=True)
-
-        assert mock_ams_register_json == target_ams_register_json
+        assert json.dumps(register, sort_keys=True) == json.dumps(target_ams_register, sort_keys=True)
 
     def test_measurement(self, ams_light_sensor: LightSensor) -> None:
-        ams_light_sensor.initialize()
-        illuminance = ams_light_sensor.do_measurement()
-        assert illuminance == 123
+        assert ams_light_sensor.do_measurement() == 123  # The raw Y counts of the reference setting
+
+    def test_read_all_channels(self, ams_light_sensor: LightSensor) -> None:
+        channels = ams_light_sensor.read_all_channels()
+        assert channels.get_z() == 73 * 256 + 255
+        assert channels.get_y() == 123
+        assert channels.get_ir1() == 64 * 256 + 128
+        assert channels.get_x() == 147
+
+    def test_sample_waits_for_next_integration_cycle(self, ams_light_sensor: LightSensor) -> None:
+        ams_light_sensor.initialize(atime=9)
+        first_sample = ams_light_sensor.sample()
+        repeated_sample = ams_light_sensor.sample(wait=False)
+        start_time = time.monotonic()
+        next_sample = ams_light_sensor.sample()
+
+        assert first_sample.is_fresh
+        assert not repeated_sample.is_fresh
+        assert repeated_sample.get_lux_value() == first_sample.get_lux_value()
+        assert next_sample.is_fresh
+        assert time.monotonic() - start_time >= ams_light_sensor.get_cycle_time() / 1000 * 0.9 - 0.005
+
+    def test_missing_interrupt_flag_falls_back_to_timer(self, caplog) -> None:
+        register = create_ams_register()
+        register[0x39][0x93] = 0  # The ALS interrupt flag is never set.
+        bus = mock_i2c_bus.MockI2CBus(register)
+        light_sensor = LightSensor(0x39, bus)
+        light_sensor.initialize(atime=0)
+        with caplog.at_level(logging.WARNING):
+            for i in range(0, MAX_MISSED_INTERRUPTS + 5):
+                assert light_sensor.sample().is_fresh
+        assert len([record for record in caplog.records if record.levelno == logging.WARNING]) == 1
+
+        transaction_count = bus.transaction_count
+        light_sensor.sample()
+        assert bus.transaction_count - transaction_count == 1  # Only the channels are read, not the status.
+
+    def test_auto_range_leaves_saturation(self) -> None:
+        register = create_ams_register()
+        for data_register in range(0x94, 0x9C):
+            register[0x39][data_register] = 0xFF
+        light_sensor = LightSensor(0x39, mock_i2c_bus.MockI2CBus(register))
+        light_sensor.initialize(auto_range=True)
+        light_sample = light_sensor.sample()
+
+        assert light_sensor.get_gain_factor() == 1
+        assert light_sample.get_lux_value() == pytest.approx(0xFFFF * (54 * 4) / 18)
+
+    def test_auto_range_increases_sensitivity_in_the_dark(self) -> None:
+        register = create_ams_register()
+        for data_register in range(0x94, 0x9C):
+            register[0x39][data_register] = 0
+        light_sensor = LightSensor(0x39, mock_i2c_bus.MockI2CBus(register))
+        light_sensor.initialize(auto_range=True)
+        light_sensor.sample()
+
+        assert light_sensor.get_gain_factor() == 64
+        assert register[0x39][0x90] == 0b11
+
+    def test_reinitialization_skips_unchanged_registers(self) -> None:
+        bus = mock_i2c_bus.MockI2CBus(create_ams_register())
+        light_sensor = LightSensor(0x39, bus)
+        light_sensor.initialize()
+        assert bus.transaction_count <= 6  # One block read of the configuration and the changed registers
+
+        transaction_count = bus.transaction_count
+        light_sensor.initialize()
+        assert bus.transaction_count == transaction_count
@@ -0,0 +1,53 @@
+import pytest
+import json
+from .context import flux_sensors
+from flux_sensors.light_sensor.light_sensor import LightSensor
+from flux_sensors.light_sensor.light_sensor_array import LightSensorArray, I2CMultiplexer, MultiplexedBus
+from flux_sensors.localizer.localizer import Localizer
+from flux_sensors.measurement_pipeline import MeasurementPipeline
+from flux_sensors.models import models
+from .mock import mock_i2c_bus, mock_flux_server
+from .conftest import create_ams_register
+
+OFFSETS = (models.Position(0, 100, 0), models.Position(0, -100, 0))
+
+
+class TestLightSensorArray(object):
+
+    @pytest.fixture
+    def light_sensor_array(self) -> LightSensorArray:
+        light_sensor_array = LightSensorArray()
+        for bus_id, y_count in ((1, 100), (3, 200)):
+            light_sensor_array.add_light_sensor(
+                bus_id, LightSensor(0x39, mock_i2c_bus.MockI2CBus(create_ams_register(y_count))), OFFSETS[bus_id // 2])
+        light_sensor_array.initialize()
+        yield light_sensor_array
+        light_sensor_array.close()
+
+    def test_sample_all_buses(self, light_sensor_array: LightSensorArray) -> None:
+        light_sample = light_sensor_array.sample()
+        assert light_sample.is_fresh
+        assert light_sample.lux_values[1] == 2 * light_sample.lux_values[0]
+        assert light_sample.offsets == list(OFFSETS)
+
+    def test_multiplexed_sensors(self) -> None:
+        bus = mock_i2c_bus.MockMultiplexedI2CBus({0: create_ams_register(100), 5: create_ams_register(200)})
+        multiplexer = I2CMultiplexer(bus)
+        light_sensor_array = LightSensorArray()
+        for channel in (0, 5):
+            light_sensor_array.add_light_sensor(1, LightSensor(0x39, MultiplexedBus(multiplexer, bus, channel)))
+        light_sensor_array.initialize()
+        select_count = bus.channel_select_count
+
+        light_sample = light_sensor_array.sample()
+        light_sensor_array.close()
+        assert light_sample.lux_values[1] == 2 * light_sample.lux_values[0]
+        assert bus.channel_select_count - select_count <= 4  # Once per sensor and cycle, not per transaction
+
+    def test_readings_are_offset(self, light_sensor_array: LightSensorArray, pozyx_localizer: Localizer) -> None:
+        flux_server = mock_flux_server.MockFluxServer([200, 404])
+        MeasurementPipeline(pozyx_localizer, light_sensor_array, flux_server, 5).run()
+
+        readings = json.loads(flux_server.sent_data[0].decode())
+        assert {reading["yposition"] for reading in readings} == {2100, 1900}
+        assert readings[0]["timestamp"] == readings[1]["timestamp"]
@@ -1,33 +1,47 @@
-import pytest
 from .context import flux_sensors
 from flux_sensors.localizer.localizer import Localizer
 from .mock import mock_pozyx
-from flux_sensors.models import models
+from .conftest import TEST_POSITION, TEST_ANCHORS, add_test_anchors
 from pypozyx import (Coordinates)
 
-TEST_POSITION = models.Position(1000, 2000, 3000)
-
 
 class TestLocalizer(object):
 
-    @pytest.fixture
-    def pozyx_localizer(self) -> Localizer:
-        return Localizer(mock_pozyx.MockPozyx(TEST_POSITION))
-
     def test_initialization(self, pozyx_localizer: Localizer) -> None:
-        self.add_fake_anchors(pozyx_localizer)
-        pozyx_localizer.initialize()
+        assert pozyx_localizer.is_initialized()
 
     def test_measurement(self, pozyx_localizer: Localizer) -> None:
-        self.add_fake_anchors(pozyx_localizer)
-        pozyx_localizer.initialize()
         position = pozyx_localizer.do_positioning()
         assert position.get_x() == TEST_POSITION.get_x()
         assert position.get_y() == TEST_POSITION.get_y()
         assert position.get_z() == TEST_POSITION.get_z()
 
-    def add_fake_anchors(self, pozyx_localizer_instance: Localizer) -> None:
-        pozyx_localizer_instance.add_anchor_to_cache(0x6e4e, Coordinates(-100, 100, 1150))
-        pozyx_localizer_instance.add_anchor_to_cache(0x6964, Coordinates(8450, 1200, 2150))
-        pozyx_localizer_instance.add_anchor_to_cache(0x6e5f, Coordinates(1250, 12000, 1150))
-        pozyx_localizer_instance.add_anchor_to_cache(0x6e62, Coordinates(7350, 11660, 1590))
+    def test_reinitialization_with_same_anchors_skips_configuration(self, pozyx: mock_pozyx.MockPozyx,
+                                                                     pozyx_localizer: Localizer) -> None:
+        write_count = pozyx.device_list_write_count
+        positioning_count = pozyx.positioning_count
+
+        pozyx_localizer.clear()
+        add_test_anchors(pozyx_localizer)
+        pozyx_localizer.initialize()
+        assert pozyx_localizer.is_initialized()
+        assert pozyx.device_list_write_count == write_count
+        assert pozyx.positioning_count == positioning_count
+
+    def test_reinitialization_adds_new_anchors_only(self, pozyx: mock_pozyx.MockPozyx,
+                                                    pozyx_localizer: Localizer) -> None:
+        write_count = pozyx.device_list_write_count
+
+        pozyx_localizer.add_anchor_to_cache(0x6e63, Coordinates(4000, 6000, 2000))
+        pozyx_localizer.initialize()
+        assert pozyx.device_list_write_count == write_count + 1
+        assert len(pozyx_localizer.read_anchors_from_device()) == len(TEST_ANCHORS) + 1
+
+    def test_reinitialization_rewrites_moved_anchors(self, pozyx_localizer: Localizer) -> None:
+        pozyx_localizer.clear()
+        for anchor_id, coordinates in TEST_ANCHORS.items():
+            if anchor_id == 0x6e4e:
+                coordinates = Coordinates(0, 0, 1150)
+            pozyx_localizer.add_anchor_to_cache(anchor_id, coordinates)
+        pozyx_localizer.initialize()
+        assert pozyx_localizer.read_anchors_from_device()[0x6e4e] == (0, 0, 1150)
@@ -0,0 +1,112 @@
+import pytest
+import json
+import time
+from .context import flux_sensors
+from flux_sensors.measurement_pipeline import MeasurementPipeline, BatchAssembler, create_readings
+from flux_sensors.batch_policy import BatchPolicy
+from flux_sensors.localizer.localizer import Localizer
+from flux_sensors.light_sensor.light_sensor import LightSensor
+from flux_sensors.models import models
+from flux_sensors.reading_spool import ReadingSpool
+from flux_sensors.metrics import Metrics
+from flux_sensors.reading_encoder import ReadingEncoder, CONTENT_ENCODING_GZIP, decompress
+from .mock import mock_i2c_bus, mock_flux_server
+from .mock.latency_model import LatencyModel
+from .conftest import TEST_POSITION, create_ams_register
+
+
+class TestMeasurementPipeline(object):
+
+    def test_stops_when_measurement_is_stopped_by_server(self, pozyx_localizer: Localizer,
+                                                          ams_light_sensor: LightSensor) -> None:
+        flux_server = mock_flux_server.MockFluxServer([200, 200, 404])
+        MeasurementPipeline(pozyx_localizer, ams_light_sensor, flux_server, 5).run()
+
+        assert len(flux_server.sent_data) == 3
+        for json_data in flux_server.sent_data:
+            readings = json.loads(json_data.decode())
+            assert len(readings) >= 1
+            assert readings[0]["xposition"] == TEST_POSITION.get_x()
+
+    def test_resends_batch_after_login(self, pozyx_localizer: Localizer, ams_light_sensor: LightSensor) -> None:
+        flux_server = mock_flux_server.MockFluxServer([401, 200, 500])
+        MeasurementPipeline(pozyx_localizer, ams_light_sensor, flux_server, 5).run()
+
+        assert flux_server.login_count == 1
+        assert flux_server.sent_data[0] == flux_server.sent_data[1]
+
+    def test_records_metrics(self, pozyx_localizer: Localizer, ams_light_sensor: LightSensor) -> None:
+        metrics = Metrics()
+        flux_server = mock_flux_server.MockFluxServer([401, 200, 200, 404])
+        MeasurementPipeline(pozyx_localizer, ams_light_sensor, flux_server, 5, metrics=metrics).run()
+
+        first_batch_size = len(json.loads(flux_server.sent_data[0].decode()))
+        second_batch_size = len(json.loads(flux_server.sent_data[2].decode()))
+        assert metrics.readings_retried.get_value() == first_batch_size
+        assert metrics.readings_sent.get_value() == first_batch_size + second_batch_size
+        assert metrics.readings_taken.get_value() >= metrics.readings_sent.get_value()
+        assert metrics.positioning_seconds.get_count() > 0
+        assert metrics.light_sample_seconds.get_count() > 0
+        assert metrics.encode_seconds.get_count() == metrics.batch_size.get_count() >= 3
+
+    def test_falls_back_to_plain_json(self, pozyx_localizer: Localizer, ams_light_sensor: LightSensor) -> None:
+        flux_server = mock_flux_server.MockFluxServer([400, 200, 404])
+        MeasurementPipeline(pozyx_localizer, ams_light_sensor, flux_server, 5,
+                            encoder=ReadingEncoder(CONTENT_ENCODING_GZIP)).run()
+
+        assert flux_server.sent_headers[0]["Content-Encoding"] == CONTENT_ENCODING_GZIP
+        assert "Content-Encoding" not in flux_server.sent_headers[1]
+        assert json.loads(flux_server.sent_data[1].decode()) == json.loads(
+            decompress(flux_server.sent_data[0], CONTENT_ENCODING_GZIP).decode())
+        assert "Content-Encoding" not in flux_server.sent_headers[2]
+
+    def test_continues_after_i2c_errors(self, pozyx_localizer: Localizer) -> None:
+        latency_model = LatencyModel(seed=1)
+        light_sensor = LightSensor(0x39, mock_i2c_bus.MockI2CBus(create_ams_register(), latency_model))
+        light_sensor.initialize()
+        latency_model.set_error_rate(0.3)
+        flux_server = mock_flux_server.MockFluxServer([200, 200, 404])
+        MeasurementPipeline(pozyx_localizer, light_sensor, flux_server, 5).run()
+
+        assert latency_model.error_count > 0
+        assert len(flux_server.sent_data) == 3
+
+    def test_replays_spooled_readings(self, pozyx_localizer: Localizer, ams_light_sensor: LightSensor,
+                                      tmpdir) -> None:
+        spool = ReadingSpool(str(tmpdir))
+        spool.open()
+        spool.append(999, 1, 2, 3, 1526000000)
+        flux_server = mock_flux_server.MockFluxServer([200, 200, 200, 404])
+        MeasurementPipeline(pozyx_localizer, ams_light_sensor, flux_server, 5, spool=spool).run()
+
+        sent_lux_values = [reading["luxValue"] for json_data in flux_server.sent_data
+                           for reading in json.loads(json_data.decode())]
+        assert 999 in sent_lux_values
+        assert spool.get_unacknowledged_range(0, 1, 1) is None
+        assert spool.get_end_index() >= len(sent_lux_values)
+        spool.close()
+
+
+def test_batch_assembler_acknowledges_accepted_batches(tmpdir) -> None:
+    spool = ReadingSpool(str(tmpdir))
+    spool.open()
+    batch_assembler = BatchAssembler(BatchPolicy(), ReadingEncoder(), spool)
+    batch_assembler.reset()
+    batch_assembler.add((100, 1, 2, 3, 1526000000, models.NO_POSITION_UNCERTAINTY, models.NO_TAG_ID))
+    batch_assembler.add((200, 1, 2, 3, 1526000001, models.NO_POSITION_UNCERTAINTY, models.NO_TAG_ID))
+
+    data, content_encoding, batch_size, spool_range = batch_assembler.take_batch()
+    assert [reading["luxValue"] for reading in json.loads(data.decode())] == [100, 200]
+    assert batch_size == 2
+    assert spool_range == (0, 2)
+    assert batch_assembler.take_replay_batch() is None  # Only the readings spooled before the start are replayed.
+    batch_assembler.record_upload(len(data), 0.01, batch_size, spool_range)
+    assert spool.get_unacknowledged_range(0, 2, 2) is None
+    spool.close()
+
+
+def test_readings_are_stamped_with_wall_clock_time() -> None:
+    readings = create_readings([(100, models.Position(10, 20, 30))], TEST_POSITION, time.monotonic() - 1.0,
+                               models.NO_TAG_ID, 0, Metrics())
+    assert readings[0][:4] == (100, 1010, 2020, 3030)
+    assert abs(readings[0][4] - (time.time() - 1.0)) < 0.1
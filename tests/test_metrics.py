@@ -0,0 +1,57 @@
+import pytest
+import urllib.request
+import urllib.error
+from .context import flux_sensors
+from flux_sensors.metrics import Counter, Histogram, Metrics
+from flux_sensors.metrics_server import MetricsServer
+
+
+class TestMetrics(object):
+
+    def test_histogram_counts_values_per_bucket(self) -> None:
+        histogram = Histogram("test_seconds", "Test durations.", (0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        assert histogram.get_buckets() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+        assert histogram.get_count() == 4
+        assert histogram.get_sum() == pytest.approx(2.65)
+
+    def test_histogram_requires_ascending_buckets(self) -> None:
+        with pytest.raises(ValueError):
+            Histogram("test_seconds", "Test durations.", (1.0, 0.1))
+
+    def test_render_prometheus_text_format(self) -> None:
+        counter = Counter("test_total", "Test events.")
+        counter.inc(3)
+        histogram = Histogram("test_seconds", "Test durations.", (0.1,))
+        histogram.observe(0.5)
+
+        assert counter.render() == ["# HELP test_total Test events.", "# TYPE test_total counter", "test_total 3"]
+        assert histogram.render() == ["# HELP test_seconds Test durations.", "# TYPE test_seconds histogram",
+                                      'test_seconds_bucket{le="0.1"} 0', 'test_seconds_bucket{le="+Inf"} 1',
+                                      "test_seconds_sum 0.5", "test_seconds_count 1"]
+
+    def test_serves_metrics(self) -> None:
+        metrics = Metrics()
+        metrics.readings_sent.inc(42)
+        metrics_server = MetricsServer(metrics, 0)
+        metrics_server.start()
+        try:
+            url = "http://127.0.0.1:{}".format(metrics_server.get_port())
+            with urllib.request.urlopen(url + "/metrics") as response:
+                assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+                assert "flux_readings_sent_total 42\n" in response.read().decode()
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(url + "/other")
+        finally:
+            metrics_server.stop()
+
+    def test_records_first_reading_once(self) -> None:
+        metrics = Metrics(start_time=0.0)
+        assert "flux_time_to_first_reading_seconds NaN\n" in metrics.render()
+
+        time_to_first_reading = metrics.record_first_reading()
+        assert time_to_first_reading > 0
+        assert metrics.record_first_reading() is None
+        assert metrics.time_to_first_reading.get_value() == time_to_first_reading
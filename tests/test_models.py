@@ -0,0 +1,67 @@
+import pytest
+import json
+from .context import flux_sensors
+from flux_sensors.models import models
+
+TEST_TIME_STAMP = 1526000000.25
+
+
+def reject_json_constant(constant: str) -> None:
+    raise ValueError("Invalid JSON constant {}".format(constant))
+
+
+class TestReadingBuffer(object):
+
+    @pytest.fixture
+    def reading_buffer(self) -> models.ReadingBuffer:
+        reading_buffer = models.ReadingBuffer(capacity=2)
+        reading_buffer.append(123, 1000, 2000, 3000, TEST_TIME_STAMP)
+        reading_buffer.append(124, 1001, 2001, 3001, TEST_TIME_STAMP + 1)
+        reading_buffer.append(125, 1002, 2002, 3002, TEST_TIME_STAMP + 2, 150)
+        return reading_buffer
+
+    def test_reading_view(self, reading_buffer: models.ReadingBuffer) -> None:
+        assert len(reading_buffer) == 3
+        assert reading_buffer.get_capacity() == 4
+        reading = reading_buffer[1]
+        assert reading.luxValue == 124
+        assert reading.xposition == 1001
+        assert reading.timestamp == models.Reading(124, models.Position(0, 0, 0), TEST_TIME_STAMP + 1).timestamp
+        assert reading.position_uncertainty is None
+        assert reading_buffer[2].position_uncertainty == 150
+        assert not hasattr(reading, "__dict__")
+        with pytest.raises(IndexError):
+            reading_buffer[3]
+
+    def test_json_serialization(self, reading_buffer: models.ReadingBuffer) -> None:
+        readings = json.loads(reading_buffer.to_json())
+        assert len(readings) == 3
+        assert readings[2] == {"luxValue": 125, "xposition": 1002, "yposition": 2002, "zposition": 3002,
+                               "timestamp": reading_buffer[2].timestamp}
+
+    def test_json_serialization_keeps_integers(self, reading_buffer: models.ReadingBuffer) -> None:
+        reading_buffer.append(12.5, 1003, 2003, 3003, TEST_TIME_STAMP + 3)
+        json_data = reading_buffer.to_json()
+        assert '"luxValue":123,"xposition":1000,"yposition":2000,"zposition":3000' in json_data
+        assert '"luxValue":12.5,' in json_data
+
+    def test_json_serialization_skips_non_finite_readings(self, reading_buffer: models.ReadingBuffer) -> None:
+        reading_buffer.append(float("nan"), 1003, 2003, 3003, TEST_TIME_STAMP + 3)
+        reading_buffer.append(126, float("inf"), 2004, 3004, TEST_TIME_STAMP + 4)
+        reading_buffer.append(127, 1005, 2005, 3005, TEST_TIME_STAMP + 5)
+        # Python accepts NaN and Infinity, strict JSON parsers do not.
+        readings = json.loads(reading_buffer.to_json(), parse_constant=reject_json_constant)
+        assert [reading["luxValue"] for reading in readings] == [123, 124, 125, 127]
+
+    def test_json_serialization_of_tagged_readings(self, reading_buffer: models.ReadingBuffer) -> None:
+        reading_buffer.append(126, 1003, 2003, 3003, TEST_TIME_STAMP + 3, tag_id=0x6e30)
+        readings = json.loads(reading_buffer.to_json())
+        assert "tagId" not in readings[2]
+        assert readings[3]["tagId"] == "0x6e30"
+        assert reading_buffer[3].tag_id == 0x6e30
+
+    def test_clear_keeps_capacity(self, reading_buffer: models.ReadingBuffer) -> None:
+        reading_buffer.clear()
+        assert len(reading_buffer) == 0
+        assert reading_buffer.get_capacity() == 4
+        assert reading_buffer.to_json() == "[]"
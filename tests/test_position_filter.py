@@ -0,0 +1,41 @@
+import pytest
+from .context import flux_sensors
+from flux_sensors.models import models
+
+np = pytest.importorskip("numpy")
+from flux_sensors.localizer.position_filter import PositionFilter
+
+
+class TestPositionFilter(object):
+
+    def test_smooths_noisy_track(self) -> None:
+        random = np.random.RandomState(1)
+        time_stamps = np.arange(0, 5, 0.1)
+        track = np.stack([1000 + 500 * time_stamps, 2000 - 200 * time_stamps, np.full(len(time_stamps), 1000)], 1)
+        fixes = track + random.normal(0, 100, track.shape)
+
+        positions, uncertainties, is_accepted = PositionFilter().filter_fixes(time_stamps, fixes)
+        assert np.all(is_accepted)
+        assert uncertainties[-1] < uncertainties[0]
+        raw_error = np.abs(fixes[10:] - track[10:]).mean()
+        filtered_error = np.abs(positions[10:] - track[10:]).mean()
+        assert filtered_error < raw_error
+
+    def test_rejects_outlier(self) -> None:
+        position_filter = PositionFilter()
+        for index in range(0, 10):
+            assert position_filter.update(index * 0.1, models.Position(1000, 2000, 1000)) is not None
+
+        assert position_filter.update(1.0, models.Position(9000, 2000, 1000)) is None
+        position = position_filter.update(1.1, models.Position(1000, 2000, 1000))
+        assert position.get_x() == pytest.approx(1000, abs=10)
+        assert position.get_uncertainty() > 0
+
+    def test_restarts_after_consecutive_outliers(self) -> None:
+        position_filter = PositionFilter()
+        for index in range(0, 10):
+            position_filter.update(index * 0.1, models.Position(1000, 2000, 1000))
+        results = [position_filter.update(1 + index * 0.1, models.Position(9000, 2000, 1000)) for index in range(0, 6)]
+
+        assert results[0] is None
+        assert results[-1].get_x() == pytest.approx(9000)
@@ -0,0 +1,33 @@
+import pytest
+from .context import flux_sensors
+from flux_sensors.localizer.position_history import PositionHistory
+from flux_sensors.models import models
+
+
+class TestPositionHistory(object):
+
+    @pytest.fixture
+    def position_history(self) -> PositionHistory:
+        position_history = PositionHistory(size=3)
+        position_history.add_position(10.0, models.Position(0, 0, 0))
+        position_history.add_position(11.0, models.Position(1000, 2000, 3000))
+        return position_history
+
+    def test_interpolation(self, position_history: PositionHistory) -> None:
+        position = position_history.get_position_at(10.25)
+        assert position.get_x() == 250
+        assert position.get_y() == 500
+        assert position.get_z() == 750
+
+    def test_nearest_position_outside_of_history(self, position_history: PositionHistory) -> None:
+        assert position_history.get_position_at(9.0).get_x() == 0
+        assert position_history.get_position_at(12.0).get_x() == 1000
+
+    def test_history_size(self, position_history: PositionHistory) -> None:
+        position_history.add_position(12.0, models.Position(2000, 0, 0))
+        position_history.add_position(13.0, models.Position(3000, 0, 0))
+        assert position_history.get_position_at(10.0).get_x() == 1000
+
+    def test_wait_for_position(self, position_history: PositionHistory) -> None:
+        assert position_history.wait_for_position_after(11.0, 0)
+        assert not position_history.wait_for_position_after(11.5, 0.01)
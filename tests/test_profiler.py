@@ -0,0 +1,61 @@
+import pytest
+import os
+import signal
+import threading
+import time
+from .context import flux_sensors
+from flux_sensors.profiler import SamplingProfiler, STACKS_FILE_SUFFIX, REPORT_FILE_SUFFIX
+
+
+def busy_loop(stop_event: threading.Event) -> None:
+    while not stop_event.is_set():
+        sum(range(1000))
+
+
+class TestSamplingProfiler(object):
+
+    @pytest.fixture
+    def busy_thread(self):
+        stop_event = threading.Event()
+        thread = threading.Thread(target=busy_loop, args=(stop_event,), name="test-busy")
+        thread.start()
+        yield thread
+        stop_event.set()
+        thread.join()
+
+    def test_writes_report_of_all_threads(self, tmpdir, busy_thread: threading.Thread) -> None:
+        profiler = SamplingProfiler(str(tmpdir), duration=0.3, interval=0.01)
+        assert profiler.start()
+        assert not profiler.start()  # Only one profile at a time
+        profiler.join(5)
+
+        report_path = profiler.get_last_report_path()
+        assert report_path.endswith(REPORT_FILE_SUFFIX)
+        with open(report_path) as report_file:
+            report = report_file.read()
+        assert "Thread test-busy" in report
+        assert "test_profiler:busy_loop" in report
+        with open(report_path[:-len(REPORT_FILE_SUFFIX)] + STACKS_FILE_SUFFIX) as stacks_file:
+            busy_stacks = [line for line in stacks_file if line.startswith("test-busy;")]
+        assert len(busy_stacks) > 0
+        assert "test_profiler:busy_loop" in busy_stacks[0]
+
+    @pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="SIGUSR1 is not available on this platform")
+    def test_starts_on_signal(self, tmpdir) -> None:
+        profiler = SamplingProfiler(str(tmpdir), duration=0.1, interval=0.01)
+        previous_handler = signal.getsignal(signal.SIGUSR1)
+        try:
+            assert profiler.install_signal_handler()
+            os.kill(os.getpid(), signal.SIGUSR1)
+            time.sleep(0.05)  # The handler runs in the main thread once the signal is delivered.
+            profiler.join(5)
+        finally:
+            signal.signal(signal.SIGUSR1, previous_handler)
+        assert profiler.get_last_report_path() is not None
+        assert os.path.isfile(profiler.get_last_report_path())
+
+    def test_rejects_invalid_settings(self, tmpdir) -> None:
+        with pytest.raises(ValueError):
+            SamplingProfiler(str(tmpdir), duration=0)
+        with pytest.raises(ValueError):
+            SamplingProfiler(str(tmpdir), interval=-1)
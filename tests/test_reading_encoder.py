@@ -0,0 +1,36 @@
+import pytest
+from .context import flux_sensors
+from flux_sensors.models import models
+from flux_sensors import reading_encoder
+from flux_sensors.reading_encoder import ReadingEncoder
+
+
+class TestReadingEncoder(object):
+
+    @pytest.fixture
+    def reading_buffer(self) -> models.ReadingBuffer:
+        reading_buffer = models.ReadingBuffer()
+        for i in range(0, 100):
+            reading_buffer.append(123 + i, 1000, 2000, 3000, 1526000000 + i)
+        return reading_buffer
+
+    def test_plain_json(self, reading_buffer: models.ReadingBuffer) -> None:
+        data, content_encoding = ReadingEncoder().encode(reading_buffer)
+        assert content_encoding == reading_encoder.CONTENT_ENCODING_IDENTITY
+        assert data == reading_buffer.to_json().encode()
+
+    @pytest.mark.parametrize("compression", [reading_encoder.CONTENT_ENCODING_GZIP,
+                                             reading_encoder.CONTENT_ENCODING_DEFLATE])
+    def test_compression(self, reading_buffer: models.ReadingBuffer, compression: str) -> None:
+        encoder = ReadingEncoder(compression)
+        data, content_encoding = encoder.encode(reading_buffer)
+        assert content_encoding == compression
+        assert len(data) < len(reading_buffer.to_json())
+        assert reading_encoder.decompress(data, content_encoding) == reading_buffer.to_json().encode()
+
+        encoder.disable_compression()
+        assert encoder.encode(reading_buffer)[1] == reading_encoder.CONTENT_ENCODING_IDENTITY
+
+    def test_unknown_content_encoding(self) -> None:
+        with pytest.raises(ValueError):
+            ReadingEncoder("br")
@@ -0,0 +1,86 @@
+import pytest
+import os
+from .context import flux_sensors
+from flux_sensors.models import models
+from flux_sensors.reading_spool import ReadingSpool, RECORD_SIZE
+
+RECORDS_PER_SEGMENT = 4
+TEST_TIME_STAMP = 1526000000.5
+
+
+class TestReadingSpool(object):
+
+    @pytest.fixture
+    def spool_directory(self, tmpdir) -> str:
+        return str(tmpdir.join("spool"))
+
+    @pytest.fixture
+    def reading_spool(self, spool_directory: str) -> ReadingSpool:
+        reading_spool = ReadingSpool(spool_directory, segment_size=RECORDS_PER_SEGMENT * RECORD_SIZE,
+                                     max_size=3 * RECORDS_PER_SEGMENT * RECORD_SIZE)
+        reading_spool.open()
+        yield reading_spool
+        reading_spool.close()
+
+    def append_readings(self, reading_spool: ReadingSpool, count: int) -> None:
+        for i in range(0, count):
+            reading_spool.append(100 + i, 1000, 2000, 3000, TEST_TIME_STAMP)
+
+    def test_readings_survive_reopening(self, reading_spool: ReadingSpool, spool_directory: str) -> None:
+        self.append_readings(reading_spool, 6)
+        reading_spool.close()
+        reading_spool.open()
+
+        assert reading_spool.get_start_index() == 0
+        assert reading_spool.get_end_index() == 6
+        readings = models.ReadingBuffer()
+        reading_spool.read_into(readings, 4, 6)
+        assert [readings[0].luxValue, readings[1].luxValue] == [104, 105]
+        assert readings[0].time_stamp == int(TEST_TIME_STAMP * models.MICROSECONDS_PER_SECOND)
+
+    def test_tag_ids_are_spooled(self, reading_spool: ReadingSpool) -> None:
+        reading_spool.append(100, 1000, 2000, 3000, TEST_TIME_STAMP, tag_id=0x6e30)
+        readings = models.ReadingBuffer()
+        reading_spool.read_into(readings, 0, 1)
+        assert readings[0].tag_id == 0x6e30
+
+    def test_acknowledged_segments_are_deleted(self, reading_spool: ReadingSpool, spool_directory: str) -> None:
+        self.append_readings(reading_spool, 6)
+        reading_spool.acknowledge(1, 4)
+        assert len(os.listdir(spool_directory)) == 2
+        assert reading_spool.get_unacknowledged_range(0, 6, 10) == (0, 1)
+        assert reading_spool.get_unacknowledged_range(1, 6, 10) == (4, 6)
+
+        reading_spool.acknowledge(0, 1)
+        assert len(os.listdir(spool_directory)) == 1
+        assert reading_spool.get_start_index() == 4
+        assert reading_spool.get_unacknowledged_range(0, 6, 1) == (4, 5)
+
+    def test_oldest_segment_is_dropped_when_full(self, reading_spool: ReadingSpool, spool_directory: str) -> None:
+        self.append_readings(reading_spool, 13)
+        assert len(os.listdir(spool_directory)) == 3
+        assert reading_spool.get_start_index() == 4
+        assert reading_spool.get_end_index() == 13
+
+    def test_acknowledgements_survive_reopening(self, reading_spool: ReadingSpool) -> None:
+        self.append_readings(reading_spool, 7)
+        reading_spool.acknowledge(4, 5)
+        reading_spool.acknowledge(6, 7)  # Behind an unacknowledged reading, so not persisted
+        reading_spool.close()
+        reading_spool.open()
+
+        assert reading_spool.get_unacknowledged_range(0, 7, 10) == (0, 4)
+        assert reading_spool.get_unacknowledged_range(4, 7, 10) == (5, 7)
+
+    def test_watermark_of_deleted_segment_is_not_reused(self, reading_spool: ReadingSpool,
+                                                        spool_directory: str) -> None:
+        self.append_readings(reading_spool, 2)
+        reading_spool.acknowledge(0, 1)
+        assert sorted(os.listdir(spool_directory)) == ["0000000000000000.ack", "0000000000000000.seg"]
+        reading_spool.acknowledge(1, 2)
+        self.append_readings(reading_spool, 2)
+        reading_spool.close()
+        reading_spool.open()
+
+        assert reading_spool.get_unacknowledged_range(0, 4, 10) == (2, 4)
+
@@ -0,0 +1,41 @@
+import json
+from .context import flux_sensors
+from flux_sensors.localizer.localizer import Localizer
+from flux_sensors.localizer.tag_scheduler import Tag, TagScheduler
+from flux_sensors.light_sensor.light_sensor import LightSensor
+from flux_sensors.measurement_pipeline import MeasurementPipeline
+from .mock import mock_pozyx, mock_i2c_bus, mock_flux_server
+from .conftest import add_test_anchors, create_ams_register
+
+REMOTE_IDS = (0x6e30, 0x6e31)
+
+
+class TestTagScheduler(object):
+
+    def create_tag(self, pozyx: mock_pozyx.MockPozyx, remote_id: int, weight: int = 1) -> Tag:
+        localizer = Localizer(pozyx, remote_id=remote_id)
+        add_test_anchors(localizer)
+        localizer.initialize()
+        light_sensor = LightSensor(0x39, mock_i2c_bus.MockI2CBus(create_ams_register()))
+        light_sensor.initialize()
+        return Tag(localizer.get_network_id(), localizer, light_sensor, weight)
+
+    def test_weighted_round_robin(self, pozyx: mock_pozyx.MockPozyx) -> None:
+        tags = [self.create_tag(pozyx, REMOTE_IDS[0], 2), self.create_tag(pozyx, REMOTE_IDS[1])]
+        scheduler = TagScheduler(tags)
+        tag_ids = [scheduler.next_tag().tag_id for i in range(0, 6)]
+        assert tag_ids == [REMOTE_IDS[0], REMOTE_IDS[1], REMOTE_IDS[0]] * 2
+
+    def test_local_tag_uses_network_id(self, pozyx: mock_pozyx.MockPozyx) -> None:
+        assert self.create_tag(pozyx, None).tag_id == 0x6000
+
+    def test_readings_are_tagged(self, pozyx: mock_pozyx.MockPozyx) -> None:
+        tags = [self.create_tag(pozyx, remote_id) for remote_id in REMOTE_IDS]
+        del pozyx.positioned_remote_ids[:]
+        flux_server = mock_flux_server.MockFluxServer([200, 200, 200, 404])
+        MeasurementPipeline(None, None, flux_server, 5, tag_scheduler=TagScheduler(tags)).run()
+
+        tag_ids = {reading["tagId"] for json_data in flux_server.sent_data
+                   for reading in json.loads(json_data.decode())}
+        assert tag_ids == {"0x6e30", "0x6e31"}
+        assert set(pozyx.positioned_remote_ids) == set(REMOTE_IDS)